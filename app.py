@@ -1,16 +1,35 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash
-from flask_bcrypt import Bcrypt
-from pymongo import MongoClient
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, make_response, Response
 from config import Config
 from flask_limiter import Limiter
 from flask_wtf.csrf import CSRFProtect
 from flask_limiter.util import get_remote_address
 import consultas
-from datetime import datetime 
+import exportacion
+import respuestas
+import cache_local
+from recomendador import recomendador
+import estadisticas_mercado
+import retencion_logs
+import destacadas
+import moderacion
+import busquedas_guardadas
+import asincrono
+import limpieza
+import limites_sqlite  # registra el esquema sqlite:// en limits
+import contrasenas
+import favoritos
+import contadores
+import visitas
+import arranque
+import conexiones
+from perfilador import perfilador, init_perfilador, flamegraph_svg, a_folded
+from autocompletado import indice_autocompletado
+from datetime import datetime, timedelta
 from forms import PublicacionForm, PerfilForm, RegistroForm
 import re
 from flask_talisman import Talisman
 from bson.objectid import ObjectId
+from pymongo.errors import DuplicateKeyError
 from app_publicaciones import publicaciones_bp
 import cloudinary
 import cloudinary.uploader
@@ -21,9 +40,12 @@ app = Flask(__name__, template_folder="src/templates", static_folder="src/static
 app.config.from_object(Config)
 app.register_blueprint(publicaciones_bp)
 
+# Los contadores viven en SQLite (WAL) para que todos los workers del host los compartan
 limiter = Limiter(
     get_remote_address, 
-    app=app
+    app=app,
+    storage_uri=app.config["RATELIMIT_STORAGE_URI"],
+    strategy=app.config["RATELIMIT_STRATEGY"]
 )
 
 csp = {
@@ -47,28 +69,62 @@ csp = {
 entorno_produccion = os.environ.get('FLASK_ENV') == 'production'
 
 # 3. Inicializamos Talisman con la variable dinámica
-Talisman(app, content_security_policy=csp, force_https=entorno_produccion)
+talisman = Talisman(app, content_security_policy=csp, force_https=entorno_produccion)
+
+# bcrypt corre en un pool de procesos acotado, no en el hilo de la petición
+servicio_contrasenas = contrasenas.ServicioContrasenas(
+    procesos=app.config["HASH_PROCESOS"],
+    maximo_en_cola=app.config["HASH_MAXIMO_EN_COLA"],
+    costo=app.config["BCRYPT_COSTO"],
+    objetivo_ms=app.config["HASH_OBJETIVO_MS"]
+)
+
+@app.errorhandler(contrasenas.ServicioSaturado)
+def servicio_saturado(e):
+    # Rechazo rápido: el usuario reintenta en unos segundos en lugar de esperar en cola
+    flash("Hay muchas solicitudes en este momento. Intenta de nuevo en unos segundos.", "error")
+    return redirect(request.referrer or url_for("home"))
 
-bcrypt = Bcrypt(app)
+# Compresión gzip/brotli de las respuestas HTML (ver respuestas.py)
+respuestas.init_compresion(app)
+
+# Perfilado por muestreo de las peticiones elegidas desde /admin/perfilador (ver perfilador.py)
+init_perfilador(app)
 
 csrf = CSRFProtect(app)
 
-# Conexión a MongoDB
-client = MongoClient(app.config["MONGODB_URI"])
-db = client["HomiDB"]
+# Conexión a MongoDB (se conecta con la primera consulta, ya en el worker; ver conexiones.py)
+client = conexiones.client
+db = conexiones.db
 usuarios = db["usuarios"]
 propiedades = db["propiedades"]
 logs_col = db["log_audotoria"]
 resenas = db["resenas"]
 mongo = db
 
-# --- CONFIGURACIÓN CLOUDINARY ---
-cloudinary.config(
-    cloud_name = app.config["CLOUDINARY_CLOUD_NAME"],
-    api_key = app.config["CLOUDINARY_API_KEY"],
-    api_secret = app.config["CLOUDINARY_API_SECRET"],
-    secure = True
-)
+# Verificar índices, hilos de fondo y cachés calientes: una vez por worker, tras el fork
+# (gunicorn.conf.py lo hace antes de aceptar peticiones; si no, la primera petición)
+@app.before_request
+def iniciar_proceso():
+    arranque.asegurar_iniciado(db)
+
+# Readiness para el balanceador: 503 hasta que el worker terminó de arrancar
+@app.route("/salud/listo")
+@talisman(force_https=False)
+def salud_listo():
+    if not arranque.esta_listo():
+        # Sin esperar: si otro hilo está arrancando el worker, se responde con el estado actual
+        arranque.iniciar_worker(db, esperar=False)
+    response = jsonify(arranque.estado())
+    response.status_code = 200 if arranque.esta_listo() else 503
+    response.cache_control.no_store = True
+    return response
+
+# Modo de lectura asíncrono opcional: None si está apagado
+def lector_asincrono():
+    if not app.config.get("MONGO_ASINCRONO"):
+        return None
+    return asincrono.lector(app.config["MONGODB_URI"])
 
 # --- FUNCIÓN DE AYUDA PARA VALIDAR CONTRASEÑA ---
 def validar_contrasena_segura(password):
@@ -87,11 +143,11 @@ def validar_contrasena_segura(password):
 
 @app.route("/")
 def home():
-    # Obtener hasta 9 propiedades para llenar el grid y el carrusel
-    propiedades_destacadas = consultas.obtener_propiedades_destacadas(mongo, limite=9)
+    # Hasta 9 propiedades para el grid y el carrusel, de la rotación de destacadas en memoria
+    propiedades_destacadas = destacadas.rotacion_destacadas.pagina_actual(mongo, limite=9)
 
     # Colonias dinámicas desde MongoDB (solo Acapulco)
-    colonias = propiedades.distinct("colonia", {"ciudad": "Acapulco"})
+    colonias = propiedades.distinct("colonia", {**consultas.FILTRO_PUBLICO, "ciudad": "Acapulco"})
     colonias = sorted([c for c in colonias if c])
 
     return render_template(
@@ -105,74 +161,38 @@ def home():
 @app.route("/buscar")
 def buscar():
 
-    categoria = request.args.get("categoria", "").lower()
-    localizacion = request.args.get("localizacion", "")
-    keyword = request.args.get("keyword", "")
-    operacion = request.args.get("operacion", "").lower()
-    extra = request.args.get("extra", "")
-
-    # Filtro base: solo Acapulco
-    filtro = {
-        "ciudad": "Acapulco"
-    }
+    # Criterios y filtro (el mismo constructor que usan las búsquedas guardadas)
+    criterios = consultas.criterios_busqueda(request.args)
+    filtro = consultas.filtro_busqueda(criterios)
 
-    # Venta / Renta
-    if operacion:
-        filtro["tipo_operacion"] = operacion
+    filtro_colonias = {**consultas.FILTRO_PUBLICO, "ciudad": consultas.CIUDAD_BUSQUEDA}
+    lector = lector_asincrono()
+    if lector:
+        # Total y colonias a la vez con el driver asíncrono
+        total_resultados, colonias = asincrono.cargar_busqueda(lector, filtro, filtro_colonias)
+    else:
+        total_resultados = propiedades.count_documents(filtro)
+        colonias = propiedades.distinct("colonia", filtro_colonias)
 
-    # Categoría
-    if categoria:
-        filtro["tipo_propiedad"] = categoria
+    # Los resultados se envían en streaming directo del cursor (ver respuestas.py),
+    # así la memoria no crece con búsquedas muy amplias
+    cursor = propiedades.find(filtro, consultas.PROYECCION_TARJETA).batch_size(50)
 
-    # Más propiedades (solo si NO hay categoría)
-    if extra == "mas" and not categoria:
-        filtro["tipo_propiedad"] = {
-            "$in": ["condominio", "local", "terreno"]
-        }
+    # Si no hay imagen, le ponemos una por defecto
+    imagen_defecto = url_for('static', filename='images/product/l-product-1.jpg')
 
-    # Colonia
-    if localizacion:
-        filtro["colonia"] = {"$regex": f"^{localizacion}$", "$options": "i"}
-
-    # Keyword (titulo o descripcion)
-    if keyword:
-        filtro["$or"] = [
-            {"titulo": {"$regex": keyword, "$options": "i"}},
-            {"descripcion": {"$regex": keyword, "$options": "i"}}
-        ]
-
-    resultados = list(propiedades.find(filtro))
-
-    # --- AGREGA ESTE BLOQUE PARA LAS IMÁGENES ---
-    for p in resultados:
-        imagen_principal = ""
-        if "imagenes" in p and len(p["imagenes"]) > 0:
-            primera_img = p["imagenes"][0]
-            # Verificamos si la imagen se guardó como diccionario o como texto (URL directa)
-            if isinstance(primera_img, dict):
-                imagen_principal = primera_img.get("url_imagen", "")
-            else:
-                imagen_principal = primera_img
-        
-        # Si no hay imagen, le ponemos una por defecto
-        p["imagen_principal_url"] = imagen_principal if imagen_principal else url_for('static', filename='images/product/l-product-1.jpg')
-    # ---------------------------------------------
-
-    # Colonias dinámicas
-    colonias = propiedades.distinct(
-        "colonia",
-        {"ciudad": "Acapulco"}
-    )
+    # Contexto de mercado cuando el filtro corresponde a un solo grupo
+    mercado = None
+    if criterios["localizacion"] and criterios["categoria"] and criterios["operacion"]:
+        mercado = estadisticas_mercado.obtener(mongo, criterios["localizacion"], criterios["categoria"], criterios["operacion"])
 
-    return render_template(
+    return respuestas.transmitir_plantilla(
         "resultados.html",
-        resultados=resultados,
+        resultados=consultas.con_imagen_principal(cursor, imagen_defecto),
+        total_resultados=total_resultados,
+        mercado=mercado,
         colonias=sorted(colonias),
-        categoria=categoria,
-        localizacion=localizacion,
-        keyword=keyword,
-        operacion=operacion,
-        extra=extra
+        **criterios
     )
 
 
@@ -216,7 +236,7 @@ def registro():
                 return render_template("registro.html", form=form)
 
         # Hash de contraseña
-        hashed_password = bcrypt.generate_password_hash(data["contrasena"]).decode("utf-8")
+        hashed_password = servicio_contrasenas.generar(data["contrasena"])
 
         nuevo_usuario = {
             "nombre": form.nombre.data,
@@ -229,7 +249,12 @@ def registro():
             "estado": "activo"
         }
 
-        result = db.usuarios.insert_one(nuevo_usuario)
+        try:
+            result = db.usuarios.insert_one(nuevo_usuario)
+        except DuplicateKeyError:
+            # El índice único de correo atrapa registros simultáneos con el mismo correo
+            flash("El correo electrónico ya está registrado.", "error")
+            return redirect(url_for("registro"))
         flash("Registro exitoso. Ahora puedes iniciar sesión.", "success")
         return redirect(url_for("index"))
 
@@ -257,7 +282,7 @@ def registro_proveedor():
         if "usuario_id" in session:
             # Buscamos los datos frescos de la BD
             import consultas # Asegúrate de tener esto o usar mongo directamente
-            usuario_db = usuarios.find_one({"_id": ObjectId(session["usuario_id"])}) if "usuario_id" in session else None
+            usuario_db = usuarios.find_one({"_id": ObjectId(session["usuario_id"])}, {"favoritos": 0}) if "usuario_id" in session else None
             if usuario_db:
                 datos_usuario = usuario_db
         
@@ -281,7 +306,7 @@ def registro_proveedor():
             return render_template('registro_proveedor.html', user=data)
 
         # 1. Buscar si el usuario ya existe
-        usuario_existente = usuarios.find_one({"correo_electronico": correo})
+        usuario_existente = usuarios.find_one({"correo_electronico": correo}, {"favoritos": 0})
 
         datos_extra = {
             "telefono": data.get("telefono"),
@@ -307,6 +332,7 @@ def registro_proveedor():
                     }
                 }
             )
+            cache_local.propietarios.invalidar(usuario_id)
             registrar_movimiento(
                 usuario_id, 
                 "CAMBIO_ROL", 
@@ -321,7 +347,7 @@ def registro_proveedor():
             return redirect(url_for("home"))
         else:
             # Nuevo usuario, crear cuenta de proveedor
-            hashed_password = bcrypt.generate_password_hash(contrasena).decode("utf-8")
+            hashed_password = servicio_contrasenas.generar(contrasena)
 
             nuevo_usuario = {
                 "nombre": data.get("nombre", ""),
@@ -334,7 +360,11 @@ def registro_proveedor():
                 **datos_extra
             }
 
-            resultado = usuarios.insert_one(nuevo_usuario)
+            try:
+                resultado = usuarios.insert_one(nuevo_usuario)
+            except DuplicateKeyError:
+                flash("El correo electrónico ya está registrado.", "error")
+                return render_template('registro_proveedor.html', user=data)
             usuario_id = resultado.inserted_id
 
             registrar_movimiento(
@@ -357,56 +387,77 @@ def registro_proveedor():
 def detalle_propiedad(id_propiedad):
     try:
         # 1. Buscar la propiedad
-        propiedades.update_one({"_id": ObjectId(id_propiedad)}, {"$inc": {"visitas": 1}})
-        prop = propiedades.find_one({"_id": ObjectId(id_propiedad)})
-        if not prop:
+        id_propiedad_obj = consultas.a_object_id(id_propiedad)
+        # Versión de la página (campos pequeños, sin el documento completo)
+        version = propiedades.find_one(
+            {"_id": id_propiedad_obj},
+            {**consultas.CAMPOS_VERSION, **estadisticas_mercado.CAMPOS_GRUPO, "estado_publicacion": 1, "id_propietario": 1}
+        )
+        if not version:
+            flash("La propiedad no existe o fue eliminada.", "error")
+            return redirect(url_for('home'))
+        # Sin aprobar (o rechazada): solo la ven su dueño y los admins
+        if not consultas.es_publica(version) and session.get('rol') != 'admin' \
+                and str(version.get("id_propietario")) != session.get('usuario_id'):
             flash("La propiedad no existe o fue eliminada.", "error")
             return redirect(url_for('home'))
 
-        # 2. Buscar al propietario
-        propietario = usuarios.find_one({"_id": prop.get("id_propietario")})
-        
-        # 3. Preparar datos seguros para mostrar
-        datos_propietario = {}
-        if propietario:
-            datos_propietario = {
-                "nombre": f"{propietario.get('nombre', 'Anfitrión')} {propietario.get('primer_apellido', '')}",
-                "nombre_raw": propietario.get("nombre", "U"), # Para sacar la letra inicial
-                "telefono": propietario.get("telefono", "No disponible"),
-                "correo": propietario.get("correo_electronico", ""),
-                "fecha_registro": propietario.get("_id").generation_time.strftime('%Y'),
-                "foto": propietario.get("foto_perfil", ""), # Obtiene la URL de Cloudinary si existe
-                "url_facebook": propietario.get("url_facebook", ""),
-                "url_instagram": propietario.get("url_instagram", ""),
-                "url_whatsapp": propietario.get("url_whatsapp", "")
-            }
+        # Visitantes anónimos: si ya tienen esta versión, respondemos 304 sin armar la página
+        compartible = respuestas.es_pagina_compartible()
+        # Precio por m² comparado con la mediana de su colonia (documento precalculado):
+        # la insignia va en la página, así que su fecha de cálculo entra en la versión
+        estadistica = estadisticas_mercado.obtener(mongo, version.get("colonia"), version.get("tipo_propiedad"), version.get("tipo_operacion"))
+        etag, ultima_modificacion = consultas.version_propiedad(version, (estadistica or {}).get("fecha_calculo"))
+        if compartible:
+            no_modificada = respuestas.respuesta_no_modificada(etag, ultima_modificacion)
+            if no_modificada is not None:
+                return no_modificada
+
+        # La visita se suma en memoria y se guarda por lotes con su día (ver visitas.py).
+        # Solo cuenta la página que se entrega: un 304 no es una visita (puede ser una cache
+        # compartida revalidando), igual que las que sirve una cache sin llegar aquí
+        visitas.contador_visitas.registrar(id_propiedad_obj, version.get("id_propietario"))
+
+        # Cache del worker: si otro worker editó la propiedad (o recibió una reseña), su versión ya no coincide
+        prop = cache_local.propiedades.obtener(id_propiedad_obj)
+        id_propietario = version.get("id_propietario")
+        if prop is not None and consultas.marca_version(prop) != consultas.marca_version(version):
+            prop = None
+            # La nueva versión puede venir de un cambio del propietario hecho en otro worker
+            cache_local.propietarios.invalidar(id_propietario)
+        # Tarjeta del propietario (cambia muy poco, también se cachea)
+        datos_propietario = cache_local.propietarios.obtener(id_propietario)
+
+        # 2. Propiedad, propietario y reseñas: a la vez en modo asíncrono, una tras otra si no
+        lector = lector_asincrono()
+        if lector:
+            prop_leida, tarjeta_leida, (lista_resenas, autores) = asincrono.cargar_detalle(
+                lector, id_propiedad_obj, id_propietario, prop, datos_propietario)
         else:
-            datos_propietario = {
-                "nombre": "Usuario Desconocido",
-                "nombre_raw": "U",
-                "telefono": "---",
-                "foto": ""
-            }
+            prop_leida = prop if prop is not None else propiedades.find_one({"_id": id_propiedad_obj})
+            tarjeta_leida = datos_propietario if datos_propietario is not None else consultas.tarjeta_propietario(mongo, id_propietario)
+            # LEER RESEÑAS DESDE LA COLECCIÓN INDEPENDIENTE (autores con un solo $in)
+            lista_resenas = list(consultas.resenas_de_propiedades(mongo, [id_propiedad_obj]))
+            ids_autores = list({c["id_usuario"] for c in lista_resenas if c.get("id_usuario")})
+            autores = {u["_id"]: u for u in usuarios.find({"_id": {"$in": ids_autores}}, consultas.PROYECCION_AUTOR)} if ids_autores else {}
+
+        if prop is None:
+            prop = prop_leida
+            cache_local.propiedades.guardar(id_propiedad_obj, prop)
+        if not prop:
+            flash("La propiedad no existe o fue eliminada.", "error")
+            return redirect(url_for('home'))
+        if datos_propietario is None:
+            datos_propietario = tarjeta_leida
+            cache_local.propietarios.guardar(id_propietario, datos_propietario)
 
-        # LEER RESEÑAS DESDE LA COLECCIÓN INDEPENDIENTE ---
-        comentarios_cursor = resenas.find({
-            "$and": [
-                {"$or": [
-                    {"id_propiedad": str(id_propiedad)}, 
-                    {"id_propiedad": ObjectId(id_propiedad)}
-                ]},
-                {"esta_eliminado": {"$ne": True}}
-            ]
-        }).sort("fecha_resena", -1) # Ordenamos por la fecha correcta
-        
         comentarios = []
         suma_calificaciones = 0
         total_calificaciones = 0
         
-        for c in comentarios_cursor:
-            # Buscamos el nombre del usuario que hizo esta reseña
-            usr = usuarios.find_one({"_id": c["id_usuario"]})
-            nombre_usr = f"{usr.get('nombre', 'Usuario')} {usr.get('primer_apellido', '')}" if usr else "Usuario Anónimo"
+        for c in lista_resenas:
+            # Nombre del usuario que hizo esta reseña
+            nombre_usr = consultas.nombre_de_autor(autores.get(c.get("id_usuario")))
             
             # Formateamos los datos para que el HTML los entienda como antes
             comentarios.append({
@@ -423,20 +474,24 @@ def detalle_propiedad(id_propiedad):
         # Calcular promedio global
         promedio_calificacion = (suma_calificaciones / total_calificaciones) if total_calificaciones > 0 else 0
         
-        # 4. Comprobar si está en favoritos del usuario actual
-        es_favorito = False
-        if "usuario_id" in session:
-            usuario_actual = usuarios.find_one({"_id": ObjectId(session["usuario_id"])})
-            if usuario_actual and id_propiedad in usuario_actual.get("favoritos", []):
-                es_favorito = True
+        insignia_mercado = estadisticas_mercado.insignia_precio(prop, estadistica)
 
-        return render_template("detalle_propiedad.html", 
+        # 4. El corazón de favoritos (/api/favorito/<id>) y las propiedades similares
+        #    (/api/similares/<id>) se cargan aparte: así la página es la misma para
+        #    todos y su ETag solo depende de la propiedad
+        response = make_response(render_template("detalle_propiedad.html", 
                                prop=prop, 
                                propietario=datos_propietario,
                                comentarios=comentarios,
                                promedio_calificacion=round(promedio_calificacion, 1),
                                total_calificaciones=total_calificaciones,
-                               es_favorito=es_favorito)
+                               insignia_mercado=insignia_mercado))
+        if compartible:
+            respuestas.cache_compartida(response, etag, ultima_modificacion)
+        else:
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+        return response
 
     except Exception as e:
         print(f"Error cargando propiedad: {e}")
@@ -450,7 +505,8 @@ def perfil():
 
     usuario_id_str = session["usuario_id"]
     usuario_id_obj = ObjectId(usuario_id_str)
-    usuario = usuarios.find_one({"_id": usuario_id_obj})
+    # Sin el arreglo de favoritos: puede tener miles de ids (ver favoritos.py)
+    usuario = usuarios.find_one({"_id": usuario_id_obj}, {"favoritos": 0})
 
     if not usuario:
         session.clear()
@@ -479,12 +535,14 @@ def perfil():
                 })
 
             usuarios.update_one({"_id": usuario_id_obj}, {"$set": datos_actualizar})
+            # La tarjeta del propietario aparece en sus páginas de detalle
+            consultas.tocar_propiedades_de(mongo, usuario_id_obj)
             flash("Datos actualizados correctamente.", "success")
             return redirect(url_for("perfil"))
 
         elif tipo_form == "sensible":
             pass_actual = request.form.get("contrasena_actual")
-            if not bcrypt.check_password_hash(usuario["contrasena"], pass_actual):
+            if not servicio_contrasenas.verificar(usuario["contrasena"], pass_actual):
                 flash("Contraseña actual incorrecta.", "error")
                 return redirect(url_for("perfil"))
             
@@ -495,10 +553,13 @@ def perfil():
             if nuevo_correo and nuevo_correo != usuario.get("correo_electronico"):
                 updates["correo_electronico"] = nuevo_correo
             if nueva_pass:
-                updates["contrasena"] = bcrypt.generate_password_hash(nueva_pass).decode('utf-8')
+                updates["contrasena"] = servicio_contrasenas.generar(nueva_pass)
             
             if updates:
                 usuarios.update_one({"_id": usuario_id_obj}, {"$set": updates})
+                if "correo_electronico" in updates:
+                    # El correo aparece en la tarjeta del propietario
+                    consultas.tocar_propiedades_de(mongo, usuario_id_obj)
                 flash("Seguridad actualizada.", "success")
             return redirect(url_for("perfil"))
         
@@ -517,6 +578,7 @@ def perfil():
                         
                         # Guardar la URL en el usuario
                         usuarios.update_one({"_id": usuario_id_obj}, {"$set": {"foto_perfil": url_foto}})
+                        consultas.tocar_propiedades_de(mongo, usuario_id_obj)
                         flash("Foto de perfil actualizada con éxito.", "success")
                     except Exception as e:
                         print(f"Error subiendo foto de perfil: {e}")
@@ -524,37 +586,46 @@ def perfil():
                         
             return redirect(url_for("perfil"))
 
-    # 2. Buscar Publicaciones del Proveedor 
-    mis_publicaciones = []
-    if usuario.get("rol") == "proveedor":
-        # Buscamos tanto por String como por ObjectId para asegurar que encuentre las publicaciones
-        mis_publicaciones = list(propiedades.find({
-            "$or": [
-                {"id_propietario": usuario_id_str},
-                {"id_propietario": usuario_id_obj}
-            ]
-        }))
-        for p in mis_publicaciones:
-            imagen_principal = ""
-            if "imagenes" in p and len(p["imagenes"]) > 0:
-                primera_img = p["imagenes"][0]
-                imagen_principal = primera_img.get("url_imagen", "") if isinstance(primera_img, dict) else primera_img
-            p["imagen_principal_url"] = imagen_principal
-
-    # 3. Buscar Favoritos
-    mis_favoritos = []
-    favoritos_ids_str = usuario.get("favoritos", [])
-    if favoritos_ids_str:
-        favoritos_ids = [ObjectId(fid) for fid in favoritos_ids_str if ObjectId.is_valid(fid)]
-        mis_favoritos = list(propiedades.find({"_id": {"$in": favoritos_ids}}))
-        for p in mis_favoritos:
-            imagen_principal = ""
-            if "imagenes" in p and len(p["imagenes"]) > 0:
-                primera_img = p["imagenes"][0]
-                imagen_principal = primera_img.get("url_imagen", "") if isinstance(primera_img, dict) else primera_img
-            p["imagen_principal_url"] = imagen_principal
-
-    return render_template("perfil.html", usuario=usuario, mis_publicaciones=mis_publicaciones, mis_favoritos=mis_favoritos)
+    # 2. Publicaciones y favoritos se cargan por página desde /api/perfil/*;
+    # aquí solo los totales, que vienen en el mismo documento del usuario
+    totales = contadores.de_usuario(mongo, usuario)
+
+    return render_template("perfil.html", usuario=usuario,
+                           total_publicaciones=totales["total_publicaciones"],
+                           total_favoritos=totales["total_favoritos"])
+
+CAMPOS_TARJETA_PERFIL = ("titulo", "colonia", "precio", "imagen_principal_url", "estado_publicacion")
+
+def tarjetas_perfil(propiedades, siguiente):
+    response = jsonify({
+        "propiedades": [{"_id": str(p["_id"]), **{c: p.get(c) for c in CAMPOS_TARJETA_PERFIL}} for p in propiedades],
+        "siguiente": None if siguiente is None else str(siguiente)
+    })
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+# Publicaciones del perfil, por páginas (cursor: _id de la última tarjeta)
+@app.route("/api/perfil/publicaciones")
+def perfil_publicaciones():
+    if "usuario_id" not in session:
+        return jsonify({"error": "No autorizado"}), 401
+    despues = request.args.get("despues", "")
+    despues = ObjectId(despues) if ObjectId.is_valid(despues) else None
+    propiedades_pagina, siguiente = consultas.pagina_de_propietario(mongo, ObjectId(session["usuario_id"]), despues)
+    return tarjetas_perfil(propiedades_pagina, siguiente)
+
+# Favoritos del perfil, por páginas (cursor: posición en el arreglo de favoritos)
+@app.route("/api/perfil/favoritos")
+def perfil_favoritos():
+    if "usuario_id" not in session:
+        return jsonify({"error": "No autorizado"}), 401
+    inicio = request.args.get("desde", 0, type=int) or 0
+    propiedades_pagina, siguiente = favoritos.desde(mongo, ObjectId(session["usuario_id"]), inicio)
+    return tarjetas_perfil(propiedades_pagina, siguiente)
+
+# Movimientos que muestra el dashboard; el historial completo está en /admin/bitacora
+MOVIMIENTOS_DASHBOARD = 200
 
 @app.route('/admin_dashboard')
 def admin_dashboard():
@@ -563,24 +634,168 @@ def admin_dashboard():
         flash("Acceso denegado.", "error")
         return redirect(url_for('home'))
 
-    # Pipeline para obtener los movimientos (Igual que tenías)
+    # Pipeline para obtener los movimientos: primero los más recientes (índice fecha_evento)
+    # y el $lookup solo sobre esos. Lo más antiguo se consulta en /admin/bitacora
     pipeline = [
+        { "$sort": { "fecha_evento": -1 } },
+        { "$limit": MOVIMIENTOS_DASHBOARD },
         {
             "$lookup": {
-                "from": "Usuarios",
+                "from": "usuarios",
                 "localField": "id_usuario",
                 "foreignField": "_id",
                 "as": "usuario_info"
             }
         },
-        { "$unwind": { "path": "$usuario_info", "preserveNullAndEmptyArrays": True } },
-        { "$sort": { "fecha_evento": -1 } }
+        { "$unwind": { "path": "$usuario_info", "preserveNullAndEmptyArrays": True } }
     ]
 
     movimientos = list(logs_col.aggregate(pipeline))
 
     # CAMBIO IMPORTANTE: Renderizamos index.html activando el modo admin
-    return render_template('index.html', movimientos=movimientos, mostrar_admin=True)
+    return render_template('index.html', movimientos=movimientos, mostrar_admin=True, limite_movimientos=MOVIMIENTOS_DASHBOARD)
+
+# Bitácora por rango de fechas, incluyendo los días ya archivados (JSONL en GridFS)
+@app.route('/admin/bitacora')
+def admin_bitacora():
+    if 'usuario_id' not in session or session.get('rol') != 'admin':
+        return jsonify({"error": "Acceso denegado"}), 403
+    try:
+        hasta = datetime.strptime(request.args['hasta'], "%Y-%m-%d") if request.args.get('hasta') else datetime.utcnow()
+        desde = datetime.strptime(request.args['desde'], "%Y-%m-%d") if request.args.get('desde') else hasta - timedelta(days=30)
+        id_usuario = consultas.a_object_id(request.args['id_usuario']) if request.args.get('id_usuario') else None
+    except Exception:
+        return jsonify({"error": "Parámetros inválidos: desde/hasta YYYY-MM-DD, id_usuario ObjectId"}), 400
+
+    eventos = retencion_logs.consultar(db, desde, hasta, request.args.get('accion'), id_usuario,
+                                       limite=request.args.get('limite', 10000, type=int))
+    lineas = (exportacion.a_json(evento) + "\n" for evento in eventos)
+    return Response(respuestas.agrupar(lineas), mimetype="application/x-ndjson")
+
+# --- COLA DE MODERACIÓN ---
+@app.route('/admin/moderacion', methods=['GET', 'POST'])
+def admin_moderacion():
+    if 'usuario_id' not in session or session.get('rol') != 'admin':
+        flash("Acceso denegado.", "error")
+        return redirect(url_for('home'))
+
+    if request.method == 'POST':
+        decision = request.form.get('decision')
+        try:
+            ids = [consultas.a_object_id(i) for i in request.form.getlist('ids')]
+            cambiadas = moderacion.resolver(mongo, ids, decision, ObjectId(session['usuario_id']),
+                                            request.form.get('motivo', '').strip() or None)
+            flash(f"{cambiadas} propiedades {'aprobadas' if decision == 'aprobada' else 'rechazadas'}.", "success")
+        except Exception as e:
+            print(f"Error moderando propiedades: {e}")
+            flash("No se pudo aplicar la decisión.", "error")
+        return redirect(url_for('admin_moderacion', despues=request.args.get('despues')))
+
+    despues = request.args.get('despues')
+    try:
+        despues = consultas.a_object_id(despues) if despues else None
+    except Exception:
+        despues = None
+    pendientes, siguiente = moderacion.cola(mongo, despues)
+    return render_template('moderacion.html', pendientes=pendientes, siguiente=siguiente,
+                           total_pendientes=moderacion.contar_pendientes(mongo))
+
+# Estadísticas de los caches en memoria de este worker
+@app.route('/admin/cache')
+def admin_cache():
+    if 'usuario_id' not in session or session.get('rol') != 'admin':
+        return jsonify({"error": "Acceso denegado"}), 403
+    return jsonify({"pid": os.getpid(), "caches": cache_local.estadisticas()})
+
+# --- PERFILADOR (muestreo de pilas por endpoint) ---
+@app.route('/admin/perfilador', methods=['GET', 'POST'])
+def admin_perfilador():
+    if 'usuario_id' not in session or session.get('rol') != 'admin':
+        flash("Acceso denegado.", "error")
+        return redirect(url_for('home'))
+
+    if request.method == 'POST':
+        try:
+            perfilador.guardar_ajustes(
+                request.form.get('activo') == '1',
+                request.form.get('porcentaje', 0),
+                request.form.get('endpoint', ''),
+                request.form.get('intervalo_ms', 5)
+            )
+            flash("Ajustes del perfilador guardados.", "success")
+        except ValueError as e:
+            flash(f"Ajustes inválidos: {e}", "error")
+        return redirect(url_for('admin_perfilador'))
+
+    endpoints = sorted(r.endpoint for r in app.url_map.iter_rules() if r.endpoint != 'static')
+    return render_template('perfilador.html', ajustes=perfilador.ajustes(), perfiles=perfilador.resumen(),
+                           endpoints=endpoints, carpeta=perfilador.carpeta)
+
+# Conteos de un endpoint: pilas colapsadas (.folded) o flamegraph SVG
+@app.route('/admin/perfilador/descargar/<nombre>')
+def admin_perfilador_descargar(nombre):
+    if 'usuario_id' not in session or session.get('rol') != 'admin':
+        return jsonify({"error": "Acceso denegado"}), 403
+    conteo = perfilador.pilas_de(nombre)
+    if not conteo:
+        return jsonify({"error": "Sin muestras para ese endpoint"}), 404
+
+    if request.args.get('formato') == 'svg':
+        response = Response(flamegraph_svg(conteo, nombre), mimetype="image/svg+xml")
+        nombre = f"{nombre}.svg"
+    else:
+        response = Response(a_folded(conteo), mimetype="text/plain")
+        nombre = f"{nombre}.folded"
+    if request.args.get('descargar') == '1' or request.args.get('formato') != 'svg':
+        response.headers["Content-Disposition"] = f'attachment; filename="{nombre}"'
+    response.headers["Cache-Control"] = "private, no-store"
+    return response
+
+@app.route('/admin/perfilador/limpiar', methods=['POST'])
+def admin_perfilador_limpiar():
+    if 'usuario_id' not in session or session.get('rol') != 'admin':
+        flash("Acceso denegado.", "error")
+        return redirect(url_for('home'))
+    borrados = perfilador.limpiar(request.form.get('endpoint') or None)
+    flash(f"{borrados} archivos de perfil borrados.", "success")
+    return redirect(url_for('admin_perfilador'))
+
+# --- EXPORTACIÓN EN STREAMING (CSV / JSONL / PARQUET) ---
+# Admin: cualquier colección. Proveedor: sus propiedades y las reseñas de ellas.
+@app.route('/exportar/<coleccion>')
+def exportar_coleccion(coleccion):
+    if 'usuario_id' not in session or session.get('rol') not in ('admin', 'proveedor'):
+        return jsonify({"error": "Acceso denegado"}), 403
+    if coleccion not in exportacion.COLECCIONES:
+        return jsonify({"error": "Colección no exportable"}), 404
+
+    formato = request.args.get('formato', 'csv')
+    if formato not in exportacion.formatos_disponibles():
+        return jsonify({"error": "Formato no disponible", "formatos": exportacion.formatos_disponibles()}), 400
+    comprimir = request.args.get('gzip') == '1'
+
+    extra = {}
+    if session.get('rol') == 'proveedor':
+        id_propietario = ObjectId(session['usuario_id'])
+        if coleccion == 'propiedades':
+            extra = {"id_propietario": id_propietario}
+        elif coleccion == 'resenas':
+            ids = [p["_id"] for p in consultas.propiedades_por_propietario(db, id_propietario, {"_id": 1})]
+            extra = {"id_propiedad": {"$in": ids}}
+        else:
+            return jsonify({"error": "Acceso denegado"}), 403
+
+    try:
+        filtro = exportacion.construir_filtro(coleccion, request.args.get('desde'), request.args.get('hasta'), extra)
+    except ValueError:
+        return jsonify({"error": "Las fechas deben tener formato YYYY-MM-DD"}), 400
+
+    mimetype = "application/gzip" if comprimir else exportacion.FORMATOS[formato][0]
+    response = Response(exportacion.exportar(db, coleccion, formato, filtro, comprimir), mimetype=mimetype)
+    nombre = exportacion.nombre_archivo(coleccion, formato, comprimir)
+    response.headers["Content-Disposition"] = f'attachment; filename="{nombre}"'
+    response.headers["Cache-Control"] = "private, no-store"
+    return response
 
 # --- RUTA DEL DASHBOARD DE PROVEEDOR ---
 @app.route("/dashboard_proveedor")
@@ -588,41 +803,26 @@ def dashboard_proveedor():
     if "usuario_id" not in session or session.get("rol") != "proveedor":
         return redirect(url_for("index"))
 
-    proveedor_id_str = session["usuario_id"]
-    mis_propiedades = list(propiedades.find({
-        "$or": [{"id_propietario": proveedor_id_str}, {"id_propietario": ObjectId(proveedor_id_str)}]
-    }))
+    proveedor_id = ObjectId(session["usuario_id"])
+    mis_propiedades = list(consultas.propiedades_por_propietario(mongo, proveedor_id))
 
     ids_mis_propiedades_obj = []
-    ids_mis_propiedades_str = []
     total_visitas = 0
 
     for p in mis_propiedades:
         total_visitas += p.get("visitas", 0) # Suma las vistas reales
         ids_mis_propiedades_obj.append(p["_id"])
-        ids_mis_propiedades_str.append(str(p["_id"]))
         
         # Imagen principal (igual que antes)
         p["imagen_principal_url"] = p["imagenes"][0].get("url_imagen", "") if ("imagenes" in p and p["imagenes"] and isinstance(p["imagenes"][0], dict)) else (p["imagenes"][0] if "imagenes" in p and p["imagenes"] else "")
 
     # --- COMENTARIOS RECIENTES PARA EL DASHBOARD ---
-    comentarios_recientes_cursor = resenas.find({
-        "$and": [
-            {"$or": [
-                {"id_propiedad": {"$in": ids_mis_propiedades_obj}},
-                {"id_propiedad": {"$in": ids_mis_propiedades_str}}
-            ]},
-            {"esta_eliminado": {"$ne": True}}
-        ]
-    }).sort("fecha_resena", -1).limit(5)
-    
     comentarios_dashboard = []
+    comentarios_recientes_cursor = consultas.resenas_de_propiedades(mongo, ids_mis_propiedades_obj, limite=5) if ids_mis_propiedades_obj else []
 
     for c in comentarios_recientes_cursor:
         # 1. Ponerle el título de la propiedad al comentario
-        prop_info = propiedades.find_one({
-            "$or": [{"_id": ObjectId(c["id_propiedad"])}, {"_id": str(c["id_propiedad"])}]
-        })
+        prop_info = propiedades.find_one({"_id": c["id_propiedad"]}, {"titulo": 1})
         titulo_prop = prop_info["titulo"] if prop_info else "Propiedad eliminada"
         
         # 2. Buscar el nombre de quién hizo el comentario
@@ -642,40 +842,55 @@ def dashboard_proveedor():
             "calificacion_num": c.get("puntuacion", 5)
         })
 
-    total_favoritos = usuarios.count_documents({"favoritos": {"$in": ids_mis_propiedades_str}})
+    total_favoritos = usuarios.count_documents({"favoritos": {"$in": ids_mis_propiedades_obj}})
+
+    # Tendencia de visitas del periodo elegido y las propiedades más vistas (ver visitas.py)
+    dias = request.args.get("dias", 30, type=int)
+    if dias not in visitas.PERIODOS:
+        dias = 30
+    serie_visitas, top = visitas.resumen_proveedor(mongo, proveedor_id, dias)
+    titulos = {p["_id"]: p.get("titulo", "") for p in mis_propiedades}
+    top_visitas = [{"id_propiedad": i, "titulo": titulos.get(i, "Propiedad eliminada"), "visitas": n} for i, n in top]
 
     return render_template("dashboard_proveedor.html", 
                            total_publicaciones=len(mis_propiedades),
                            total_visitas=total_visitas,
                            total_favoritos=total_favoritos,
                            comentarios=comentarios_dashboard,
-                           propiedades=mis_propiedades)
+                           propiedades=mis_propiedades,
+                           dias=dias,
+                           periodos=visitas.PERIODOS,
+                           serie_visitas=serie_visitas,
+                           maximo_visitas=max([n for _, n in serie_visitas] + [1]),
+                           visitas_periodo=sum(n for _, n in serie_visitas),
+                           top_visitas=top_visitas)
 
 @app.route("/eliminar_propiedad/<id_propiedad>", methods=["POST"])
 def eliminar_propiedad(id_propiedad):
     if "usuario_id" not in session or session.get("rol") != "proveedor":
         return redirect(url_for("index"))
     
-    id_propietario_actual = session["usuario_id"]
+    id_propietario_actual = ObjectId(session["usuario_id"])
+    id_propiedad_obj = consultas.a_object_id(id_propiedad)
 
     # Buscar propiedad PERO asegurando que el propietario sea quien hace la petición
-    prop = propiedades.find_one({
-        "_id": ObjectId(id_propiedad),
-        "$or": [
-            {"id_propietario": id_propietario_actual},
-            {"id_propietario": ObjectId(id_propietario_actual)}
-        ]
-    })
+    prop = consultas.propiedad_de_propietario(mongo, id_propiedad_obj, id_propietario_actual)
 
     if not prop:
         flash("No tienes permiso o la propiedad no existe.", "error")
         return redirect(url_for("dashboard_proveedor"))
     
     # Eliminación real en la base de datos
-    propiedades.delete_one({"_id": ObjectId(id_propiedad)})
+    if propiedades.delete_one({"_id": id_propiedad_obj}).deleted_count:
+        contadores.sumar(mongo, id_propietario_actual, "total_publicaciones", -1)
+    cache_local.propiedades.invalidar(id_propiedad_obj)
+    recomendador.quitar(id_propiedad_obj)
+    destacadas.rotacion_destacadas.invalidar()
+    estadisticas_mercado.marcar_pendiente(mongo, prop)
+    indice_autocompletado.quitar(id_propiedad_obj)
     
-    # También borramos sus comentarios
-    db.comentarios.delete_many({"id_propiedad": id_propiedad})
+    # Reseñas, favoritos, novedades e imágenes se limpian en segundo plano (ver limpieza.py)
+    limpieza.encolar_propiedad_eliminada(mongo, prop)
     
     flash("Publicación eliminada para siempre.", "success")
     return redirect(url_for("dashboard_proveedor"))
@@ -685,27 +900,17 @@ def editar_propiedad(id_propiedad):
     if "usuario_id" not in session or session.get("rol") != "proveedor":
         return redirect(url_for("index"))
     
-    id_propietario_actual = session["usuario_id"]
+    id_propietario_actual = ObjectId(session["usuario_id"])
+    id_propiedad_obj = consultas.a_object_id(id_propiedad)
 
     # Buscar propiedad PERO asegurando que el propietario sea quien hace la petición
-    prop = propiedades.find_one({
-        "_id": ObjectId(id_propiedad),
-        "$or": [
-            {"id_propietario": id_propietario_actual},
-            {"id_propietario": ObjectId(id_propietario_actual)}
-        ]
-    })
+    prop = consultas.propiedad_de_propietario(mongo, id_propiedad_obj, id_propietario_actual)
 
     if not prop:
         flash("No tienes permiso o la propiedad no existe.", "error")
         return redirect(url_for("dashboard_proveedor"))
 
     try:
-        prop = propiedades.find_one({"_id": ObjectId(id_propiedad)})
-        if not prop:
-            flash("Propiedad no encontrada.", "error")
-            return redirect(url_for("dashboard_proveedor"))
-
         if request.method == "POST":
             # Convertidor seguro
             def safe_float(val, default=0.0):
@@ -735,7 +940,8 @@ def editar_propiedad(id_propiedad):
                 "numero_ext_int": request.form.get("numero_ext_int", prop.get("numero_ext_int")),
                 "colonia": request.form.get("colonia", prop.get("colonia")),
                 "codigo_postal": request.form.get("codigo_postal", prop.get("codigo_postal")),
-                "ciudad": request.form.get("ciudad", prop.get("ciudad"))
+                "ciudad": request.form.get("ciudad", prop.get("ciudad")),
+                "fecha_actualizacion": datetime.utcnow()
             }
 
             # 2. Manejo de Imágenes (Con Try-Except para evitar crash si falla Cloudinary)
@@ -758,16 +964,27 @@ def editar_propiedad(id_propiedad):
                 flash("Aviso: No se pudieron subir las imágenes. Revisa tu conexión a Cloudinary.", "error")
 
             # Combinar o reemplazar imágenes
+            imagenes_descartadas = []
             if nuevas_imagenes:
                 if request.form.get("reemplazar_imagenes") == "si":
                     nuevas_imagenes[0]["es_principal"] = True
                     datos_actualizados["imagenes"] = nuevas_imagenes
+                    imagenes_descartadas = limpieza.public_ids(prop.get("imagenes"))
                 else:
                     imagenes_actuales = prop.get("imagenes", [])
                     datos_actualizados["imagenes"] = imagenes_actuales + nuevas_imagenes
 
             # 3. Guardar cambios en MongoDB
-            propiedades.update_one({"_id": ObjectId(id_propiedad)}, {"$set": datos_actualizados})
+            propiedades.update_one({"_id": id_propiedad_obj}, {"$set": datos_actualizados})
+            cache_local.propiedades.invalidar(id_propiedad_obj)
+            # Las imágenes reemplazadas se borran de Cloudinary en segundo plano
+            limpieza.encolar_imagenes(mongo, imagenes_descartadas)
+            recomendador.actualizar({**prop, **datos_actualizados})
+            destacadas.rotacion_destacadas.invalidar()
+            indice_autocompletado.actualizar({**prop, **datos_actualizados})
+            # Si cambió de colonia se recalculan los dos grupos
+            estadisticas_mercado.marcar_pendiente(mongo, prop)
+            estadisticas_mercado.marcar_pendiente(mongo, {**prop, **datos_actualizados})
             flash("¡Publicación actualizada con éxito!", "success")
             return redirect(url_for("dashboard_proveedor"))
 
@@ -798,16 +1015,20 @@ def index():
     correo = request.form.get("correo_electronico")
     contrasena = request.form.get("contrasena")
 
-    usuario = usuarios.find_one({"correo_electronico": correo})
+    usuario = usuarios.find_one({"correo_electronico": correo}, {"favoritos": 0})
 
     if not usuario:
         flash("Correo o contraseña incorrectos.", "error")
         return redirect(url_for("home"))
 
-    if not bcrypt.check_password_hash(usuario["contrasena"], contrasena):
+    if not servicio_contrasenas.verificar(usuario["contrasena"], contrasena):
         flash("Correo o contraseña incorrectos.", "error")
         return redirect(url_for("home"))
 
+    # Si el costo vigente subió, el hash se rehace sin hacer esperar al login
+    if servicio_contrasenas.necesita_rehash(usuario["contrasena"]):
+        servicio_contrasenas.rehash_en_segundo_plano(mongo, usuario, contrasena)
+
     # Guardar sesión
     session["usuario_id"] = str(usuario["_id"])
     session["nombre"] = usuario["nombre"]
@@ -830,6 +1051,13 @@ def comentar_propiedad(id_propiedad):
         flash("Debes iniciar sesión para comentar y calificar.", "error")
         return redirect(url_for("index"))
 
+    # Solo se reseñan propiedades que existen y están publicadas
+    prop = propiedades.find_one({"_id": ObjectId(id_propiedad)}, {"estado_publicacion": 1}) \
+        if ObjectId.is_valid(id_propiedad) else None
+    if not prop or not consultas.es_publica(prop):
+        flash("La propiedad no existe o fue eliminada.", "error")
+        return redirect(url_for('home'))
+
     comentario_texto = request.form.get("comentario")
     # Convertimos a entero para cumplir con bsonType: 'int' de tu esquema
     puntuacion = int(request.form.get("calificacion", 0))
@@ -837,7 +1065,7 @@ def comentar_propiedad(id_propiedad):
     # Estructura exacta basada en tu JSON Schema
     nueva_resena = {
         "id_usuario": ObjectId(session["usuario_id"]),
-        "id_propiedad": str(id_propiedad), # Guardamos como string para evitar problemas de búsqueda
+        "id_propiedad": prop["_id"], # Siempre ObjectId (ver migrar_ids.py)
         "puntuacion": puntuacion,
         "comentario": comentario_texto,
         "fecha_resena": datetime.utcnow(), # bsonType: 'date'
@@ -847,6 +1075,12 @@ def comentar_propiedad(id_propiedad):
 
     # Insertamos en la nueva colección
     resenas.insert_one(nueva_resena)
+
+    # Resumen en la propiedad: cambia la versión (ETag) de su página de detalle
+    propiedades.update_one(
+        {"_id": nueva_resena["id_propiedad"]},
+        {"$inc": {"resumen_resenas.total": 1}, "$max": {"resumen_resenas.ultima": nueva_resena["fecha_resena"]}}
+    )
     
     flash("Tu calificación y comentario han sido guardados.", "success")
     return redirect(url_for('detalle_propiedad', id_propiedad=id_propiedad))
@@ -855,24 +1089,131 @@ def comentar_propiedad(id_propiedad):
 # --- NUEVA RUTA PARA FAVORITOS ---
 @app.route("/toggle_favorito/<id_propiedad>", methods=["POST"])
 def toggle_favorito(id_propiedad):
+    # Los corazones de las tarjetas llaman por fetch y esperan JSON
+    es_ajax = request.accept_mimetypes.best == "application/json"
     if "usuario_id" not in session:
+        if es_ajax:
+            return jsonify({"status": "error", "message": "Debes iniciar sesión"}), 401
         return redirect(url_for("index"))
 
     usuario_id = ObjectId(session["usuario_id"])
-    usuario = usuarios.find_one({"_id": usuario_id})
-    favoritos = usuario.get("favoritos", [])
+    id_propiedad_obj = consultas.a_object_id(id_propiedad)
+    agregada = favoritos.alternar(mongo, usuario_id, id_propiedad_obj)
+    if es_ajax:
+        return jsonify({"status": "success", "action": "added" if agregada else "removed"})
 
-    if id_propiedad in favoritos:
-        favoritos.remove(id_propiedad)
-        msg = "Eliminado de favoritos"
-    else:
-        favoritos.append(id_propiedad)
-        msg = "Agregado a favoritos"
-
-    usuarios.update_one({"_id": usuario_id}, {"$set": {"favoritos": favoritos}})
+    msg = "Agregado a favoritos" if agregada else "Eliminado de favoritos"
     flash(msg, "success")
     return redirect(url_for("detalle_propiedad", id_propiedad=id_propiedad))
 
+# Estado del corazón en la página de detalle (se pide aparte para poder cachear la página)
+@app.route("/api/favorito/<id_propiedad>")
+def estado_favorito(id_propiedad):
+    if "usuario_id" not in session:
+        return jsonify({"es_favorito": False})
+
+    es_favorito = favoritos.es_favorito(mongo, ObjectId(session["usuario_id"]), consultas.a_object_id(id_propiedad))
+    response = jsonify({"es_favorito": es_favorito})
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+# Propiedades similares de la página de detalle (matriz en memoria, ver recomendador.py).
+# Van aparte porque cambian con cualquier otra propiedad, no con la versión de esta.
+@app.route("/api/similares/<id_propiedad>")
+def api_similares(id_propiedad):
+    if not ObjectId.is_valid(id_propiedad):
+        return jsonify({"error": "Id inválido"}), 400
+    tarjetas = recomendador.similares_de(mongo, ObjectId(id_propiedad), k=4)
+    if tarjetas is None:
+        return jsonify({"error": "La propiedad no existe"}), 404
+    similares = [{**s, "_id": str(s["_id"]), "url": url_for("detalle_propiedad", id_propiedad=s["_id"])}
+                 for s in tarjetas]
+    response = jsonify(similares)
+    response.cache_control.public = True
+    response.cache_control.max_age = 300
+    return response
+
+# Corazones de una cuadrícula de tarjetas: cuáles de los ids son favoritos, en una consulta
+@app.route("/api/favoritos")
+def favoritos_de_tarjetas():
+    if "usuario_id" not in session:
+        return jsonify({"favoritos": []})
+    textos = [t.strip() for t in request.args.get("ids", "").split(",")[:favoritos.MAXIMO_IDS]]
+    ids = [ObjectId(t) for t in textos if ObjectId.is_valid(t)]
+    comunes = favoritos.favoritos_entre(mongo, ObjectId(session["usuario_id"]), ids)
+    response = jsonify({"favoritos": [str(i) for i in comunes]})
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+# Autocompletado del buscador (índice en memoria, no consulta MongoDB)
+@app.route("/api/autocompletar")
+def api_autocompletar():
+    sugerencias = indice_autocompletado.sugerir(mongo, request.args.get("q", "")[:50])
+    response = jsonify(sugerencias)
+    response.cache_control.public = True
+    response.cache_control.max_age = 60
+    return response
+
+# Estadísticas de mercado de un grupo colonia × tipo × operación
+@app.route("/api/mercado")
+def api_mercado():
+    estadistica = estadisticas_mercado.obtener(
+        mongo,
+        request.args.get("colonia", ""),
+        request.args.get("tipo_propiedad", "").lower(),
+        request.args.get("tipo_operacion", "").lower()
+    )
+    if not estadistica or not estadistica.get("total"):
+        return jsonify({"error": "Sin datos para ese grupo"}), 404
+    datos = {k: v for k, v in estadistica.items() if k != "_id"}
+    datos["fecha_calculo"] = estadistica.get("fecha_calculo").isoformat() if estadistica.get("fecha_calculo") else None
+    response = jsonify(datos)
+    response.cache_control.public = True
+    response.cache_control.max_age = 300
+    return response
+
+# --- BÚSQUEDAS GUARDADAS Y NOVEDADES ---
+@app.route("/busquedas/guardar", methods=["POST"])
+def guardar_busqueda():
+    criterios = consultas.criterios_busqueda(request.form)
+    if "usuario_id" not in session:
+        flash("Inicia sesión para guardar tus búsquedas.", "error")
+        return redirect(url_for("buscar", **criterios))
+
+    nombre = request.form.get("nombre", "").strip()[:80] or None
+    if busquedas_guardadas.guardar(mongo, ObjectId(session["usuario_id"]), criterios, nombre):
+        flash("Búsqueda guardada. Te avisaremos en Novedades cuando se publique algo que coincida.", "success")
+    else:
+        flash(f"Solo puedes guardar {busquedas_guardadas.MAXIMO_POR_USUARIO} búsquedas.", "error")
+    return redirect(url_for("buscar", **criterios))
+
+@app.route("/busquedas/eliminar/<id_busqueda>", methods=["POST"])
+def eliminar_busqueda(id_busqueda):
+    if "usuario_id" not in session:
+        return redirect(url_for("index"))
+    try:
+        busquedas_guardadas.eliminar(mongo, ObjectId(session["usuario_id"]), consultas.a_object_id(id_busqueda))
+        flash("Búsqueda eliminada.", "success")
+    except Exception as e:
+        print(f"Error eliminando búsqueda: {e}")
+    return redirect(url_for("mis_novedades"))
+
+@app.route("/novedades")
+def mis_novedades():
+    if "usuario_id" not in session:
+        flash("Debes iniciar sesión para ver tus novedades.", "error")
+        return redirect(url_for("index"))
+
+    id_usuario = ObjectId(session["usuario_id"])
+    imagen_defecto = url_for('static', filename='images/product/l-product-1.jpg')
+    propiedades_nuevas, sin_ver = busquedas_guardadas.novedades(mongo, id_usuario)
+    for p in propiedades_nuevas:
+        p["imagen_principal_url"] = p["imagen_principal_url"] or imagen_defecto
+    return render_template("novedades.html", propiedades=propiedades_nuevas, sin_ver=sin_ver,
+                           busquedas=busquedas_guardadas.de_usuario(mongo, id_usuario))
+
 # --- NUEVA RUTA: VER FAVORITOS ---
 @app.route("/favorites")
 def mis_favoritos():
@@ -881,23 +1222,14 @@ def mis_favoritos():
         flash("Debes iniciar sesión para ver tus favoritos.", "error")
         return redirect(url_for("index"))
 
-    # 2. Buscar al usuario y obtener su lista de favoritos
-    usuario_actual = usuarios.find_one({"_id": ObjectId(session["usuario_id"])})
-    lista_ids_favoritos = usuario_actual.get("favoritos", [])
-
-    # 3. Convertir los IDs de texto a ObjectId para que MongoDB los entienda
-    ids_obj = []
-    for fid in lista_ids_favoritos:
-        try:
-            ids_obj.append(ObjectId(fid))
-        except:
-            pass
-
-    # 4. Buscar todas las propiedades que coincidan con esos IDs
-    propiedades_favoritas = list(propiedades.find({"_id": {"$in": ids_obj}}))
+    # 2. Una página de favoritos: solo viajan los ids de la página, no el arreglo completo
+    pagina = request.args.get("pagina", 1, type=int) or 1
+    propiedades_favoritas, total = favoritos.pagina(mongo, ObjectId(session["usuario_id"]), pagina)
+    total_paginas = -(-total // favoritos.TAMANO_PAGINA)
 
-    # 5. Mandar a la nueva pantalla
-    return render_template("favoritos.html", propiedades=propiedades_favoritas, mis_favoritos=lista_ids_favoritos)
+    # 3. Mandar a la pantalla en streaming
+    return respuestas.transmitir_plantilla("favoritos.html", propiedades=propiedades_favoritas,
+                                           pagina=pagina, total_paginas=total_paginas)
 
 # Logout
 @app.route("/logout")
@@ -912,4 +1244,6 @@ def logout():
     return response
 
 if __name__ == "__main__":
+    # En producción: gunicorn -c gunicorn.conf.py (ver wsgi.py)
+    arranque.iniciar_worker(db)
     app.run(debug=False, port=5000)
@@ -1,29 +1,105 @@
 import os
 from datetime import datetime
-from flask import Blueprint, render_template, redirect, url_for, flash, session, current_app, request
+from flask import Blueprint, render_template, redirect, url_for, flash, session, current_app, request, jsonify
 from werkzeug.utils import secure_filename
-from pymongo import MongoClient
 from bson.objectid import ObjectId
 import cloudinary
 import cloudinary.uploader
-from config import Config
 from forms import PublicacionForm 
+from recomendador import recomendador
+import estadisticas_mercado
+from autocompletado import indice_autocompletado
+import importacion
+import contadores
+import conexiones
 
 # Definimos el Blueprint
 publicaciones_bp = Blueprint('publicaciones', __name__, template_folder='src/templates', static_folder='src/static')
 
-# Conexión a BD
-client = MongoClient(Config.MONGODB_URI)
-db = client["HomiDB"]
+# Conexión a BD: el mismo cliente que app.py (ver conexiones.py)
+db = conexiones.db
 propiedades_col = db["propiedades"]
 logs_col = db["log_audotoria"]
 
-cloudinary.config(
-    cloud_name = Config.CLOUDINARY_CLOUD_NAME,
-    api_key = Config.CLOUDINARY_API_KEY,
-    api_secret = Config.CLOUDINARY_API_SECRET,
-    secure = True
-)
+def construir_propiedad(form, id_propietario, imagenes):
+    """
+    Arma el documento de una propiedad a partir de un PublicacionForm ya validado.
+    Lanza ValueError si precio o coordenadas no son números.
+    """
+    # Conversión de Datos
+    precio_final = float(form.precio.data)
+    latitud_final = float(form.latitud.data)
+    longitud_final = float(form.longitud.data)
+
+    habs_final = int(form.numero_habitaciones.data or 0)
+    banos_final = int(form.numero_banos.data or 0)
+    m2_final = int(form.superficie_m2.data or 0)
+
+    return {
+        "id_propietario": id_propietario,
+        "titulo": form.titulo.data,
+        "descripcion": form.descripcion.data,
+        "tipo_operacion": form.tipo_operacion.data,
+        "tipo_propiedad": form.tipo_propiedad.data,
+        "precio": precio_final,
+        "calle": form.calle.data,
+        "numero_ext_int": form.numero_ext_int.data,
+        "colonia": form.colonia.data,
+        "codigo_postal": form.codigo_postal.data,
+        "ciudad": form.ciudad.data,
+        "google_place_id": "ND",
+        "latitud": latitud_final,
+        "longitud": longitud_final,
+        "numero_habitaciones": habs_final,
+        "numero_banos": banos_final,
+        "superficie_m2": m2_final,
+        "estado_publicacion": "pendiente",
+        "es_destacada": False,
+        "fecha_destacado_expira": None,
+        "disponible": True,
+        "fecha_publicacion": datetime.utcnow(),
+        "imagenes": imagenes,
+
+        # --- Amenidades opcionales ---
+        "amenidades": {
+            "alberca": {
+                "tiene": form.tiene_alberca.data,
+                "metros_m2": float(form.metros_alberca.data) if form.tiene_alberca.data and form.metros_alberca.data else None
+            },
+            "estacionamiento": {
+                "tiene": form.tiene_estacionamiento.data,
+                "cajones": int(form.capacidad_estacionamiento.data) if form.tiene_estacionamiento.data and form.capacidad_estacionamiento.data else None,
+                "techado": form.estacionamiento_techado.data if form.tiene_estacionamiento.data else False
+            },
+            "jardin": {
+                "tiene": form.tiene_jardin.data,
+                "metros_m2": float(form.metros_jardin.data) if form.tiene_jardin.data and form.metros_jardin.data else None
+            },
+            "gimnasio": form.tiene_gimnasio.data,
+            "roof_garden": form.tiene_roof_garden.data,
+            "cuarto_servicio": form.tiene_cuarto_servicio.data,
+            "bodega": form.tiene_bodega.data,
+            "elevador": form.tiene_elevador.data,
+            "amueblado": form.amueblado.data,
+            "permite_mascotas": form.permite_mascotas.data
+        }
+    }
+
+def log_nueva_propiedad(id_usuario, propiedad):
+    return {
+        "id_usuario": id_usuario,
+        "accion": "NUEVA_PROPIEDAD",
+        "detalles": f"Publicó propiedad: {propiedad['titulo']} en {propiedad['ciudad']}. Precio: {propiedad['precio']}",
+        "fecha_evento": datetime.utcnow()
+    }
+
+def despues_de_publicar(propiedad):
+    """
+    Actualiza los índices en memoria y las estadísticas con una propiedad recién guardada.
+    """
+    recomendador.actualizar(propiedad)
+    estadisticas_mercado.marcar_pendiente(db, propiedad)
+    indice_autocompletado.actualizar(propiedad)
 
 @publicaciones_bp.route('/crear-publicacion', methods=['GET', 'POST'])
 def crear_publicacion():
@@ -72,82 +148,22 @@ def crear_publicacion():
                         flash("Error al subir una de las imágenes. Intenta de nuevo.", "error")
                         return render_template('Publicaciones.html', form=form, propietario=propietario_data)
 
-            # Conversión de Datos (Igual que antes)
+            # Conversión de Datos y objeto para MongoDB
             try:
-                precio_final = float(form.precio.data)
-                latitud_final = float(form.latitud.data)
-                longitud_final = float(form.longitud.data)
-                
-                habs_final = int(form.numero_habitaciones.data or 0)
-                banos_final = int(form.numero_banos.data or 0)
-                m2_final = int(form.superficie_m2.data or 0)
+                nueva_propiedad = construir_propiedad(form, ObjectId(session['usuario_id']), imagenes_guardadas)
             except ValueError:
                 flash("Error en el formato de números (precio o coordenadas).", "error")
                 return render_template('Publicaciones.html', form=form, propietario=propietario_data)
-
-            # Objeto para MongoDB
-            nueva_propiedad = {
-                "id_propietario": ObjectId(session['usuario_id']),
-                "titulo": form.titulo.data,
-                "descripcion": form.descripcion.data,
-                "tipo_operacion": form.tipo_operacion.data,
-                "tipo_propiedad": form.tipo_propiedad.data,
-                "precio": precio_final,
-                "calle": form.calle.data,
-                "numero_ext_int": form.numero_ext_int.data,
-                "colonia": form.colonia.data,
-                "codigo_postal": form.codigo_postal.data,
-                "ciudad": form.ciudad.data,
-                "google_place_id": "ND",
-                "latitud": latitud_final,
-                "longitud": longitud_final,
-                "numero_habitaciones": habs_final,
-                "numero_banos": banos_final,
-                "superficie_m2": m2_final,
-                "estado_publicacion": "pendiente",
-                "es_destacada": False,
-                "fecha_destacado_expira": None,
-                "disponible": True,
-                "fecha_publicacion": datetime.utcnow(),
-                "imagenes": imagenes_guardadas,
-
-                # --- Amenidades opcionales ---
-                "amenidades": {
-                    "alberca": {
-                        "tiene": form.tiene_alberca.data,
-                        "metros_m2": float(form.metros_alberca.data) if form.tiene_alberca.data and form.metros_alberca.data else None
-                    },
-                    "estacionamiento": {
-                        "tiene": form.tiene_estacionamiento.data,
-                        "cajones": int(form.capacidad_estacionamiento.data) if form.tiene_estacionamiento.data and form.capacidad_estacionamiento.data else None,
-                        "techado": form.estacionamiento_techado.data if form.tiene_estacionamiento.data else False
-                    },
-                    "jardin": {
-                        "tiene": form.tiene_jardin.data,
-                        "metros_m2": float(form.metros_jardin.data) if form.tiene_jardin.data and form.metros_jardin.data else None
-                    },
-                    "gimnasio": form.tiene_gimnasio.data,
-                    "roof_garden": form.tiene_roof_garden.data,
-                    "cuarto_servicio": form.tiene_cuarto_servicio.data,
-                    "bodega": form.tiene_bodega.data,
-                    "elevador": form.tiene_elevador.data,
-                    "amueblado": form.amueblado.data,
-                    "permite_mascotas": form.permite_mascotas.data
-                }
-            }
             
             # Registrar Log
-            logs_col.insert_one({
-                "id_usuario": ObjectId(session['usuario_id']),
-                "accion": "NUEVA_PROPIEDAD",
-                "detalles": f"Publicó propiedad: {form.titulo.data} en {form.ciudad.data}. Precio: {precio_final}",
-                "fecha_evento": datetime.utcnow()
-            })
+            logs_col.insert_one(log_nueva_propiedad(ObjectId(session['usuario_id']), nueva_propiedad))
 
             # Guardar Propiedad
             propiedades_col.insert_one(nueva_propiedad)
+            contadores.sumar(db, nueva_propiedad["id_propietario"], "total_publicaciones")
+            despues_de_publicar(nueva_propiedad)
             
-            flash("¡Propiedad publicada con éxito!", "success")
+            flash("¡Propiedad publicada con éxito! Será visible cuando un administrador la apruebe.", "success")
             return redirect(url_for('publicaciones.crear_publicacion'))
 
         except Exception as e:
@@ -159,4 +175,47 @@ def crear_publicacion():
         print("ERRORES FORMULARIO:", form.errors)
         flash("Revisa los campos del formulario.", "error")
 
-    return render_template('Publicaciones.html', form=form, propietario=propietario_data)
\ No newline at end of file
+    return render_template('Publicaciones.html', form=form, propietario=propietario_data)
+
+# --- IMPORTACIÓN MASIVA (CSV / JSONL) ---
+@publicaciones_bp.route('/importar-publicaciones', methods=['POST'])
+def importar_publicaciones():
+    if 'usuario_id' not in session or session.get('rol') != 'proveedor':
+        return jsonify({"error": "Solo los proveedores pueden importar publicaciones."}), 403
+
+    archivo = request.files.get('archivo')
+    if not archivo or not archivo.filename:
+        return jsonify({"error": "Falta el archivo CSV o JSONL."}), 400
+
+    # Desde la web solo archivos chicos: la importación corre dentro de esta petición
+    zip_imagenes = request.files.get('imagenes')
+    try:
+        imagenes = None
+        if zip_imagenes and zip_imagenes.filename:
+            imagenes = importacion.FuenteImagenes(archivo_zip=zip_imagenes.stream)
+        insertadas, errores = importacion.importar(
+            db,
+            archivo.stream,
+            importacion.detectar_formato(archivo.filename),
+            ObjectId(session['usuario_id']),
+            imagenes,
+            maximo_filas=importacion.MAXIMO_FILAS_WEB
+        )
+    except importacion.ArchivoInvalido as e:
+        if request.args.get('formato') != 'json':
+            flash(f"No se importó nada: {e}", "error")
+            return redirect(url_for('dashboard_proveedor'))
+        return jsonify({"error": str(e)}), 400
+
+    # Formulario del dashboard: resumen con flash. Clientes de API: reporte completo en JSON
+    if request.args.get('formato') != 'json':
+        flash(f"{insertadas} propiedades importadas.", "success")
+        if errores:
+            detalle = "; ".join(f"fila {n}: {e}" for n, e in errores[:5])
+            flash(f"{len(errores)} filas con error. {detalle}", "error")
+        return redirect(url_for('dashboard_proveedor'))
+
+    return jsonify({
+        "insertadas": insertadas,
+        "errores": [{"fila": n, "error": e} for n, e in errores]
+    })
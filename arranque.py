@@ -0,0 +1,165 @@
+"""
+Arranque de cada worker.
+
+Importar app.py solo arma la app: no conecta a MongoDB ni arranca hilos
+(ver conexiones.py). Lo que necesita conexión o hilos vive aquí y corre una
+vez por proceso, después del fork:
+  - contrasenas: el pool de procesos de bcrypt (ver contrasenas.py).
+  - hilos: estadísticas de mercado, archivado de la bitácora, destacadas
+    vencidas, cola de limpieza y vaciado de visitas.
+  - ping: primera conexión a MongoDB, con un tiempo máximo corto para no
+    dejar colgado el arranque si la base no responde.
+  - indices: avisa si faltan índices (indices.verificar_indices).
+  - precalentar: recomendador, autocompletado y rotación de destacadas, para
+    que la primera petición no pague su construcción. Recorre colecciones
+    completas, así que corre en un hilo aparte (ETAPAS_EN_FONDO).
+
+Con gunicorn (gunicorn.conf.py) lo llama el hook post_worker_init, antes de
+que el worker acepte peticiones; ese hook corre antes de que empiece el
+latido del worker, así que después de cada etapa se llama a avisar
+(worker.notify) para que el maestro no lo dé por colgado, y el precalentado
+no se espera ahí. Con cualquier otro servidor lo dispara la primera petición
+del proceso (asegurar_iniciado).
+
+Cada etapa se mide en milisegundos; /salud/listo responde 200 solo cuando
+todas terminaron bien, incluido el precalentado, y muestra los tiempos. Si
+una etapa falla (casi siempre porque MongoDB no responde) las siguientes
+esperan: se reintentan en la siguiente consulta a /salud/listo. Mientras un
+hilo corre las etapas, las demás consultas responden con el estado actual en
+vez de esperarlo.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import pymongo
+
+import indices
+import contrasenas
+import estadisticas_mercado
+import retencion_logs
+import destacadas
+import limpieza
+import visitas
+from recomendador import recomendador
+from autocompletado import indice_autocompletado
+
+TIEMPO_MAXIMO_PING = 5     # segundos
+
+_lock = threading.Lock()
+_estado = {"pid": None, "hechas": set(), "errores": {}, "hilo": None}
+tiempos = {}    # etapa -> ms; "importar_app" viene del maestro si hay --preload
+
+
+@contextmanager
+def medir(etapa):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        tiempos[etapa] = round((time.perf_counter() - inicio) * 1000, 1)
+
+
+def _iniciar_hilos(db):
+    estadisticas_mercado.iniciar_refresco(db)
+    retencion_logs.iniciar_archivado(db)
+    destacadas.iniciar_expiracion(db)
+    limpieza.iniciar_limpieza(db)
+    visitas.iniciar_vaciado(db)
+
+
+def _precalentar(db):
+    recomendador.precalentar(db)
+    indice_autocompletado.precalentar(db)
+    destacadas.rotacion_destacadas.precalentar(db)
+
+
+def _ping(db):
+    with pymongo.timeout(TIEMPO_MAXIMO_PING):
+        db.command("ping")
+
+
+ETAPAS = [
+    ("contrasenas", lambda db: contrasenas.iniciar_pools()),
+    ("hilos", _iniciar_hilos),
+    ("ping", _ping),
+    ("indices", indices.verificar_indices),
+]
+
+# Corren en un hilo aparte una vez que terminaron las ETAPAS
+ETAPAS_EN_FONDO = [
+    ("precalentar", _precalentar),
+]
+
+
+def _correr(db, etapa, correr):
+    try:
+        with medir(etapa):
+            correr(db)
+        _estado["hechas"].add(etapa)
+        _estado["errores"].pop(etapa, None)
+        return True
+    except Exception as e:
+        print(f"Error en la etapa de arranque '{etapa}': {e}")
+        _estado["errores"][etapa] = str(e)
+        return False
+
+
+def _correr_en_fondo(db):
+    for etapa, correr in ETAPAS_EN_FONDO:
+        if etapa not in _estado["hechas"] and not _correr(db, etapa, correr):
+            break
+
+
+def iniciar_worker(db, avisar=None, esperar=True):
+    """
+    Corre las etapas que falten en este proceso y lanza las de fondo.
+    avisar() se llama después de cada etapa (gunicorn: worker.notify). Con
+    esperar=False, si otro hilo ya está corriendo las etapas no se espera.
+    Devuelve True si quedó listo.
+    """
+    if not _lock.acquire(blocking=esperar):
+        return esta_listo()
+    try:
+        if _estado["pid"] != os.getpid():
+            # Proceso nuevo (o fork): nada de lo hecho en el padre cuenta
+            _estado.update(pid=os.getpid(), hechas=set(), errores={}, hilo=None)
+        for etapa, correr in ETAPAS:
+            if etapa in _estado["hechas"]:
+                continue
+            ok = _correr(db, etapa, correr)
+            if avisar:
+                avisar()
+            if not ok:
+                return False
+        hilo = _estado["hilo"]
+        if not esta_listo() and (hilo is None or not hilo.is_alive()):
+            _estado["hilo"] = threading.Thread(target=_correr_en_fondo, args=(db,), name="precalentar", daemon=True)
+            _estado["hilo"].start()
+        return esta_listo()
+    finally:
+        _lock.release()
+
+
+def asegurar_iniciado(db):
+    """
+    Para servidores sin el hook de gunicorn: arranca el proceso en su primera
+    petición. Las peticiones que llegan mientras tanto no la esperan.
+    """
+    if _estado["pid"] != os.getpid():
+        iniciar_worker(db, esperar=False)
+
+
+def esta_listo():
+    return (_estado["pid"] == os.getpid()
+            and len(_estado["hechas"]) == len(ETAPAS) + len(ETAPAS_EN_FONDO))
+
+
+def estado():
+    return {
+        "listo": esta_listo(),
+        "pid": os.getpid(),
+        "tiempos_ms": dict(tiempos),
+        "errores": dict(_estado["errores"]) if _estado["pid"] == os.getpid() else {},
+    }
@@ -0,0 +1,129 @@
+"""
+Modo de lectura asíncrono (opcional) para las rutas de solo lectura.
+
+Con MONGO_ASINCRONO=1 cada worker abre, además del MongoClient normal, un
+AsyncMongoClient de pymongo que vive en un event loop propio, en un hilo de
+fondo. Las vistas siguen siendo de Flask (síncronas), pero mandan juntas sus
+consultas independientes a ese loop con asyncio.gather y esperan una sola
+vez: la página de detalle tarda lo que la consulta más lenta y no la suma de
+todas. Con workers de hilos (gunicorn --threads) todos los hilos comparten el
+mismo loop y el mismo pool de conexiones, así la concurrencia sube sin sumar
+procesos.
+
+El loop se crea la primera vez que se usa en cada proceso, así funciona
+igual si gunicorn hace fork después de importar la app.
+
+Comparar contra el modo síncrono: python bench_asincrono.py
+"""
+import asyncio
+import os
+import threading
+from pymongo import AsyncMongoClient
+import consultas
+
+TIEMPO_MAXIMO = 10  # segundos que una vista espera al loop
+
+
+class LectorAsincrono:
+    def __init__(self, uri, nombre_db="HomiDB"):
+        self.pid = os.getpid()
+        self._loop = asyncio.new_event_loop()
+        hilo = threading.Thread(target=self._loop.run_forever, name="mongo-asincrono", daemon=True)
+        hilo.start()
+        self.db = self.correr(self._conectar(uri, nombre_db))
+
+    async def _conectar(self, uri, nombre_db):
+        # El cliente se crea dentro del loop que lo va a usar
+        self.cliente = AsyncMongoClient(uri)
+        return self.cliente[nombre_db]
+
+    def correr(self, corrutina, tiempo_maximo=TIEMPO_MAXIMO):
+        """
+        Ejecuta una corrutina en el loop del lector y espera su resultado.
+        """
+        return asyncio.run_coroutine_threadsafe(corrutina, self._loop).result(tiempo_maximo)
+
+    def juntar(self, *corrutinas):
+        """
+        Ejecuta varias corrutinas a la vez y devuelve sus resultados en orden.
+        """
+        async def todas():
+            return await asyncio.gather(*corrutinas)
+        return self.correr(todas())
+
+
+_lector = None
+_lock = threading.Lock()
+
+
+def lector(uri, nombre_db="HomiDB"):
+    """
+    El lector de este proceso (se vuelve a crear si el proceso es un fork).
+    """
+    global _lector
+    with _lock:
+        if _lector is None or _lector.pid != os.getpid():
+            _lector = LectorAsincrono(uri, nombre_db)
+        return _lector
+
+
+async def _valor(valor):
+    return valor
+
+
+# --- CONSULTAS ---
+
+async def propiedad(adb, id_propiedad):
+    return await adb.propiedades.find_one({"_id": id_propiedad})
+
+
+async def tarjeta_propietario(adb, id_propietario):
+    propietario = await adb.usuarios.find_one({"_id": id_propietario}) if id_propietario else None
+    return consultas.armar_tarjeta_propietario(propietario)
+
+
+async def resenas_con_autores(adb, id_propiedad):
+    """
+    Reseñas visibles de la propiedad y sus autores (un solo $in, no una consulta por reseña).
+    """
+    resenas = await adb.resenas.find(
+        {"id_propiedad": id_propiedad, "esta_eliminado": {"$ne": True}}
+    ).sort("fecha_resena", -1).to_list(None)
+    ids = list({r["id_usuario"] for r in resenas if r.get("id_usuario")})
+    autores = {}
+    if ids:
+        async for usuario in adb.usuarios.find({"_id": {"$in": ids}}, consultas.PROYECCION_AUTOR):
+            autores[usuario["_id"]] = usuario
+    return resenas, autores
+
+
+async def contar(adb, coleccion, filtro):
+    return await adb[coleccion].count_documents(filtro)
+
+
+async def distintos(adb, coleccion, campo, filtro):
+    return await adb[coleccion].distinct(campo, filtro)
+
+
+def cargar_detalle(lector_async, id_propiedad, id_propietario, prop=None, tarjeta=None):
+    """
+    Propiedad, tarjeta del propietario y reseñas con autores, a la vez.
+    Lo que ya viene de la cache del worker (prop, tarjeta) no se consulta.
+    """
+    adb = lector_async.db
+    return lector_async.juntar(
+        _valor(prop) if prop is not None else propiedad(adb, id_propiedad),
+        _valor(tarjeta) if tarjeta is not None else tarjeta_propietario(adb, id_propietario),
+        resenas_con_autores(adb, id_propiedad)
+    )
+
+
+def cargar_busqueda(lector_async, filtro, filtro_colonias):
+    """
+    Total de resultados y colonias del buscador, a la vez.
+    """
+    adb = lector_async.db
+    return lector_async.juntar(
+        contar(adb, "propiedades", filtro),
+        distintos(adb, "propiedades", "colonia", filtro_colonias)
+    )
@@ -0,0 +1,190 @@
+"""
+Índice en memoria para el autocompletado del buscador.
+
+Guarda un arreglo ordenado de claves normalizadas (sin acentos y en
+minúsculas): colonias, ciudades y palabras de los títulos. Una búsqueda por
+prefijo es un bisect sobre ese arreglo, sin tocar MongoDB.
+
+El índice se construye la primera vez que se usa, se actualiza por propiedad
+cuando se crea, edita o elimina una en este worker, y se reconstruye cada
+REFRESCO_SEGUNDOS, en segundo plano, para recoger los cambios de otros
+workers (ver cache_local.Reconstruible); lo que cambie mientras se reconstruye
+se vuelve a aplicar sobre el índice nuevo.
+
+El prefijo necesita al menos LARGO_MINIMO_PREFIJO caracteres y se revisan como
+mucho MAXIMO_CLAVES claves por búsqueda: la ruta es pública y se llama en cada
+tecla, y con una sola letra recorrería una parte grande del índice.
+"""
+import bisect
+import heapq
+import re
+import threading
+import time
+import unicodedata
+import cache_local
+import consultas
+
+REFRESCO_SEGUNDOS = 600
+LIMITE_SUGERENCIAS = 8
+LARGO_MINIMO_PALABRA = 3
+LARGO_MINIMO_PREFIJO = 2   # el mismo que autocompletar.js
+MAXIMO_CLAVES = 500
+
+# Orden en que se muestran los tipos de sugerencia
+PRIORIDAD = {"colonia": 0, "ciudad": 1, "titulo": 2}
+
+PROYECCION = {"titulo": 1, "colonia": 1, "ciudad": 1, "disponible": 1, "estado_publicacion": 1}
+
+
+def normalizar(texto):
+    """
+    Quita acentos y mayúsculas: "Fracc. Costa Azúl" -> "fracc. costa azul".
+    """
+    texto = unicodedata.normalize("NFKD", str(texto or ""))
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(texto.lower().split())
+
+
+def _palabras(texto):
+    return [p for p in re.findall(r"\w+", normalizar(texto)) if len(p) >= LARGO_MINIMO_PALABRA]
+
+
+def _entradas_de(prop):
+    """
+    Pares (clave, sugerencia) que aporta una propiedad al índice.
+    """
+    entradas = []
+    for tipo in ("colonia", "ciudad"):
+        valor = prop.get(tipo)
+        if not valor:
+            continue
+        sugerencia = (tipo, valor, None)
+        # El nombre completo y cada palabra, para que "azul" encuentre "Costa Azul"
+        claves = {normalizar(valor)} | set(_palabras(valor))
+        entradas.extend((clave, sugerencia) for clave in claves)
+    titulo = prop.get("titulo")
+    if titulo:
+        sugerencia = ("titulo", titulo, str(prop["_id"]))
+        entradas.extend((clave, sugerencia) for clave in set(_palabras(titulo)))
+    return entradas
+
+
+class IndiceAutocompletado(cache_local.Reconstruible):
+    REFRESCO_SEGUNDOS = REFRESCO_SEGUNDOS
+
+    def __init__(self):
+        super().__init__("autocompletado")
+        self._lock = threading.Lock()
+        self._claves = []          # claves únicas, ordenadas
+        self._sugerencias = {}     # clave -> {sugerencia: cuántas propiedades la aportan}
+        self._por_propiedad = {}   # _id -> entradas que aportó
+        self._durante = None       # _id -> prop (o None si se quitó) mientras corre construir()
+
+    def construir(self, db):
+        with self._lock:
+            # Lo que se cree, edite o elimine desde aquí puede no salir en la lectura
+            self._durante = {}
+        sugerencias = {}
+        por_propiedad = {}
+        try:
+            for prop in db.propiedades.find(consultas.FILTRO_PUBLICO, PROYECCION):
+                if prop.get("disponible", True) is False:
+                    continue
+                entradas = _entradas_de(prop)
+                por_propiedad[prop["_id"]] = entradas
+                for clave, sugerencia in entradas:
+                    conteo = sugerencias.setdefault(clave, {})
+                    conteo[sugerencia] = conteo.get(sugerencia, 0) + 1
+        except Exception:
+            with self._lock:
+                self._durante = None
+            raise
+        with self._lock:
+            self._sugerencias = sugerencias
+            self._claves = sorted(sugerencias)
+            self._por_propiedad = por_propiedad
+            for id_propiedad, prop in self._durante.items():
+                self._quitar_sin_lock(id_propiedad)
+                if prop is not None:
+                    self._poner_sin_lock(prop)
+            self._durante = None
+            self._construido_en = time.monotonic()
+
+    def _quitar_sin_lock(self, id_propiedad):
+        for clave, sugerencia in self._por_propiedad.pop(id_propiedad, []):
+            conteo = self._sugerencias.get(clave)
+            if not conteo:
+                continue
+            conteo[sugerencia] -= 1
+            if conteo[sugerencia] <= 0:
+                del conteo[sugerencia]
+            if not conteo:
+                del self._sugerencias[clave]
+                i = bisect.bisect_left(self._claves, clave)
+                if i < len(self._claves) and self._claves[i] == clave:
+                    del self._claves[i]
+
+    def _poner_sin_lock(self, prop):
+        if prop.get("disponible", True) is False or not consultas.es_publica(prop):
+            return
+        entradas = _entradas_de(prop)
+        self._por_propiedad[prop["_id"]] = entradas
+        for clave, sugerencia in entradas:
+            conteo = self._sugerencias.get(clave)
+            if conteo is None:
+                conteo = self._sugerencias[clave] = {}
+                bisect.insort(self._claves, clave)
+            conteo[sugerencia] = conteo.get(sugerencia, 0) + 1
+
+    def actualizar(self, prop):
+        """
+        Agrega o reemplaza las entradas de una propiedad.
+        """
+        with self._lock:
+            if self._durante is not None:
+                self._durante[prop["_id"]] = prop
+            if self._construido_en is None:
+                return
+            self._quitar_sin_lock(prop["_id"])
+            self._poner_sin_lock(prop)
+
+    def quitar(self, id_propiedad):
+        with self._lock:
+            if self._durante is not None:
+                self._durante[id_propiedad] = None
+            self._quitar_sin_lock(id_propiedad)
+
+    def sugerir(self, db, texto, limite=LIMITE_SUGERENCIAS):
+        """
+        Sugerencias cuyo texto tiene alguna palabra que empieza con `texto`.
+        """
+        prefijo = normalizar(texto)
+        if len(prefijo) < LARGO_MINIMO_PREFIJO:
+            return []
+        self._asegurar_construido(db)
+
+        encontradas = {}
+        with self._lock:
+            i = bisect.bisect_left(self._claves, prefijo)
+            # Todas las que coinciden (hasta MAXIMO_CLAVES): el orden por tipo y popularidad va
+            # antes del corte, si no una colonia perdería su lugar ante títulos que van antes
+            # en el alfabeto
+            fin = min(len(self._claves), i + MAXIMO_CLAVES)
+            while i < fin:
+                clave = self._claves[i]
+                if not clave.startswith(prefijo):
+                    break
+                for sugerencia, cuantas in self._sugerencias[clave].items():
+                    encontradas[sugerencia] = max(encontradas.get(sugerencia, 0), cuantas)
+                i += 1
+
+        mejores = heapq.nsmallest(limite, encontradas.items(),
+                                  key=lambda par: (PRIORIDAD[par[0][0]], -par[1], par[0][1]))
+        return [
+            {"tipo": tipo, "texto": texto_sugerencia, "id": id_propiedad, "propiedades": cuantas}
+            for (tipo, texto_sugerencia, id_propiedad), cuantas in mejores
+        ]
+
+
+# Una instancia por worker
+indice_autocompletado = IndiceAutocompletado()
@@ -0,0 +1,115 @@
+"""
+Compara el modo síncrono y el asíncrono (MONGO_ASINCRONO, ver asincrono.py)
+en las rutas de lectura, contra la base configurada en MONGODB_URI.
+
+Cada modo corre en su propio proceso (la app lee la configuración al
+importarse) con N hilos que piden las rutas con el cliente de pruebas de
+Flask, como lo harían los hilos de un worker de gunicorn. Se reportan
+peticiones por segundo, latencia p50/p95 y la memoria máxima del proceso.
+
+Uso:
+    python bench_asincrono.py [--hilos 16] [--peticiones 2000]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))]
+
+
+def correr_modo(hilos, peticiones):
+    """
+    Se ejecuta dentro del proceso hijo: importa la app con el modo del entorno y mide.
+    """
+    from app import app, mongo
+    import consultas
+
+    muestra = mongo.propiedades.find_one(consultas.FILTRO_PUBLICO, {"_id": 1})
+    rutas = ["/buscar?operacion=venta", "/buscar?categoria=casa"]
+    if muestra:
+        rutas.append(f"/propiedad/{muestra['_id']}")
+
+    latencias = []
+    errores = [0]
+    lock = threading.Lock()
+    por_hilo = max(1, peticiones // hilos)
+
+    def trabajar(numero):
+        cliente = app.test_client()
+        propias = []
+        for i in range(por_hilo):
+            ruta = rutas[(numero + i) % len(rutas)]
+            inicio = time.perf_counter()
+            respuesta = cliente.get(ruta)
+            respuesta.get_data()
+            propias.append(time.perf_counter() - inicio)
+            if respuesta.status_code >= 400:
+                with lock:
+                    errores[0] += 1
+        with lock:
+            latencias.extend(propias)
+
+    # Calentamiento: conexiones abiertas y caches llenas en ambos modos
+    cliente = app.test_client()
+    for ruta in rutas:
+        cliente.get(ruta).get_data()
+
+    inicio = time.perf_counter()
+    trabajadores = [threading.Thread(target=trabajar, args=(n,)) for n in range(hilos)]
+    for t in trabajadores:
+        t.start()
+    for t in trabajadores:
+        t.join()
+    duracion = time.perf_counter() - inicio
+
+    return {
+        "peticiones": len(latencias),
+        "errores": errores[0],
+        "por_segundo": len(latencias) / duracion if duracion else 0.0,
+        "p50_ms": _percentil(latencias, 0.50) * 1000,
+        "p95_ms": _percentil(latencias, 0.95) * 1000,
+        # En Linux ru_maxrss viene en KB
+        "rss_max_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del modo de lectura asíncrono.")
+    parser.add_argument("--hilos", type=int, default=16)
+    parser.add_argument("--peticiones", type=int, default=2000)
+    parser.add_argument("--hijo", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.hijo:
+        print(json.dumps(correr_modo(args.hilos, args.peticiones)))
+        return 0
+
+    print(f"{args.hilos} hilos, {args.peticiones} peticiones por modo")
+    print(f"{'modo':<10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'RSS MB':>10}{'errores':>10}")
+    for nombre, valor in (("síncrono", "0"), ("asíncrono", "1")):
+        entorno = {**os.environ, "MONGO_ASINCRONO": valor}
+        salida = subprocess.run(
+            [sys.executable, __file__, "--hijo", "--hilos", str(args.hilos), "--peticiones", str(args.peticiones)],
+            env=entorno, capture_output=True, text=True
+        )
+        if salida.returncode != 0:
+            print(f"Error en modo {nombre}: {salida.stderr.strip()}")
+            return 1
+        r = json.loads(salida.stdout.strip().splitlines()[-1])
+        print(f"{nombre:<10}{r['por_segundo']:>10.1f}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}"
+              f"{r['rss_max_mb']:>10.1f}{r['errores']:>10}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
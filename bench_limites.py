@@ -0,0 +1,76 @@
+"""
+Latencia y exactitud del almacenamiento de límites (ver limites_sqlite.py).
+
+Para cada estrategia (fixed-window, moving-window, sliding-window-counter)
+y cada almacenamiento (memory://, sqlite://) se lanzan P procesos, como
+workers de gunicorn, que golpean el mismo límite. Se reporta la latencia por
+revisión (p50 y p99, en microsegundos) y cuántas peticiones se permitieron en
+total: con memory:// son límite × P, con sqlite:// exactamente el límite.
+
+Uso:
+    python bench_limites.py [--procesos 4] [--revisiones 5000] [--limite 100]
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import STRATEGIES
+import limites_sqlite  # noqa: F401  registra sqlite://
+
+ESTRATEGIAS = ["fixed-window", "moving-window", "sliding-window-counter"]
+
+
+def _trabajar(uri, estrategia, limite, revisiones, salida):
+    limitador = STRATEGIES[estrategia](storage_from_string(uri))
+    # Un límite que nunca se alcanza mide la latencia; otro compartido mide la exactitud
+    libre = parse(f"{revisiones * 10} per hour")
+    compartido = parse(f"{limite} per hour")
+    latencias = []
+    for i in range(revisiones):
+        inicio = time.perf_counter()
+        limitador.hit(libre, "latencia", str(os.getpid()))
+        latencias.append(time.perf_counter() - inicio)
+    permitidas = sum(limitador.hit(compartido, "compartido") for _ in range(limite * 2))
+    latencias.sort()
+    salida.put((latencias[len(latencias) // 2], latencias[int(len(latencias) * 0.99)], permitidas))
+
+
+def medir(uri, estrategia, procesos, revisiones, limite):
+    salida = multiprocessing.Queue()
+    hijos = [multiprocessing.Process(target=_trabajar, args=(uri, estrategia, limite, revisiones, salida))
+             for _ in range(procesos)]
+    for h in hijos:
+        h.start()
+    resultados = [salida.get() for _ in hijos]
+    for h in hijos:
+        h.join()
+    p50 = sorted(r[0] for r in resultados)[len(resultados) // 2]
+    p99 = max(r[1] for r in resultados)
+    return p50 * 1e6, p99 * 1e6, sum(r[2] for r in resultados)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del almacenamiento de límites.")
+    parser.add_argument("--procesos", type=int, default=4)
+    parser.add_argument("--revisiones", type=int, default=5000)
+    parser.add_argument("--limite", type=int, default=100)
+    args = parser.parse_args()
+
+    print(f"{args.procesos} procesos, {args.revisiones} revisiones cada uno, límite compartido {args.limite}")
+    print(f"{'almacenamiento':<16}{'estrategia':<24}{'p50 µs':>10}{'p99 µs':>10}{'permitidas':>12}")
+    with tempfile.TemporaryDirectory() as carpeta:
+        for estrategia in ESTRATEGIAS:
+            for nombre, uri in (("memory", "memory://"),
+                                ("sqlite", f"sqlite:///{os.path.join(carpeta, estrategia + '.db')}")):
+                if nombre == "sqlite":
+                    # El esquema se crea una vez antes de lanzar los procesos
+                    storage_from_string(uri)
+                p50, p99, permitidas = medir(uri, estrategia, args.procesos, args.revisiones, args.limite)
+                print(f"{nombre:<16}{estrategia:<24}{p50:>10.1f}{p99:>10.1f}{permitidas:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Búsquedas guardadas y el feed de "novedades para ti".
+
+Cada búsqueda guarda sus criterios (los mismos de /buscar, ver
+consultas.criterios_busqueda) y una lista de claves "ciudad|colonia|tipo|operacion"
+donde un criterio vacío es el comodín "*". El campo claves tiene un índice
+multikey: es un índice invertido de las búsquedas.
+
+Cuando una propiedad se aprueba, se arman las 8 claves que puede cumplir
+(cada dimensión con su valor o con "*") y un solo find con $in sobre ese
+índice devuelve las búsquedas candidatas; solo la palabra clave se revisa
+en Python. El costo depende de cuántas búsquedas coinciden, no de cuántas
+hay guardadas, y nunca se vuelve a correr una búsqueda contra propiedades.
+"""
+import itertools
+import re
+from datetime import datetime
+from pymongo.errors import BulkWriteError
+import consultas
+
+COMODIN = "*"
+MAXIMO_POR_USUARIO = 20
+LIMITE_NOVEDADES = 60
+
+
+def _clave(ciudad, colonia, tipo, operacion):
+    return "|".join((ciudad or COMODIN, colonia or COMODIN, tipo or COMODIN, operacion or COMODIN)).lower()
+
+
+def claves_de_criterios(criterios):
+    """
+    Claves que indexan una búsqueda. "Más propiedades" son tres tipos, así que tres claves.
+    """
+    if criterios["categoria"]:
+        tipos = [criterios["categoria"]]
+    elif criterios["extra"] == "mas":
+        tipos = consultas.TIPOS_MAS
+    else:
+        tipos = [None]
+    colonia = criterios["localizacion"].strip()
+    return [_clave(consultas.CIUDAD_BUSQUEDA, colonia, tipo, criterios["operacion"]) for tipo in tipos]
+
+
+def claves_de_propiedad(prop):
+    """
+    Las claves de todas las búsquedas que podrían incluir a la propiedad.
+    """
+    opciones = [
+        [prop.get("colonia"), None],
+        [prop.get("tipo_propiedad"), None],
+        [prop.get("tipo_operacion"), None],
+    ]
+    return list({_clave(prop.get("ciudad"), *combinacion) for combinacion in itertools.product(*opciones)})
+
+
+def _coincide_keyword(keyword, prop):
+    """
+    Igual que el $regex de /buscar sobre título o descripción.
+    """
+    if not keyword:
+        return True
+    try:
+        patron = re.compile(keyword, re.IGNORECASE)
+    except re.error:
+        patron = re.compile(re.escape(keyword), re.IGNORECASE)
+    return any(patron.search(prop.get(campo) or "") for campo in ("titulo", "descripcion"))
+
+
+def guardar(db, id_usuario, criterios, nombre=None):
+    """
+    Guarda una búsqueda. Devuelve False si el usuario ya tiene el máximo.
+    Guardar dos veces los mismos criterios no crea otra (solo le cambia el
+    nombre), y eso se permite aunque el usuario ya tenga el máximo.
+    """
+    filtro = {"id_usuario": id_usuario, "criterios": criterios}
+    cambios = {"$set": {"nombre": nombre or describir(criterios), "claves": claves_de_criterios(criterios)}}
+    if db.busquedas_guardadas.update_one(filtro, cambios).matched_count:
+        return True
+    if db.busquedas_guardadas.count_documents({"id_usuario": id_usuario}) >= MAXIMO_POR_USUARIO:
+        return False
+    db.busquedas_guardadas.update_one(
+        filtro, {**cambios, "$setOnInsert": {"fecha_creacion": datetime.utcnow()}}, upsert=True
+    )
+    return True
+
+
+def describir(criterios):
+    partes = [criterios["categoria"] or ("más propiedades" if criterios["extra"] == "mas" else "propiedades")]
+    if criterios["operacion"]:
+        partes.append(f"en {criterios['operacion']}")
+    if criterios["localizacion"]:
+        partes.append(f"en {criterios['localizacion']}")
+    if criterios["keyword"]:
+        partes.append(f"con \"{criterios['keyword']}\"")
+    return " ".join(partes).capitalize()
+
+
+def de_usuario(db, id_usuario):
+    return list(db.busquedas_guardadas.find({"id_usuario": id_usuario}).sort("fecha_creacion", -1))
+
+
+def eliminar(db, id_usuario, id_busqueda):
+    db.busquedas_guardadas.delete_one({"_id": id_busqueda, "id_usuario": id_usuario})
+    db.novedades.delete_many({"id_usuario": id_usuario, "id_busqueda": id_busqueda})
+
+
+def notificar(db, props):
+    """
+    Agrega al feed de cada usuario las propiedades recién aprobadas que
+    cumplen alguna de sus búsquedas. Devuelve cuántas novedades se crearon.
+    """
+    ahora = datetime.utcnow()
+    nuevas = {}
+    for prop in props:
+        candidatas = db.busquedas_guardadas.find(
+            {"claves": {"$in": claves_de_propiedad(prop)}},
+            {"id_usuario": 1, "criterios.keyword": 1}
+        )
+        for busqueda in candidatas:
+            clave = (busqueda["id_usuario"], prop["_id"])
+            # Una novedad por usuario y propiedad aunque coincidan varias de sus búsquedas
+            if clave in nuevas or busqueda["id_usuario"] == prop.get("id_propietario"):
+                continue
+            if _coincide_keyword(busqueda.get("criterios", {}).get("keyword"), prop):
+                nuevas[clave] = {
+                    "id_usuario": busqueda["id_usuario"],
+                    "id_propiedad": prop["_id"],
+                    "id_busqueda": busqueda["_id"],
+                    "fecha": ahora,
+                    "visto": False
+                }
+    if not nuevas:
+        return 0
+    try:
+        return len(db.novedades.insert_many(list(nuevas.values()), ordered=False).inserted_ids)
+    except BulkWriteError as e:
+        # El índice único (usuario, propiedad) descarta las que ya estaban en el feed
+        return e.details.get("nInserted", 0)
+
+
+def novedades(db, id_usuario, limite=LIMITE_NOVEDADES):
+    """
+    Las propiedades más recientes del feed del usuario (solo las que siguen
+    publicadas) y cuántas no había visto. Las marca como vistas.
+    """
+    entradas = list(db.novedades.find({"id_usuario": id_usuario}).sort("fecha", -1).limit(limite))
+    ids = [e["_id"] for e in entradas if not e.get("visto")]
+    if ids:
+        db.novedades.update_many({"_id": {"$in": ids}}, {"$set": {"visto": True}})
+    ids_propiedades = [e["id_propiedad"] for e in entradas]
+    por_id = {p["_id"]: p for p in consultas.con_imagen_principal(db.propiedades.find(
+        {"_id": {"$in": ids_propiedades}, **consultas.FILTRO_PUBLICO}, consultas.PROYECCION_TARJETA
+    ))}
+    return [por_id[i] for i in ids_propiedades if i in por_id], len(ids)
+
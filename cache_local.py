@@ -0,0 +1,166 @@
+"""
+Cache LRU en memoria, por proceso (cada worker de gunicorn tiene el suyo).
+
+Guarda documentos muy leídos y que cambian poco para no ir a MongoDB en cada
+visita. El tamaño está acotado (se desaloja lo menos usado) y cada entrada
+caduca después de su TTL, así que lo que se edite desde otro worker se ve a
+más tardar al vencer el TTL.
+
+Los valores guardados se comparten entre peticiones: no se deben modificar.
+
+Reconstruible es la base de los índices en memoria que se rehacen desde
+MongoDB cada cierto tiempo (recomendador, autocompletado, destacadas): al
+vencer se sigue sirviendo la versión anterior mientras un solo hilo en
+segundo plano la reconstruye.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheLRU:
+    def __init__(self, nombre, capacidad=1000, ttl=300):
+        self.nombre = nombre
+        self.capacidad = capacidad
+        self.ttl = ttl
+        self._datos = OrderedDict()  # clave -> (vence_en, valor)
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+
+    def obtener(self, clave):
+        """
+        Devuelve el valor guardado o None si no está o ya caducó.
+        """
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            vence_en, valor = entrada
+            if vence_en < time.monotonic():
+                del self._datos[clave]
+                self.fallos += 1
+                return None
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return valor
+
+    def guardar(self, clave, valor):
+        if valor is None:
+            return
+        with self._lock:
+            self._datos[clave] = (time.monotonic() + self.ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.capacidad:
+                self._datos.popitem(last=False)
+                self.desalojos += 1
+
+    def obtener_o_cargar(self, clave, cargar):
+        """
+        Devuelve el valor guardado o lo carga con cargar() y lo guarda.
+        """
+        valor = self.obtener(clave)
+        if valor is None:
+            valor = cargar()
+            self.guardar(clave, valor)
+        return valor
+
+    def invalidar(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+    def estadisticas(self):
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {
+                "nombre": self.nombre,
+                "entradas": len(self._datos),
+                "capacidad": self.capacidad,
+                "ttl_segundos": self.ttl,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "desalojos": self.desalojos,
+                "tasa_aciertos": round(self.aciertos / total, 3) if total else 0.0
+            }
+
+
+class Reconstruible:
+    """
+    Base para un índice por worker que se rehace completo con construir(db).
+
+    La subclase define construir(db), que al terminar pone _construido_en =
+    time.monotonic(), y REFRESCO_SEGUNDOS. _asegurar_construido(db) se llama en
+    cada uso:
+      - si nunca se construyó, lo construye ahí mismo (no hay nada que servir);
+        si varios hilos llegan a la vez, solo uno recorre la colección;
+      - si ya venció, lanza la reconstrucción en un hilo y regresa de
+        inmediato: la petición usa los datos anteriores y nadie la espera.
+    Nunca hay dos reconstrucciones a la vez en el mismo worker.
+    """
+    REFRESCO_SEGUNDOS = 600
+    _construido_en = None
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+        self._reconstruyendo = threading.Lock()
+
+    def precalentar(self, db):
+        """
+        Construye ahora si nunca se construyó (ver arranque.py). Usa el mismo
+        candado que el primer uso: una petición que llegue mientras tanto
+        espera esta construcción en vez de repetirla.
+        """
+        with self._reconstruyendo:
+            if self._construido_en is None:
+                self.construir(db)
+
+    def invalidar(self):
+        """
+        Pide una reconstrucción en el siguiente uso, sin dejar de servir los datos actuales.
+        """
+        if self._construido_en is not None:
+            self._construido_en = float("-inf")
+
+    def _vencido(self):
+        return time.monotonic() - self._construido_en > self.REFRESCO_SEGUNDOS
+
+    def _asegurar_construido(self, db):
+        if self._construido_en is None:
+            with self._reconstruyendo:
+                if self._construido_en is None:
+                    self.construir(db)
+            return
+        if self._vencido() and self._reconstruyendo.acquire(blocking=False):
+            hilo = threading.Thread(target=self._reconstruir_en_fondo, args=(db,),
+                                    name=f"reconstruir-{self.nombre}", daemon=True)
+            try:
+                hilo.start()
+            except Exception:
+                self._reconstruyendo.release()
+                raise
+
+    def _reconstruir_en_fondo(self, db):
+        try:
+            if self._vencido():
+                self.construir(db)
+        except Exception as e:
+            print(f"Error reconstruyendo {self.nombre}: {e}")
+        finally:
+            self._reconstruyendo.release()
+
+
+# Documentos de propiedades (página de detalle)
+propiedades = CacheLRU("propiedades", capacidad=2000, ttl=120)
+
+# Tarjeta del propietario que se muestra en el detalle (ya armada para el HTML)
+propietarios = CacheLRU("propietarios", capacidad=2000, ttl=600)
+
+
+def estadisticas():
+    return [propiedades.estadisticas(), propietarios.estadisticas()]
@@ -0,0 +1,23 @@
+"""
+Clientes compartidos del proceso web: un solo MongoClient para app.py y
+app_publicaciones.py, y la configuración de Cloudinary.
+
+Importar este módulo no abre sockets ni hilos: el MongoClient se crea con
+connect=False y se conecta con la primera consulta. Así gunicorn puede
+importar la app en el maestro (--preload) y hacer fork sin que los workers
+hereden conexiones abiertas; cada uno conecta al usarlo (ver arranque.py).
+"""
+import cloudinary
+from pymongo import MongoClient
+from config import Config
+
+client = MongoClient(Config.MONGODB_URI, connect=False)
+db = client["HomiDB"]
+
+# Solo guarda credenciales en memoria; el pool HTTP de Cloudinary se abre al subir
+cloudinary.config(
+    cloud_name = Config.CLOUDINARY_CLOUD_NAME,
+    api_key = Config.CLOUDINARY_API_KEY,
+    api_secret = Config.CLOUDINARY_API_SECRET,
+    secure = True
+)
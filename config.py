@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -12,4 +13,14 @@ class Config:
     MONGODB_URI = os.getenv("MONGODB_URI")
     CLOUDINARY_CLOUD_NAME = os.getenv("CLOUDINARY_CLOUD_NAME")
     CLOUDINARY_API_KEY = os.getenv("CLOUDINARY_API_KEY")
-    CLOUDINARY_API_SECRET = os.getenv("CLOUDINARY_API_SECRET")
\ No newline at end of file
+    CLOUDINARY_API_SECRET = os.getenv("CLOUDINARY_API_SECRET")
+    # Lecturas con el driver asíncrono de MongoDB en buscar y detalle (ver asincrono.py)
+    MONGO_ASINCRONO = os.getenv("MONGO_ASINCRONO") == "1"
+    # Límites de peticiones compartidos por los workers del host (ver limites_sqlite.py)
+    RATELIMIT_STORAGE_URI = os.getenv("RATELIMIT_STORAGE_URI", f"sqlite:///{os.path.join(tempfile.gettempdir(), 'homi_limites.db')}")
+    RATELIMIT_STRATEGY = os.getenv("RATELIMIT_STRATEGY", "fixed-window")
+    # Hash de contraseñas en un pool de procesos acotado (ver contrasenas.py)
+    BCRYPT_COSTO = int(os.getenv("BCRYPT_COSTO", "0")) or None
+    HASH_PROCESOS = int(os.getenv("HASH_PROCESOS", "2"))
+    HASH_MAXIMO_EN_COLA = int(os.getenv("HASH_MAXIMO_EN_COLA", "16"))
+    HASH_OBJETIVO_MS = int(os.getenv("HASH_OBJETIVO_MS", "250"))
@@ -1,42 +1,183 @@
+import hashlib
+from datetime import datetime, timezone
 from bson.objectid import ObjectId
+import cache_local
 
-def obtener_propiedades_destacadas(db, limite=9):
+
+# --- IDS CANÓNICOS ---
+# Todos los ids de referencia (id_propietario, id_propiedad, favoritos) se guardan
+# como ObjectId. Las rutas convierten el texto de la URL UNA sola vez con
+# a_object_id() y las funciones de acceso a datos solo aceptan la forma canónica,
+# así cada búsqueda es un solo predicado que puede usar índice.
+
+def a_object_id(valor):
     """
-    Obtiene las propiedades más recientes publicadas en la plataforma.
+    Convierte un id recibido (texto de la URL o de la sesión) a ObjectId.
+    Lanza bson.errors.InvalidId si el texto no es un id válido.
     """
-    try:
-        # 1. Cambiamos db.Propiedades por db.propiedades (minúscula)
-        # 2. Quitamos el filtro {"estado_publicacion": "aprobada"} dejándolo como {} para traer TODAS
-        # 3. Ordenamos por "_id" descendente (-1) para traer siempre las más nuevas primero
-        propiedades_cursor = db.propiedades.find({}).sort("_id", -1).limit(limite)
-
-        propiedades_lista = []
-        for prop in propiedades_cursor:
-            imagen_principal = ""
-            
-            # Verificamos si tiene imágenes
-            if "imagenes" in prop and len(prop["imagenes"]) > 0:
-                # Buscamos si alguna está marcada como principal
-                for img in prop["imagenes"]:
-                    if isinstance(img, dict) and img.get("es_principal", False):
-                        imagen_principal = img.get("url_imagen", "")
-                        break
-                
-                # Si no hay principal, tomamos la primera
-                if not imagen_principal:
-                    primera_img = prop["imagenes"][0]
-                    # Soporta si guardaste la imagen como Diccionario o como Texto directo
-                    imagen_principal = primera_img.get("url_imagen", "") if isinstance(primera_img, dict) else primera_img
-            
-            # Guardamos la url para que el HTML la pueda leer fácilmente
-            prop["imagen_principal_url"] = imagen_principal
-            propiedades_lista.append(prop)
-            
-        return propiedades_lista
-    
-    except Exception as e:
-        print(f"Error al obtener propiedades destacadas: {e}")
-        return []
+    if isinstance(valor, ObjectId):
+        return valor
+    return ObjectId(str(valor))
+
+def _exigir_object_id(valor, campo):
+    if not isinstance(valor, ObjectId):
+        raise TypeError(f"{campo} debe ser ObjectId, se recibió {type(valor).__name__}")
+    return valor
+
+def propiedades_por_propietario(db, id_propietario, proyeccion=None):
+    """
+    Cursor con las propiedades de un proveedor.
+    """
+    _exigir_object_id(id_propietario, "id_propietario")
+    return db.propiedades.find({"id_propietario": id_propietario}, proyeccion)
+
+def propiedad_de_propietario(db, id_propiedad, id_propietario):
+    """
+    Obtiene una propiedad solo si pertenece al proveedor indicado.
+    """
+    _exigir_object_id(id_propiedad, "id_propiedad")
+    _exigir_object_id(id_propietario, "id_propietario")
+    return db.propiedades.find_one({"_id": id_propiedad, "id_propietario": id_propietario})
+
+def resenas_de_propiedades(db, ids_propiedades, limite=0):
+    """
+    Reseñas visibles de una o varias propiedades, de la más reciente a la más antigua.
+    """
+    ids = [_exigir_object_id(i, "id_propiedad") for i in ids_propiedades]
+    filtro = {"id_propiedad": ids[0]} if len(ids) == 1 else {"id_propiedad": {"$in": ids}}
+    filtro["esta_eliminado"] = {"$ne": True}
+    return db.resenas.find(filtro).sort("fecha_resena", -1).limit(limite)
+
+# --- VERSIÓN DE LA PÁGINA DE DETALLE ---
+# Campos de la propiedad que cambian cuando cambia lo que se muestra en su página.
+# "visitas" no cuenta: se incrementa en cada visita y no se muestra.
+CAMPOS_VERSION = {"fecha_publicacion": 1, "fecha_actualizacion": 1, "resumen_resenas": 1}
+
+def marca_version(doc):
+    """
+    (fecha, resumen_resenas) de la versión de una propiedad. La fecha es la de
+    la última edición; los documentos que nunca se editaron no tienen
+    fecha_actualizacion y usan la de publicación o la de su _id.
+    """
+    fecha = doc.get("fecha_actualizacion") or doc.get("fecha_publicacion") or doc["_id"].generation_time
+    return fecha, doc.get("resumen_resenas")
+
+
+def version_propiedad(doc, fecha_mercado=None):
+    """
+    Calcula (etag, ultima_modificacion) de la página de una propiedad a partir
+    de los CAMPOS_VERSION de su documento. fecha_mercado es el fecha_calculo de
+    las estadísticas de su grupo: la insignia de precio cambia con ellas.
+    """
+    fecha, resumen = marca_version(doc)
+    resumen = resumen or {}
+    ultima_resena = resumen.get("ultima")
+    fecha = fecha.replace(tzinfo=timezone.utc, microsecond=0)
+    for otra in (ultima_resena, fecha_mercado):
+        if otra:
+            fecha = max(fecha, otra.replace(tzinfo=timezone.utc, microsecond=0))
+    firma = f"{doc['_id']}:{doc.get('fecha_actualizacion')}:{resumen.get('total', 0)}:{ultima_resena}:{fecha_mercado}"
+    etag = hashlib.sha1(firma.encode("utf-8")).hexdigest()[:20]
+    return etag, fecha
+
+# --- MODERACIÓN ---
+# Las páginas públicas solo muestran propiedades aprobadas por un admin (ver moderacion.py)
+ESTADO_PUBLICO = "aprobada"
+FILTRO_PUBLICO = {"estado_publicacion": ESTADO_PUBLICO}
+
+def es_publica(prop):
+    return prop.get("estado_publicacion") == ESTADO_PUBLICO
+
+# --- BÚSQUEDA ---
+# Criterios de /buscar (los mismos que se guardan en busquedas_guardadas)
+CIUDAD_BUSQUEDA = "Acapulco"
+TIPOS_MAS = ["condominio", "local", "terreno"]
+
+def criterios_busqueda(args):
+    """
+    Lee los criterios de búsqueda de request.args (o de un dict guardado).
+    """
+    return {
+        "categoria": (args.get("categoria") or "").lower(),
+        "localizacion": args.get("localizacion") or "",
+        "keyword": args.get("keyword") or "",
+        "operacion": (args.get("operacion") or "").lower(),
+        "extra": args.get("extra") or ""
+    }
+
+def filtro_busqueda(criterios):
+    """
+    Filtro de MongoDB para unos criterios de búsqueda.
+    """
+    # Filtro base: solo Acapulco y solo propiedades aprobadas
+    filtro = {**FILTRO_PUBLICO, "ciudad": CIUDAD_BUSQUEDA}
+
+    # Venta / Renta
+    if criterios["operacion"]:
+        filtro["tipo_operacion"] = criterios["operacion"]
+
+    # Categoría
+    if criterios["categoria"]:
+        filtro["tipo_propiedad"] = criterios["categoria"]
+
+    # Más propiedades (solo si NO hay categoría)
+    if criterios["extra"] == "mas" and not criterios["categoria"]:
+        filtro["tipo_propiedad"] = {"$in": TIPOS_MAS}
+
+    # Colonia
+    if criterios["localizacion"]:
+        filtro["colonia"] = {"$regex": f"^{criterios['localizacion']}$", "$options": "i"}
+
+    # Keyword (titulo o descripcion)
+    if criterios["keyword"]:
+        filtro["$or"] = [
+            {"titulo": {"$regex": criterios["keyword"], "$options": "i"}},
+            {"descripcion": {"$regex": criterios["keyword"], "$options": "i"}}
+        ]
+    return filtro
+
+# Campos que usan las tarjetas de propiedad en los listados (solo la primera imagen)
+PROYECCION_TARJETA = {
+    "titulo": 1,
+    "colonia": 1,
+    "numero_habitaciones": 1,
+    "numero_banos": 1,
+    "superficie_m2": 1,
+    "tipo_operacion": 1,
+    "precio": 1,
+    "imagenes": {"$slice": 1}
+}
+
+def con_imagen_principal(cursor, imagen_defecto=""):
+    """
+    Recorre el cursor agregando imagen_principal_url a cada propiedad, sin
+    cargar toda la lista en memoria.
+    """
+    for p in cursor:
+        imagen_principal = ""
+        if p.get("imagenes"):
+            primera_img = p["imagenes"][0]
+            # La imagen puede estar guardada como diccionario o como texto (URL directa)
+            imagen_principal = primera_img.get("url_imagen", "") if isinstance(primera_img, dict) else primera_img
+        p["imagen_principal_url"] = imagen_principal or imagen_defecto
+        yield p
+
+PROYECCION_TARJETA_PROPIA = {**PROYECCION_TARJETA, "estado_publicacion": 1}
+
+def pagina_de_propietario(db, id_propietario, despues=None, limite=12):
+    """
+    Una página de las propiedades de un proveedor, las más recientes primero,
+    paginada por _id (índice propietario). Devuelve (propiedades, cursor de la
+    siguiente página o None).
+    """
+    _exigir_object_id(id_propietario, "id_propietario")
+    filtro = {"id_propietario": id_propietario}
+    if despues is not None:
+        filtro["_id"] = {"$lt": despues}
+    cursor = db.propiedades.find(filtro, PROYECCION_TARJETA_PROPIA).sort("_id", -1).limit(limite + 1)
+    pagina = list(con_imagen_principal(cursor))
+    siguiente = pagina[limite - 1]["_id"] if len(pagina) > limite else None
+    return pagina[:limite], siguiente
 
 def obtener_usuario_por_id(db, user_id):
     """
@@ -46,4 +187,52 @@ def obtener_usuario_por_id(db, user_id):
         return db.Usuarios.find_one({"_id": ObjectId(user_id)})
     except Exception as e:
         print(f"Error al obtener usuario: {e}")
-        return None
\ No newline at end of file
+        return None
+
+def tarjeta_propietario(db, id_propietario):
+    """
+    Datos del propietario que se muestran en la página de detalle.
+    """
+    propietario = db.usuarios.find_one({"_id": id_propietario}) if id_propietario else None
+    return armar_tarjeta_propietario(propietario)
+
+def tocar_propiedades_de(db, id_propietario):
+    """
+    Llamar después de cambiar cualquier dato que sale en la tarjeta del
+    propietario: sus páginas de detalle cambian de versión (ETag y cache de
+    los workers) y se descarta su tarjeta cacheada en este worker.
+    """
+    db.propiedades.update_many({"id_propietario": id_propietario}, {"$set": {"fecha_actualizacion": datetime.utcnow()}})
+    cache_local.propietarios.invalidar(id_propietario)
+
+def armar_tarjeta_propietario(propietario):
+    """
+    Tarjeta del propietario a partir de su documento de usuario (o None).
+    """
+    if propietario:
+        return {
+            "nombre": f"{propietario.get('nombre', 'Anfitrión')} {propietario.get('primer_apellido', '')}",
+            "nombre_raw": propietario.get("nombre", "U"), # Para sacar la letra inicial
+            "telefono": propietario.get("telefono", "No disponible"),
+            "correo": propietario.get("correo_electronico", ""),
+            "fecha_registro": propietario.get("_id").generation_time.strftime('%Y'),
+            "foto": propietario.get("foto_perfil", ""), # Obtiene la URL de Cloudinary si existe
+            "url_facebook": propietario.get("url_facebook", ""),
+            "url_instagram": propietario.get("url_instagram", ""),
+            "url_whatsapp": propietario.get("url_whatsapp", "")
+        }
+    else:
+        return {
+            "nombre": "Usuario Desconocido",
+            "nombre_raw": "U",
+            "telefono": "---",
+            "foto": ""
+        }
+
+# Campos del autor que se muestran junto a cada reseña
+PROYECCION_AUTOR = {"nombre": 1, "primer_apellido": 1}
+
+def nombre_de_autor(usuario):
+    if not usuario:
+        return "Usuario Anónimo"
+    return f"{usuario.get('nombre', 'Usuario')} {usuario.get('primer_apellido', '')}"
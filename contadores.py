@@ -0,0 +1,38 @@
+"""
+Contadores guardados en el documento del usuario: total_publicaciones y
+total_favoritos. El perfil los lee con el mismo find_one del usuario, sin
+contar nada.
+
+Se mantienen con $inc donde cambian (publicar, importar, eliminar, alternar
+favorito, limpieza). El $inc solo se aplica si el contador ya existe: los
+usuarios anteriores a los contadores (o cuyo contador se invalidó con
+$unset) lo calculan una vez la próxima vez que se lee, con de_usuario().
+"""
+
+CALCULOS = {
+    "total_publicaciones": lambda db, id_usuario: db.propiedades.count_documents({"id_propietario": id_usuario}),
+    "total_favoritos": lambda db, id_usuario: next(db.usuarios.aggregate([
+        {"$match": {"_id": id_usuario}},
+        {"$project": {"total": {"$size": {"$ifNull": ["$favoritos", []]}}}}
+    ]), {}).get("total", 0),
+}
+
+
+def de_usuario(db, usuario):
+    """
+    Los contadores de un documento de usuario ya leído; calcula y guarda los que falten.
+    """
+    valores = {}
+    faltantes = {}
+    for campo, calcular in CALCULOS.items():
+        if campo in usuario:
+            valores[campo] = usuario[campo]
+        else:
+            faltantes[campo] = valores[campo] = calcular(db, usuario["_id"])
+    if faltantes:
+        db.usuarios.update_one({"_id": usuario["_id"]}, {"$set": faltantes})
+    return valores
+
+
+def sumar(db, id_usuario, campo, cantidad=1):
+    db.usuarios.update_one({"_id": id_usuario, campo: {"$exists": True}}, {"$inc": {campo: cantidad}})
@@ -0,0 +1,209 @@
+"""
+Servicio de hash de contraseñas.
+
+bcrypt gasta cientos de milisegundos de CPU por llamada. Hecho dentro del
+hilo de la petición, una ráfaga de logins acapara el worker y frena las demás
+páginas. Aquí el hash y la verificación corren en un pool de procesos
+dedicado y acotado (HASH_PROCESOS); si ya hay HASH_MAXIMO_EN_COLA trabajos en
+espera, la petición se rechaza de inmediato con ServicioSaturado en lugar de
+hacer cola sin límite.
+
+El costo (log rounds) se elige al arrancar midiendo cuánto tarda un hash en
+este equipo: el mayor que no pase de HASH_OBJETIVO_MS, nunca menor que
+COSTO_MINIMO. BCRYPT_COSTO en el entorno lo fija a mano. Los hashes con un
+costo menor al vigente se rehacen en segundo plano tras un login correcto.
+
+Los procesos del pool no se crean con fork desde el worker: este ya tiene
+hilos de peticiones, de pymongo y de fondo, y un fork mientras alguno tiene
+un candado tomado puede dejar al hijo colgado. Se usa forkserver (spawn donde
+no existe), y el pool se arranca en arranque.py, después del fork de
+gunicorn, no en el primer login. Si un proceso del pool muere (por ejemplo
+por el OOM killer) el pool queda roto: se crea uno nuevo y se reintenta una vez.
+
+Los hashes son los mismos de Flask-Bcrypt ($2b$), así que los existentes
+siguen funcionando.
+
+Ver los tiempos de cada costo en este equipo:
+    python contrasenas.py calibrar
+"""
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import bcrypt
+
+COSTO_MINIMO = 12       # el de Flask-Bcrypt: ningún hash nuevo es más débil que los de antes
+COSTO_MAXIMO = 15
+COSTO_MEDICION = 10
+TIEMPO_MAXIMO = 10      # segundos que una petición espera su hash
+
+# Servicios creados en este proceso, para arrancar sus pools después del fork (iniciar_pools)
+_servicios = []
+
+
+class ServicioSaturado(Exception):
+    """
+    El pool de hash tiene la cola llena: hay que reintentar más tarde.
+    """
+
+
+def _hashear(contrasena, costo):
+    return bcrypt.hashpw(contrasena.encode("utf-8"), bcrypt.gensalt(costo, prefix=b"2b")).decode("utf-8")
+
+
+def _verificar(hash_guardado, contrasena):
+    try:
+        return bcrypt.checkpw(contrasena.encode("utf-8"), hash_guardado.encode("utf-8"))
+    except ValueError:
+        # Hash con formato inválido
+        return False
+
+
+def costo_de(hash_guardado):
+    """
+    Log rounds de un hash "$2b$12$...", o 0 si no se puede leer.
+    """
+    try:
+        return int(hash_guardado.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return 0
+
+
+def _contexto():
+    metodos = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in metodos else "spawn")
+
+
+def iniciar_pools():
+    """
+    Arranca el pool de cada servicio en este proceso (ver arranque.py).
+    """
+    for servicio in _servicios:
+        servicio.iniciar()
+
+
+def calibrar_costo(objetivo_ms, minimo=COSTO_MINIMO, maximo=COSTO_MAXIMO):
+    """
+    El mayor costo cuyo hash tarda como mucho objetivo_ms en este equipo.
+    Se mide un costo bajo y se extrapola: cada punto de costo duplica el tiempo.
+    """
+    inicio = time.perf_counter()
+    _hashear("calibracion", COSTO_MEDICION)
+    ms = (time.perf_counter() - inicio) * 1000
+    costo = minimo
+    while costo < maximo and ms * 2 ** (costo + 1 - COSTO_MEDICION) <= objetivo_ms:
+        costo += 1
+    return costo
+
+
+class ServicioContrasenas:
+    def __init__(self, procesos=2, maximo_en_cola=16, costo=None, objetivo_ms=250):
+        self.procesos = procesos
+        self.maximo_en_cola = maximo_en_cola
+        self.costo = costo or calibrar_costo(objetivo_ms)
+        self._lugares = threading.BoundedSemaphore(maximo_en_cola)
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+        _servicios.append(self)
+
+    def _ejecutor(self):
+        # Un pool por proceso: tras el fork de gunicorn cada worker abre el suyo
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                self._pool = ProcessPoolExecutor(self.procesos, mp_context=_contexto())
+                self._pid = os.getpid()
+            return self._pool
+
+    def iniciar(self):
+        """
+        Crea el pool de este proceso y espera a que su primer proceso responda.
+        """
+        self._ejecutor().submit(costo_de, "").result(TIEMPO_MAXIMO)
+
+    def _reemplazar(self, roto):
+        with self._lock:
+            # Si otro hilo ya lo reemplazó no se hace nada
+            if self._pool is roto:
+                print("El pool de contraseñas está roto (murió uno de sus procesos); se crea uno nuevo")
+                roto.shutdown(wait=False, cancel_futures=True)
+                self._pool = ProcessPoolExecutor(self.procesos, mp_context=_contexto())
+
+    def _enviar(self, pool, funcion, *args):
+        if not self._lugares.acquire(blocking=False):
+            raise ServicioSaturado()
+        try:
+            futuro = pool.submit(funcion, *args)
+        except Exception:
+            self._lugares.release()
+            raise
+        futuro.add_done_callback(lambda _: self._lugares.release())
+        return futuro
+
+    def _esperar(self, funcion, *args):
+        for intento in range(2):
+            pool = self._ejecutor()
+            try:
+                return self._enviar(pool, funcion, *args).result(TIEMPO_MAXIMO)
+            except TimeoutError:
+                raise ServicioSaturado()
+            except BrokenProcessPool:
+                self._reemplazar(pool)
+                if intento:
+                    raise
+
+    def generar(self, contrasena):
+        return self._esperar(_hashear, contrasena, self.costo)
+
+    def verificar(self, hash_guardado, contrasena):
+        if not hash_guardado or not contrasena:
+            return False
+        return self._esperar(_verificar, hash_guardado, contrasena)
+
+    def necesita_rehash(self, hash_guardado):
+        # Solo se sube el costo: bajar la política no debilita los hashes existentes
+        return costo_de(hash_guardado) < self.costo
+
+    def rehash_en_segundo_plano(self, db, usuario, contrasena):
+        """
+        Rehace el hash del usuario con el costo vigente sin hacer esperar al login.
+        Si el pool está lleno se deja para el siguiente login.
+        """
+        hash_anterior = usuario["contrasena"]
+        pool = self._ejecutor()
+        try:
+            futuro = self._enviar(pool, _hashear, contrasena, self.costo)
+        except ServicioSaturado:
+            return
+        except BrokenProcessPool:
+            self._reemplazar(pool)
+            return
+
+        def guardar(f):
+            try:
+                # Solo si nadie cambió la contraseña mientras tanto
+                db.usuarios.update_one({"_id": usuario["_id"], "contrasena": hash_anterior},
+                                       {"$set": {"contrasena": f.result()}})
+            except Exception as e:
+                print(f"Error actualizando el hash de la contraseña: {e}")
+        futuro.add_done_callback(guardar)
+
+
+def main(argv):
+    if len(argv) < 2 or argv[1] != "calibrar":
+        print("Uso: python contrasenas.py calibrar [objetivo_ms]")
+        return 2
+    objetivo_ms = float(argv[2]) if len(argv) > 2 else 250
+    for costo in range(COSTO_MEDICION, COSTO_MAXIMO + 1):
+        inicio = time.perf_counter()
+        _hashear("calibracion", costo)
+        print(f"costo {costo}: {(time.perf_counter() - inicio) * 1000:.0f} ms")
+    print(f"Costo elegido para {objetivo_ms:.0f} ms: {calibrar_costo(objetivo_ms)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
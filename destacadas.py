@@ -0,0 +1,159 @@
+"""
+Propiedades destacadas de la página de inicio.
+
+Una propiedad está destacada mientras tenga es_destacada=True y su
+fecha_destacado_expira no haya pasado (None = sin vencimiento).
+
+- La rotación se precalcula por worker cada REFRESCO_SEGUNDOS, en segundo
+  plano (ver cache_local.Reconstruible): una lista de páginas de
+  TAMANO_PAGINA propiedades. Los proveedores se alternan con un
+  round-robin ponderado (peso = cuántas destacadas tiene, hasta
+  PESO_MAXIMO_PROVEEDOR), así quien promueve más aparece más, pero nadie
+  acapara la página. Dentro de un proveedor sus propiedades van por turnos.
+- La página que se muestra cambia cada SEGUNDOS_POR_PAGINA y depende solo del
+  reloj, así todos los workers muestran la misma.
+- Si hay menos destacadas que lugares, se rellena con las más recientes.
+- Un hilo apaga en bloque (update_many) las promociones vencidas.
+"""
+import threading
+import time
+from collections import deque
+from datetime import datetime
+import cache_local
+import consultas
+
+TAMANO_PAGINA = 9
+MAXIMO_PAGINAS = 20
+PESO_MAXIMO_PROVEEDOR = 3
+SEGUNDOS_POR_PAGINA = 60
+REFRESCO_SEGUNDOS = 60
+INTERVALO_EXPIRACION = 60
+
+PROYECCION = {**consultas.PROYECCION_TARJETA, "ciudad": 1, "tipo_propiedad": 1,
+              "id_propietario": 1, "fecha_destacado_expira": 1}
+
+
+def filtro_vigentes(ahora):
+    return {
+        "es_destacada": True,
+        **consultas.FILTRO_PUBLICO,
+        "disponible": {"$ne": False},
+        "$or": [{"fecha_destacado_expira": None}, {"fecha_destacado_expira": {"$gt": ahora}}]
+    }
+
+
+def _vigente(prop, ahora):
+    expira = prop.get("fecha_destacado_expira")
+    return expira is None or expira > ahora
+
+
+def construir_paginas(props, tamano=TAMANO_PAGINA, maximo_paginas=MAXIMO_PAGINAS):
+    """
+    Reparte las destacadas en páginas con round-robin ponderado suave entre
+    proveedores (el mismo que usa nginx para balancear). Se detiene cuando
+    todas las propiedades salieron al menos una vez.
+    """
+    if len(props) <= tamano:
+        return [props] if props else []
+
+    por_proveedor = {}
+    for prop in sorted(props, key=lambda p: p["_id"], reverse=True):
+        por_proveedor.setdefault(str(prop.get("id_propietario")), deque()).append(prop)
+    proveedores = sorted(por_proveedor)
+    pesos = {p: min(len(por_proveedor[p]), PESO_MAXIMO_PROVEEDOR) for p in proveedores}
+    peso_total = sum(pesos.values())
+    actual = dict.fromkeys(proveedores, 0)
+
+    paginas = []
+    vistas = set()
+    while len(paginas) < maximo_paginas and (len(vistas) < len(props) or not paginas):
+        pagina, en_pagina = [], set()
+        while len(pagina) < tamano:
+            for p in proveedores:
+                actual[p] += pesos[p]
+            elegido = max(proveedores, key=lambda p: actual[p])
+            actual[elegido] -= peso_total
+            cola = por_proveedor[elegido]
+            prop = cola[0]
+            cola.rotate(-1)
+            if prop["_id"] not in en_pagina:
+                pagina.append(prop)
+                en_pagina.add(prop["_id"])
+        vistas |= en_pagina
+        paginas.append(pagina)
+    return paginas
+
+
+class RotacionDestacadas(cache_local.Reconstruible):
+    REFRESCO_SEGUNDOS = REFRESCO_SEGUNDOS
+
+    def __init__(self):
+        super().__init__("destacadas")
+        self._lock = threading.Lock()
+        self._paginas = []
+        self._relleno = []
+
+    def construir(self, db, ahora=None):
+        ahora = ahora or datetime.utcnow()
+        cursor = db.propiedades.find(filtro_vigentes(ahora), PROYECCION)
+        paginas = construir_paginas(list(consultas.con_imagen_principal(cursor)))
+        relleno = []
+        if not paginas or len(paginas[0]) < TAMANO_PAGINA:
+            cursor = db.propiedades.find({**consultas.FILTRO_PUBLICO, "disponible": {"$ne": False}}, PROYECCION).sort("_id", -1).limit(TAMANO_PAGINA * 2)
+            relleno = list(consultas.con_imagen_principal(cursor))
+        with self._lock:
+            self._paginas = paginas
+            self._relleno = relleno
+            self._construido_en = time.monotonic()
+
+    def pagina_actual(self, db, limite=TAMANO_PAGINA, ahora=None):
+        """
+        Las propiedades que toca mostrar ahora, sin consultar MongoDB si la
+        rotación está fresca.
+        """
+        self._asegurar_construido(db)
+        ahora = ahora or datetime.utcnow()
+        with self._lock:
+            paginas, relleno = self._paginas, self._relleno
+        pagina = []
+        if paginas:
+            indice = int(time.time() // SEGUNDOS_POR_PAGINA) % len(paginas)
+            # Las que vencieron desde la última construcción ya no se muestran
+            pagina = [p for p in paginas[indice] if _vigente(p, ahora)]
+        ids = {p["_id"] for p in pagina}
+        pagina += [p for p in relleno if p["_id"] not in ids]
+        return pagina[:limite]
+
+
+def expirar(db, ahora=None):
+    """
+    Apaga todas las promociones vencidas. Devuelve cuántas se apagaron.
+    """
+    ahora = ahora or datetime.utcnow()
+    resultado = db.propiedades.update_many(
+        {"es_destacada": True, "fecha_destacado_expira": {"$ne": None, "$lte": ahora}},
+        {"$set": {"es_destacada": False, "fecha_actualizacion": ahora}}
+    )
+    return resultado.modified_count
+
+
+def iniciar_expiracion(db, intervalo=INTERVALO_EXPIRACION):
+    """
+    Arranca el hilo que apaga las promociones vencidas.
+    """
+    def ciclo():
+        while True:
+            try:
+                if expirar(db):
+                    rotacion_destacadas.invalidar()
+            except Exception as e:
+                print(f"Error expirando destacadas: {e}")
+            time.sleep(intervalo)
+
+    hilo = threading.Thread(target=ciclo, name="expiracion-destacadas", daemon=True)
+    hilo.start()
+    return hilo
+
+
+# Una instancia por worker
+rotacion_destacadas = RotacionDestacadas()
@@ -0,0 +1,246 @@
+"""
+Estadísticas de mercado por colonia × tipo de propiedad × tipo de operación.
+
+Para cada grupo se guardan en la colección "estadisticas_mercado" el número de
+propiedades, percentiles de precio y la mediana del precio por m², calculados
+con NumPy. Así las rutas leen un documento pequeño en vez de recorrer
+"propiedades".
+
+- Cuando se crea, edita o elimina una propiedad, su grupo se marca como
+  pendiente y un hilo en segundo plano lo recalcula (solo ese grupo).
+- Los grupos no distinguen mayúsculas (igual que la colonia en /buscar).
+- Las propiedades sin precio no cuentan.
+- "python estadisticas_mercado.py" recalcula todos los grupos de una vez.
+"""
+import re
+import threading
+import time
+from datetime import datetime
+import numpy as np
+from pymongo import UpdateOne
+import cache_local
+import consultas
+
+PERCENTILES = [10, 25, 50, 75, 90]
+INTERVALO_REFRESCO = 30  # segundos entre revisiones de grupos pendientes
+
+# Cache por worker de los documentos ya calculados
+cache_mercado = cache_local.CacheLRU("estadisticas_mercado", capacidad=1000, ttl=300)
+
+
+# Campos de una propiedad que definen su grupo
+CAMPOS_GRUPO = {"colonia": 1, "tipo_propiedad": 1, "tipo_operacion": 1}
+
+
+def _normalizar(texto):
+    return (texto or "").lower()
+
+
+def clave_grupo(colonia, tipo_propiedad, tipo_operacion):
+    return f"{_normalizar(colonia)}|{_normalizar(tipo_propiedad)}|{_normalizar(tipo_operacion)}"
+
+
+def clave_de_propiedad(prop):
+    return clave_grupo(prop.get("colonia"), prop.get("tipo_propiedad"), prop.get("tipo_operacion"))
+
+
+def _resumir(colonia, tipo_propiedad, tipo_operacion, precios, superficies):
+    """
+    Calcula el documento de estadísticas de un grupo a partir de sus arreglos.
+    """
+    precios = np.asarray(precios, dtype=np.float64)
+    superficies = np.asarray(superficies, dtype=np.float64)
+    doc = {
+        "_id": clave_grupo(colonia, tipo_propiedad, tipo_operacion),
+        "colonia": colonia,
+        "tipo_propiedad": _normalizar(tipo_propiedad),
+        "tipo_operacion": _normalizar(tipo_operacion),
+        "total": int(precios.size),
+        "fecha_calculo": datetime.utcnow()
+    }
+    if precios.size:
+        valores = np.percentile(precios, PERCENTILES)
+        doc["precio"] = {f"p{p}": round(float(v), 2) for p, v in zip(PERCENTILES, valores)}
+        con_superficie = superficies > 0
+        if con_superficie.any():
+            por_m2 = precios[con_superficie] / superficies[con_superficie]
+            valores = np.percentile(por_m2, [25, 50, 75])
+            doc["precio_m2"] = {f"p{p}": round(float(v), 2) for p, v in zip([25, 50, 75], valores)}
+    return doc
+
+
+def _filtro_texto(valor):
+    """
+    Igualdad sin distinguir mayúsculas, como la colonia en consultas.filtro_busqueda.
+    """
+    if not valor:
+        return {"$in": [None, ""]}
+    return {"$regex": f"^{re.escape(valor)}$", "$options": "i"}
+
+
+def _agregar(precios, superficies, prop):
+    # Sin precio no hay nada que comparar: contarla como 0 movería los percentiles
+    if prop.get("precio"):
+        precios.append(prop["precio"])
+        superficies.append(prop.get("superficie_m2") or 0)
+
+
+def _actualizacion(doc):
+    """
+    Solo los campos calculados: nunca toca "pendiente", así una marca que llega
+    mientras se calcula el grupo no se pierde.
+    """
+    datos = {k: v for k, v in doc.items() if k != "_id"}
+    faltantes = {campo: "" for campo in ("precio", "precio_m2") if campo not in datos}
+    actualizacion = {"$set": datos}
+    if faltantes:
+        actualizacion["$unset"] = faltantes
+    return actualizacion
+
+
+def recalcular_grupo(db, colonia, tipo_propiedad, tipo_operacion):
+    """
+    Recalcula un solo grupo (usa el índice colonia + tipo + operación).
+    """
+    precios, superficies = [], []
+    filtro = {
+        "colonia": _filtro_texto(colonia),
+        "tipo_propiedad": _filtro_texto(tipo_propiedad),
+        "tipo_operacion": _filtro_texto(tipo_operacion),
+        **consultas.FILTRO_PUBLICO
+    }
+    for p in db.propiedades.find(filtro, {"precio": 1, "superficie_m2": 1}):
+        _agregar(precios, superficies, p)
+    doc = _resumir(colonia, tipo_propiedad, tipo_operacion, precios, superficies)
+    if doc["total"]:
+        db.estadisticas_mercado.update_one({"_id": doc["_id"]}, _actualizacion(doc), upsert=True)
+    else:
+        # Si volvió a quedar pendiente mientras se calculaba, se deja para la siguiente vuelta
+        db.estadisticas_mercado.delete_one({"_id": doc["_id"], "pendiente": {"$ne": True}})
+    cache_mercado.invalidar(doc["_id"])
+    return doc
+
+
+def recalcular_todo(db):
+    """
+    Recalcula todos los grupos con una sola pasada sobre "propiedades".
+    """
+    grupos = {}
+    proyeccion = {**CAMPOS_GRUPO, "precio": 1, "superficie_m2": 1}
+    for p in db.propiedades.find(consultas.FILTRO_PUBLICO, proyeccion).batch_size(1000):
+        clave = clave_de_propiedad(p)
+        if clave not in grupos:
+            grupos[clave] = ((p.get("colonia"), p.get("tipo_propiedad"), p.get("tipo_operacion")), [], [])
+        _, precios, superficies = grupos[clave]
+        _agregar(precios, superficies, p)
+
+    operaciones = []
+    vigentes = []
+    for (colonia, tipo, operacion), precios, superficies in grupos.values():
+        if not precios:
+            continue
+        doc = _resumir(colonia, tipo, operacion, precios, superficies)
+        vigentes.append(doc["_id"])
+        operaciones.append(UpdateOne({"_id": doc["_id"]}, _actualizacion(doc), upsert=True))
+    if operaciones:
+        db.estadisticas_mercado.bulk_write(operaciones, ordered=False)
+    # Grupos que ya no tienen propiedades
+    db.estadisticas_mercado.delete_many({"_id": {"$nin": vigentes}, "pendiente": {"$ne": True}})
+    cache_mercado.limpiar()
+    return len(vigentes)
+
+
+def marcar_pendiente(db, prop):
+    """
+    Marca el grupo de una propiedad para recalcularlo en segundo plano.
+    """
+    try:
+        db.estadisticas_mercado.update_one(
+            {"_id": clave_de_propiedad(prop)},
+            {"$set": {
+                "pendiente": True,
+                "colonia": prop.get("colonia"),
+                "tipo_propiedad": prop.get("tipo_propiedad"),
+                "tipo_operacion": prop.get("tipo_operacion")
+            }},
+            upsert=True
+        )
+    except Exception as e:
+        print(f"Error marcando estadística pendiente: {e}")
+
+
+def refrescar_pendientes(db):
+    """
+    Recalcula los grupos pendientes. Cada grupo se "reclama" con
+    find_one_and_update, así varios workers no repiten el mismo trabajo; si la
+    propiedad cambia mientras se calcula, vuelve a quedar pendiente (el
+    recálculo solo escribe los campos calculados, ver _actualizacion).
+    """
+    total = 0
+    while True:
+        grupo = db.estadisticas_mercado.find_one_and_update({"pendiente": True}, {"$set": {"pendiente": False}})
+        if grupo is None:
+            return total
+        recalcular_grupo(db, grupo.get("colonia"), grupo.get("tipo_propiedad"), grupo.get("tipo_operacion"))
+        total += 1
+
+
+def obtener(db, colonia, tipo_propiedad, tipo_operacion):
+    """
+    Estadísticas de un grupo (desde la cache del worker si están frescas).
+    """
+    clave = clave_grupo(colonia, tipo_propiedad, tipo_operacion)
+    return cache_mercado.obtener_o_cargar(clave, lambda: db.estadisticas_mercado.find_one({"_id": clave}, {"pendiente": 0}))
+
+
+def insignia_precio(prop, estadistica):
+    """
+    Compara el precio por m² de la propiedad con la mediana de su grupo.
+    Devuelve None si no hay datos suficientes.
+    """
+    if not estadistica or "precio_m2" not in estadistica or estadistica.get("total", 0) < 3:
+        return None
+    superficie = prop.get("superficie_m2") or 0
+    if superficie <= 0 or not prop.get("precio"):
+        return None
+    mediana = estadistica["precio_m2"]["p50"]
+    propio = float(prop["precio"]) / superficie
+    diferencia = (propio - mediana) / mediana * 100 if mediana else 0
+    if diferencia <= -10:
+        nivel = "debajo"
+    elif diferencia >= 10:
+        nivel = "encima"
+    else:
+        nivel = "promedio"
+    return {
+        "nivel": nivel,
+        "diferencia_pct": round(diferencia),
+        "mediana_m2": mediana,
+        "precio_m2": round(propio, 2),
+        "total": estadistica["total"]
+    }
+
+
+def iniciar_refresco(db, intervalo=INTERVALO_REFRESCO):
+    """
+    Arranca el hilo que recalcula los grupos pendientes.
+    """
+    def ciclo():
+        while True:
+            try:
+                refrescar_pendientes(db)
+            except Exception as e:
+                print(f"Error refrescando estadísticas de mercado: {e}")
+            time.sleep(intervalo)
+
+    hilo = threading.Thread(target=ciclo, name="estadisticas-mercado", daemon=True)
+    hilo.start()
+    return hilo
+
+
+if __name__ == "__main__":
+    from pymongo import MongoClient
+    from config import Config
+
+    db = MongoClient(Config.MONGODB_URI)["HomiDB"]
+    print(f"{recalcular_todo(db)} grupos calculados")
@@ -0,0 +1,229 @@
+"""
+Exportación en streaming de propiedades, reseñas y bitácora de auditoría.
+
+Los documentos se leen en lotes por _id (cada lote es una consulta corta, no
+un cursor abierto durante toda la descarga) y se escriben con un generador, así
+que la memoria usada no depende del número de renglones.
+
+Formatos: csv, jsonl y parquet (este último solo si pyarrow está instalado).
+Cualquiera se puede comprimir con gzip al vuelo.
+
+Uso:
+    python exportacion.py propiedades --formato csv --gzip --salida propiedades.csv.gz
+    python exportacion.py log_audotoria --desde 2025-01-01 --hasta 2025-02-01
+"""
+import argparse
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, timedelta
+from bson.objectid import ObjectId
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet es opcional: pip install pyarrow
+    pa = None
+    pq = None
+
+TAMANO_LOTE = 1000
+
+# Columnas de cada colección exportable y el campo de fecha para filtrar por rango
+COLECCIONES = {
+    "propiedades": {
+        "campo_fecha": "fecha_publicacion",
+        "columnas": ["_id", "id_propietario", "titulo", "tipo_operacion", "tipo_propiedad", "precio",
+                     "calle", "numero_ext_int", "colonia", "codigo_postal", "ciudad", "latitud", "longitud",
+                     "numero_habitaciones", "numero_banos", "superficie_m2", "estado_publicacion",
+                     "disponible", "visitas", "fecha_publicacion", "amenidades", "imagenes"]
+    },
+    "resenas": {
+        "campo_fecha": "fecha_resena",
+        "columnas": ["_id", "id_propiedad", "id_usuario", "puntuacion", "comentario",
+                     "fecha_resena", "fecha_edicion", "esta_eliminado"]
+    },
+    "log_audotoria": {
+        "campo_fecha": "fecha_evento",
+        "columnas": ["_id", "id_usuario", "accion", "detalles", "fecha_evento"]
+    },
+}
+
+FORMATOS = {
+    "csv": ("text/csv", "csv"),
+    "jsonl": ("application/x-ndjson", "jsonl"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+def formatos_disponibles():
+    return [f for f in FORMATOS if f != "parquet" or pq is not None]
+
+
+def construir_filtro(coleccion, desde=None, hasta=None, extra=None):
+    """
+    Filtro por rango de fechas (YYYY-MM-DD, 'hasta' inclusivo) más condiciones extra.
+    """
+    filtro = dict(extra or {})
+    campo_fecha = COLECCIONES[coleccion]["campo_fecha"]
+    rango = {}
+    if desde:
+        rango["$gte"] = datetime.strptime(desde, "%Y-%m-%d")
+    if hasta:
+        rango["$lt"] = datetime.strptime(hasta, "%Y-%m-%d") + timedelta(days=1)
+    if rango:
+        filtro[campo_fecha] = rango
+    return filtro
+
+
+def leer_en_lotes(db, coleccion, filtro, tamano_lote=TAMANO_LOTE):
+    """
+    Genera listas de documentos en orden de _id, una consulta por lote.
+    """
+    proyeccion = {c: 1 for c in COLECCIONES[coleccion]["columnas"]}
+    ultimo_id = None
+    while True:
+        filtro_lote = dict(filtro)
+        if ultimo_id is not None:
+            filtro_lote["_id"] = {"$gt": ultimo_id}
+        lote = list(db[coleccion].find(filtro_lote, proyeccion).sort("_id", 1).limit(tamano_lote))
+        if not lote:
+            return
+        yield lote
+        ultimo_id = lote[-1]["_id"]
+
+
+def _a_texto(valor):
+    if isinstance(valor, ObjectId):
+        return str(valor)
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    if isinstance(valor, (dict, list)):
+        return json.dumps(valor, default=_a_texto, ensure_ascii=False)
+    return valor
+
+
+def a_json(doc):
+    """
+    Un documento como una línea JSON (ObjectId y fechas como texto).
+    """
+    return json.dumps(doc, default=_a_texto, ensure_ascii=False)
+
+
+def _escribir_csv(lotes, columnas):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(columnas)
+    for lote in lotes:
+        for doc in lote:
+            escritor.writerow(["" if doc.get(c) is None else _a_texto(doc.get(c)) for c in columnas])
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def _escribir_jsonl(lotes, columnas):
+    for lote in lotes:
+        lineas = [a_json({c: doc.get(c) for c in columnas if c in doc}) for doc in lote]
+        yield ("\n".join(lineas) + "\n").encode("utf-8")
+
+
+class _SalidaEnMemoria:
+    """Destino para ParquetWriter que se vacía después de cada grupo de renglones."""
+    def __init__(self):
+        self._buffer = io.BytesIO()
+        self._posicion = 0
+        self.closed = False
+
+    def write(self, datos):
+        self._buffer.write(datos)
+        self._posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self._posicion
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def vaciar(self):
+        datos = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return datos
+
+
+def _escribir_parquet(lotes, columnas):
+    # Todas las columnas como texto: el esquema es fijo aunque los documentos varíen
+    esquema = pa.schema([(c, pa.string()) for c in columnas])
+    salida = _SalidaEnMemoria()
+    escritor = pq.ParquetWriter(salida, esquema, compression="snappy")
+    for lote in lotes:
+        datos = {c: [None if doc.get(c) is None else str(_a_texto(doc.get(c))) for doc in lote] for c in columnas}
+        escritor.write_table(pa.Table.from_pydict(datos, schema=esquema))
+        bloque = salida.vaciar()
+        if bloque:
+            yield bloque
+    escritor.close()
+    yield salida.vaciar()
+
+
+def _comprimir_gzip(bloques):
+    compresor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for bloque in bloques:
+        datos = compresor.compress(bloque)
+        if datos:
+            yield datos
+    yield compresor.flush()
+
+
+def exportar(db, coleccion, formato, filtro=None, gzip=False, tamano_lote=TAMANO_LOTE):
+    """
+    Generador de bytes con la exportación completa.
+    """
+    if coleccion not in COLECCIONES:
+        raise ValueError(f"Colección no exportable: {coleccion}")
+    if formato not in formatos_disponibles():
+        raise ValueError(f"Formato no disponible: {formato}")
+
+    columnas = COLECCIONES[coleccion]["columnas"]
+    lotes = leer_en_lotes(db, coleccion, filtro or {}, tamano_lote)
+    escritores = {"csv": _escribir_csv, "jsonl": _escribir_jsonl, "parquet": _escribir_parquet}
+    bloques = escritores[formato](lotes, columnas)
+    return _comprimir_gzip(bloques) if gzip else bloques
+
+
+def nombre_archivo(coleccion, formato, gzip=False):
+    fecha = datetime.utcnow().strftime("%Y%m%d")
+    return f"{coleccion}_{fecha}.{FORMATOS[formato][1]}" + (".gz" if gzip else "")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta colecciones en streaming.")
+    parser.add_argument("coleccion", choices=sorted(COLECCIONES))
+    parser.add_argument("--formato", choices=sorted(FORMATOS), default="csv")
+    parser.add_argument("--gzip", action="store_true", help="Comprimir la salida con gzip")
+    parser.add_argument("--desde", help="Fecha inicial YYYY-MM-DD")
+    parser.add_argument("--hasta", help="Fecha final YYYY-MM-DD (inclusiva)")
+    parser.add_argument("--salida", help="Archivo destino (por defecto se genera el nombre)")
+    args = parser.parse_args()
+
+    from pymongo import MongoClient
+    from config import Config
+
+    db = MongoClient(Config.MONGODB_URI)["HomiDB"]
+    filtro = construir_filtro(args.coleccion, args.desde, args.hasta)
+    destino = args.salida or nombre_archivo(args.coleccion, args.formato, args.gzip)
+    total = 0
+    with open(destino, "wb") as archivo:
+        for bloque in exportar(db, args.coleccion, args.formato, filtro, args.gzip):
+            archivo.write(bloque)
+            total += len(bloque)
+    print(f"{destino}: {total} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Favoritos de los usuarios (arreglo favoritos del documento en usuarios).
+
+Nada de aquí trae el documento completo del usuario: con miles de
+favoritos ese arreglo pesa más que la página. Las preguntas se contestan en
+el servidor:
+  - es_favorito: count_documents con límite 1 sobre _id + favoritos.
+  - favoritos_entre: $setIntersection del arreglo con los ids de una
+    cuadrícula de tarjetas; solo regresan los que coinciden.
+  - pagina / desde: $slice sobre el arreglo invertido (los más recientes
+    primero), así solo viajan los ids de la página.
+  - alternar: $addToSet / $pull, sin leer ni reescribir el arreglo; ajusta
+    el contador total_favoritos (ver contadores.py).
+"""
+import consultas
+import contadores
+
+TAMANO_PAGINA = 12
+MAXIMO_IDS = 100    # ids por consulta de favoritos_entre
+
+
+def es_favorito(db, id_usuario, id_propiedad):
+    return db.usuarios.count_documents({"_id": id_usuario, "favoritos": id_propiedad}, limit=1) > 0
+
+
+def favoritos_entre(db, id_usuario, ids_propiedades):
+    """
+    De una lista de ids de propiedad, el conjunto de los que son favoritos del usuario.
+    """
+    ids = list(dict.fromkeys(ids_propiedades))[:MAXIMO_IDS]
+    if not ids:
+        return set()
+    resultado = list(db.usuarios.aggregate([
+        {"$match": {"_id": id_usuario}},
+        {"$project": {"_id": 0, "comunes": {"$setIntersection": [{"$ifNull": ["$favoritos", []]}, ids]}}}
+    ]))
+    return set(resultado[0]["comunes"]) if resultado else set()
+
+
+def alternar(db, id_usuario, id_propiedad):
+    """
+    Agrega la propiedad a favoritos o la quita si ya estaba. Devuelve True si quedó agregada.
+    """
+    agregada = db.usuarios.update_one(
+        {"_id": id_usuario, "favoritos": {"$ne": id_propiedad}},
+        {"$addToSet": {"favoritos": id_propiedad}}
+    )
+    if agregada.matched_count:
+        contadores.sumar(db, id_usuario, "total_favoritos", 1)
+        return True
+    if db.usuarios.update_one({"_id": id_usuario}, {"$pull": {"favoritos": id_propiedad}}).modified_count:
+        contadores.sumar(db, id_usuario, "total_favoritos", -1)
+    return False
+
+
+def _rebanada(db, id_usuario, inicio, tamano):
+    """
+    Las propiedades de favoritos[inicio:inicio + tamano] contando desde el más
+    reciente, con la proyección de tarjeta. Devuelve (propiedades, total de favoritos).
+    Las que ya no son públicas se omiten.
+    """
+    resultado = list(db.usuarios.aggregate([
+        {"$match": {"_id": id_usuario}},
+        {"$project": {
+            "_id": 0,
+            "total": {"$size": {"$ifNull": ["$favoritos", []]}},
+            "ids": {"$slice": [{"$reverseArray": {"$ifNull": ["$favoritos", []]}}, inicio, tamano]}
+        }}
+    ]))
+    if not resultado or not resultado[0]["ids"]:
+        return [], resultado[0]["total"] if resultado else 0
+    ids = resultado[0]["ids"]
+    por_id = {p["_id"]: p for p in consultas.con_imagen_principal(db.propiedades.find(
+        {"_id": {"$in": ids}, **consultas.FILTRO_PUBLICO}, consultas.PROYECCION_TARJETA
+    ))}
+    return [por_id[i] for i in ids if i in por_id], resultado[0]["total"]
+
+
+def pagina(db, id_usuario, numero=1, tamano=TAMANO_PAGINA):
+    """
+    Una página de favoritos, los más recientes primero. Devuelve (propiedades, total de favoritos).
+    """
+    numero = max(1, numero)
+    return _rebanada(db, id_usuario, (numero - 1) * tamano, tamano)
+
+
+def desde(db, id_usuario, inicio=0, tamano=TAMANO_PAGINA):
+    """
+    Los favoritos a partir de la posición inicio, para cargar más en el perfil.
+    Devuelve (propiedades, posición de la siguiente página o None).
+    """
+    inicio = max(0, inicio)
+    propiedades, total = _rebanada(db, id_usuario, inicio, tamano)
+    siguiente = inicio + tamano if inicio + tamano < total else None
+    return propiedades, siguiente
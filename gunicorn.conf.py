@@ -0,0 +1,68 @@
+"""
+Configuración de gunicorn para producción:
+    gunicorn -c gunicorn.conf.py
+
+Modelo: workers gthread, uno por CPU (mínimo 2) con HILOS_POR_WORKER hilos
+cada uno. Las peticiones pasan casi todo su tiempo esperando a MongoDB o a
+Cloudinary, así que los hilos cubren la espera; bcrypt ya corre en su propio
+pool de procesos (ver contrasenas.py) y no ocupa los hilos. Más workers que
+CPUs solo repite en memoria el recomendador, el autocompletado y las cachés.
+
+preload_app importa la app una vez en el maestro y los workers la heredan
+por fork: arrancan más rápido y un error de importación detiene el deploy
+antes de levantar workers. Nada en la importación abre conexiones ni hilos
+(ver conexiones.py); cada worker conecta y arranca sus hilos en
+post_worker_init, antes de aceptar peticiones, avisando al maestro después de
+cada etapa para que el timeout no lo mate; sus cachés se precalientan en un
+hilo aparte y /salud/listo responde 503 hasta que terminan (ver arranque.py).
+
+Los tiempos de arranque del maestro y de cada worker quedan en el log y en
+/salud/listo.
+
+Variables de entorno:
+    PORT                puerto (8000)
+    WEB_CONCURRENCY     número de workers (CPUs, mínimo 2)
+    GUNICORN_HILOS      hilos por worker (8)
+"""
+import multiprocessing
+import os
+import time
+
+HILOS_POR_WORKER = 8
+
+wsgi_app = "wsgi:crear_app()"
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+worker_class = "gthread"
+workers = int(os.getenv("WEB_CONCURRENCY", max(2, multiprocessing.cpu_count())))
+threads = int(os.getenv("GUNICORN_HILOS", HILOS_POR_WORKER))
+preload_app = True
+
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = "-"
+errorlog = "-"
+
+_inicio_maestro = time.perf_counter()
+
+
+def when_ready(server):
+    import arranque
+    server.log.info(f"Maestro listo en {(time.perf_counter() - _inicio_maestro) * 1000:.0f} ms "
+                    f"(importar_app {arranque.tiempos.get('importar_app', 0):.0f} ms)")
+
+
+def post_fork(server, worker):
+    worker.inicio_arranque = time.perf_counter()
+
+
+def post_worker_init(worker):
+    import arranque
+    from conexiones import db
+    arranque.iniciar_worker(db, avisar=worker.notify)
+    total = (time.perf_counter() - worker.inicio_arranque) * 1000
+    etapas = ", ".join(f"{etapa} {ms:.0f} ms" for etapa, ms in arranque.tiempos.items() if etapa != "importar_app")
+    errores = arranque.estado()["errores"]
+    resultado = f"arrancó con errores {errores}" if errores else "arrancó, precalentando cachés"
+    worker.log.info(f"Worker {worker.pid} {resultado} en {total:.0f} ms ({etapas})")
@@ -0,0 +1,319 @@
+"""
+Importación masiva de publicaciones desde CSV o JSONL.
+
+El archivo se lee fila por fila (nunca completo en memoria) y se procesa en
+bloques de TAMANO_BLOQUE filas:
+  1. Cada fila se valida con PublicacionForm, las mismas reglas del formulario web.
+  2. Las imágenes de las filas válidas se suben a Cloudinary en paralelo.
+  3. Las propiedades y sus logs de auditoría se guardan con insert_many.
+
+Las columnas son los nombres de campo de PublicacionForm (titulo, precio,
+colonia, tiene_alberca, ...). La columna "imagenes" lista archivos separados
+por ";" que se buscan en una carpeta local o dentro de un .zip.
+
+Antes de subir nada se revisa el archivo completo (revisar_archivo): que sea
+UTF-8, que el CSV se pueda leer y, desde la web, que no pase de
+MAXIMO_FILAS_WEB filas; los archivos grandes se importan desde la terminal.
+Las imágenes ya subidas de una fila que no se llega a guardar se encolan para
+borrarse (limpieza.encolar_imagenes).
+
+Uso:
+    python importacion.py publicaciones.csv --correo proveedor@correo.com \\
+        [--imagenes fotos.zip] [--reporte errores.csv]
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+import cloudinary.uploader
+from pymongo.errors import BulkWriteError
+from werkzeug.datastructures import MultiDict
+from forms import PublicacionForm
+import limpieza
+
+TAMANO_BLOQUE = 500
+HILOS_SUBIDA = 8
+MAXIMO_IMAGENES = 5
+MAXIMO_FILAS_WEB = 200      # más filas: python importacion.py desde la terminal
+
+# Campos booleanos del formulario: en CSV llegan como texto ("si", "1", "true"...)
+CAMPOS_BOOLEANOS = {nombre for nombre, campo in PublicacionForm.__dict__.items()
+                    if getattr(campo, "field_class", None) is not None
+                    and campo.field_class.__name__ == "BooleanField"}
+VALORES_VERDADEROS = {"1", "si", "sí", "true", "y", "yes", "x", "on"}
+
+
+class ArchivoInvalido(ValueError):
+    """El archivo completo no se puede importar (codificación, formato o tamaño)."""
+
+
+class FuenteImagenes:
+    """
+    Abre las imágenes listadas en las filas, desde una carpeta o un .zip.
+    """
+    def __init__(self, ruta=None, archivo_zip=None):
+        self.carpeta = None
+        self.zip = None
+        try:
+            if archivo_zip is not None:
+                self.zip = zipfile.ZipFile(archivo_zip)
+            elif ruta and zipfile.is_zipfile(ruta):
+                self.zip = zipfile.ZipFile(ruta)
+        except zipfile.BadZipFile as e:
+            raise ArchivoInvalido(f"El .zip de imágenes no es válido: {e}")
+        if self.zip is None and ruta:
+            self.carpeta = os.path.abspath(ruta)
+
+    def existe(self, nombre):
+        if self.zip is not None:
+            try:
+                self.zip.getinfo(nombre)
+                return True
+            except KeyError:
+                return False
+        if self.carpeta is not None:
+            ruta = os.path.abspath(os.path.join(self.carpeta, nombre))
+            # No permitimos salir de la carpeta con "../"
+            return ruta.startswith(self.carpeta + os.sep) and os.path.isfile(ruta)
+        return False
+
+    def abrir(self, nombre):
+        if self.zip is not None:
+            return self.zip.open(nombre)
+        return open(os.path.join(self.carpeta, nombre), "rb")
+
+
+def revisar_archivo(archivo, formato, maximo_filas=None):
+    """
+    Primera pasada, antes de subir nada: lee el archivo completo para
+    comprobar que es UTF-8 y que no pasa de maximo_filas. Lo regresa al inicio
+    y devuelve cuántas filas tiene. Lanza ArchivoInvalido.
+    """
+    texto = io.TextIOWrapper(archivo, encoding="utf-8-sig", newline="")
+    filas = 0
+    try:
+        lineas = csv.DictReader(texto) if formato == "csv" else (linea for linea in texto if linea.strip())
+        for _ in lineas:
+            filas += 1
+            if maximo_filas and filas > maximo_filas:
+                raise ArchivoInvalido(f"El archivo tiene más de {maximo_filas} filas: "
+                                      "impórtalo desde la terminal (python importacion.py)")
+    except UnicodeDecodeError:
+        raise ArchivoInvalido("El archivo no está en UTF-8")
+    except csv.Error as e:
+        raise ArchivoInvalido(f"CSV inválido: {e}")
+    finally:
+        # Sin detach, al descartar el TextIOWrapper se cerraría el archivo
+        texto.detach()
+    archivo.seek(0)
+    return filas
+
+
+def leer_filas(archivo, formato):
+    """
+    Genera (numero_fila, dict) desde un archivo binario CSV o JSONL.
+    """
+    texto = io.TextIOWrapper(archivo, encoding="utf-8-sig", newline="")
+    if formato == "csv":
+        for numero, fila in enumerate(csv.DictReader(texto), start=2):  # la fila 1 es el encabezado
+            yield numero, fila
+    else:
+        for numero, linea in enumerate(texto, start=1):
+            if not linea.strip():
+                continue
+            try:
+                yield numero, json.loads(linea)
+            except ValueError as e:
+                yield numero, {"__error__": f"JSON inválido: {e}"}
+
+
+def _a_formdata(fila):
+    datos = MultiDict()
+    for campo, valor in fila.items():
+        if campo is None or valor is None or campo == "imagenes":
+            continue
+        if campo in CAMPOS_BOOLEANOS:
+            # BooleanField toma cualquier texto no vacío como verdadero; solo mandamos los que sí
+            if valor is True or str(valor).strip().lower() in VALORES_VERDADEROS:
+                datos.add(campo, "y")
+            continue
+        datos.add(campo, str(valor))
+    return datos
+
+
+def _nombres_imagenes(fila):
+    valor = fila.get("imagenes") or []
+    if isinstance(valor, str):
+        valor = valor.split(";")
+    return [v.strip() for v in valor if v and v.strip()][:MAXIMO_IMAGENES]
+
+
+def validar_fila(fila, imagenes):
+    """
+    Devuelve (form, None) si la fila es válida o (None, mensaje) si no.
+    Debe llamarse dentro de un contexto de la app de Flask.
+    """
+    if "__error__" in fila:
+        return None, fila["__error__"]
+    form = PublicacionForm(formdata=_a_formdata(fila), meta={"csrf": False})
+    if not form.validate():
+        errores = "; ".join(f"{campo}: {', '.join(msgs)}" for campo, msgs in form.errors.items())
+        return None, errores
+    for nombre in _nombres_imagenes(fila):
+        if not imagenes.existe(nombre):
+            return None, f"imagen no encontrada: {nombre}"
+    return form, None
+
+
+def _ids_imagenes(imagenes):
+    return [img["public_id"] for img in imagenes]
+
+
+def _subir_imagenes(db, imagenes, nombres):
+    guardadas = []
+    try:
+        for i, nombre in enumerate(nombres):
+            with imagenes.abrir(nombre) as archivo:
+                resultado = cloudinary.uploader.upload(archivo, folder="homi_propiedades")
+            guardadas.append({
+                "url_imagen": resultado["secure_url"],
+                "public_id": resultado["public_id"],
+                "es_principal": (i == 0)
+            })
+    except Exception:
+        # La fila no se guardará: las que sí alcanzaron a subir se borran
+        limpieza.encolar_imagenes(db, _ids_imagenes(guardadas))
+        raise
+    return guardadas
+
+
+def _procesar_bloque(db, bloque, id_propietario, imagenes, hilos, errores):
+    """
+    Sube las imágenes del bloque en paralelo y guarda las propiedades con insert_many.
+    """
+    from app_publicaciones import construir_propiedad, log_nueva_propiedad, despues_de_publicar
+    import contadores
+
+    # Primero se arman los documentos: una fila que falla aquí no sube ninguna imagen
+    armadas = []
+    for numero, form, nombres in bloque:
+        try:
+            armadas.append((numero, construir_propiedad(form, id_propietario, []), nombres))
+        except ValueError:
+            errores.append((numero, "precio o coordenadas no son números"))
+
+    with ThreadPoolExecutor(max_workers=hilos) as pool:
+        subidas = [pool.submit(_subir_imagenes, db, imagenes, nombres) for _, _, nombres in armadas]
+
+    nuevas, filas = [], []
+    for (numero, propiedad, _), subida in zip(armadas, subidas):
+        try:
+            propiedad["imagenes"] = subida.result()
+        except Exception as e:
+            errores.append((numero, f"error subiendo imágenes: {e}"))
+            continue
+        nuevas.append(propiedad)
+        filas.append(numero)
+
+    if not nuevas:
+        return 0
+    try:
+        db.propiedades.insert_many(nuevas, ordered=False)
+    except BulkWriteError as e:
+        # ordered=False: se guardaron todas menos las que traen error
+        fallidas = {error["index"]: error.get("errmsg", "") for error in e.details.get("writeErrors", [])}
+        for i, mensaje in fallidas.items():
+            errores.append((filas[i], f"no se pudo guardar: {mensaje}"))
+        limpieza.encolar_imagenes(db, [pid for i in fallidas for pid in _ids_imagenes(nuevas[i]["imagenes"])])
+        nuevas = [p for i, p in enumerate(nuevas) if i not in fallidas]
+        if not nuevas:
+            return 0
+    db.log_audotoria.insert_many([log_nueva_propiedad(id_propietario, p) for p in nuevas], ordered=False)
+    contadores.sumar(db, id_propietario, "total_publicaciones", len(nuevas))
+    for propiedad in nuevas:
+        despues_de_publicar(propiedad)
+    return len(nuevas)
+
+
+def importar(db, archivo, formato, id_propietario, imagenes=None, tamano_bloque=TAMANO_BLOQUE, hilos=HILOS_SUBIDA,
+             maximo_filas=None):
+    """
+    Importa todas las filas del archivo. Devuelve (insertadas, errores) donde
+    errores es una lista de (numero_fila, mensaje).
+    Lanza ArchivoInvalido, sin haber subido ni guardado nada, si el archivo
+    completo no se puede importar (ver revisar_archivo).
+    Debe llamarse dentro de un contexto de la app de Flask (para validar los formularios).
+    """
+    revisar_archivo(archivo, formato, maximo_filas)
+    imagenes = imagenes or FuenteImagenes()
+    insertadas = 0
+    errores = []
+    bloque = []
+    for numero, fila in leer_filas(archivo, formato):
+        form, error = validar_fila(fila, imagenes)
+        if error:
+            errores.append((numero, error))
+            continue
+        bloque.append((numero, form, _nombres_imagenes(fila)))
+        if len(bloque) >= tamano_bloque:
+            insertadas += _procesar_bloque(db, bloque, id_propietario, imagenes, hilos, errores)
+            bloque = []
+    if bloque:
+        insertadas += _procesar_bloque(db, bloque, id_propietario, imagenes, hilos, errores)
+    errores.sort()
+    return insertadas, errores
+
+
+def escribir_reporte(errores, destino):
+    """
+    Escribe el reporte de errores por fila como CSV en un archivo de texto abierto.
+    """
+    escritor = csv.writer(destino)
+    escritor.writerow(["fila", "error"])
+    escritor.writerows(errores)
+
+
+def detectar_formato(nombre_archivo):
+    return "jsonl" if nombre_archivo.lower().endswith((".jsonl", ".json", ".ndjson")) else "csv"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Importa publicaciones desde CSV o JSONL.")
+    parser.add_argument("archivo", help="Archivo .csv o .jsonl")
+    parser.add_argument("--correo", required=True, help="Correo del proveedor dueño de las propiedades")
+    parser.add_argument("--imagenes", help="Carpeta o .zip con las imágenes")
+    parser.add_argument("--reporte", default="errores_importacion.csv", help="Dónde guardar el reporte de errores")
+    parser.add_argument("--bloque", type=int, default=TAMANO_BLOQUE, help="Filas por insert_many")
+    parser.add_argument("--hilos", type=int, default=HILOS_SUBIDA, help="Subidas simultáneas a Cloudinary")
+    args = parser.parse_args()
+
+    from app import app, db
+
+    proveedor = db.usuarios.find_one({"correo_electronico": args.correo, "rol": "proveedor"}, {"_id": 1})
+    if not proveedor:
+        print(f"No existe un proveedor con el correo {args.correo}")
+        return 1
+
+    try:
+        with app.test_request_context(), open(args.archivo, "rb") as archivo:
+            insertadas, errores = importar(
+                db, archivo, detectar_formato(args.archivo), proveedor["_id"],
+                FuenteImagenes(args.imagenes), args.bloque, args.hilos
+            )
+    except ArchivoInvalido as e:
+        print(e)
+        return 1
+
+    print(f"{insertadas} propiedades importadas, {len(errores)} filas con error")
+    if errores:
+        with open(args.reporte, "w", newline="", encoding="utf-8") as destino:
+            escribir_reporte(errores, destino)
+        print(f"Reporte de errores: {args.reporte}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,256 @@
+"""
+Registro de los índices que necesitan las rutas de la app.
+
+Cada consulta frecuente de app.py debe estar cubierta por alguno de estos
+índices. Desde la terminal:
+
+    python indices.py crear      # crea los que falten
+    python indices.py diff       # compara el registro contra la base de datos
+    python indices.py reporte    # corre explain() de las consultas de cada ruta
+
+Los tres comandos terminan con código 1 si algo no cuadra, para poder usarlos
+en el despliegue.
+"""
+import sys
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+from retencion_logs import DIAS_TRAS_ARCHIVO
+from visitas import DIAS_HISTORIAL
+
+# Índices declarados: colección, claves y opciones (el nombre es obligatorio)
+INDICES = [
+    # Login y registro: búsqueda por correo en cada petición, y no debe haber duplicados
+    {"coleccion": "usuarios", "claves": [("correo_electronico", ASCENDING)],
+     "opciones": {"name": "correo_unico", "unique": True}},
+    # dashboard_proveedor cuenta cuántos usuarios tienen en favoritos sus propiedades
+    {"coleccion": "usuarios", "claves": [("favoritos", ASCENDING)],
+     "opciones": {"name": "favoritos"}},
+    # perfil, dashboard_proveedor, editar/eliminar_propiedad
+    {"coleccion": "propiedades", "claves": [("id_propietario", ASCENDING), ("_id", DESCENDING)],
+     "opciones": {"name": "propietario"}},
+    # buscar() y la lista de colonias (distinct por ciudad), solo sobre aprobadas
+    {"coleccion": "propiedades", "claves": [("estado_publicacion", ASCENDING), ("ciudad", ASCENDING), ("colonia", ASCENDING)],
+     "opciones": {"name": "publicas_ciudad_colonia"}},
+    # Relleno de la página de inicio: aprobadas más recientes
+    {"coleccion": "propiedades", "claves": [("estado_publicacion", ASCENDING), ("_id", DESCENDING)],
+     "opciones": {"name": "publicas_recientes"}},
+    # Cola de moderación: el índice solo contiene las pendientes
+    {"coleccion": "propiedades", "claves": [("estado_publicacion", ASCENDING), ("_id", ASCENDING)],
+     "opciones": {"name": "moderacion", "partialFilterExpression": {"estado_publicacion": "pendiente"}}},
+    # Estadísticas de mercado: recálculo de un grupo colonia × tipo × operación
+    {"coleccion": "propiedades", "claves": [("colonia", ASCENDING), ("tipo_propiedad", ASCENDING), ("tipo_operacion", ASCENDING)],
+     "opciones": {"name": "grupo_mercado"}},
+    # Rotación de destacadas y expiración en bloque: solo las promovidas entran al índice
+    {"coleccion": "propiedades", "claves": [("es_destacada", ASCENDING), ("fecha_destacado_expira", ASCENDING)],
+     "opciones": {"name": "destacadas", "partialFilterExpression": {"es_destacada": True}}},
+    # Búsquedas guardadas: índice invertido (multikey) por ciudad|colonia|tipo|operacion
+    {"coleccion": "busquedas_guardadas", "claves": [("claves", ASCENDING)],
+     "opciones": {"name": "claves"}},
+    {"coleccion": "busquedas_guardadas", "claves": [("id_usuario", ASCENDING), ("fecha_creacion", DESCENDING)],
+     "opciones": {"name": "usuario_fecha"}},
+    # Feed de novedades: una entrada por usuario y propiedad, leída por fecha
+    {"coleccion": "novedades", "claves": [("id_usuario", ASCENDING), ("id_propiedad", ASCENDING)],
+     "opciones": {"name": "usuario_propiedad", "unique": True}},
+    {"coleccion": "novedades", "claves": [("id_usuario", ASCENDING), ("fecha", DESCENDING)],
+     "opciones": {"name": "usuario_fecha"}},
+    # Limpieza de una propiedad borrada: sus novedades (ver limpieza.py)
+    {"coleccion": "novedades", "claves": [("id_propiedad", ASCENDING)],
+     "opciones": {"name": "propiedad"}},
+    # Cola de limpieza: el siguiente trabajo disponible
+    {"coleccion": "trabajos_limpieza", "claves": [("estado", ASCENDING), ("disponible_desde", ASCENDING)],
+     "opciones": {"name": "estado_disponible"}},
+    # Reseñas de una propiedad ordenadas por fecha
+    {"coleccion": "resenas", "claves": [("id_propiedad", ASCENDING), ("fecha_resena", DESCENDING)],
+     "opciones": {"name": "propiedad_fecha"}},
+    # Visitas diarias: un documento por propiedad y día (upsert del contador de visitas.py)
+    {"coleccion": "visitas_diarias", "claves": [("id_propiedad", ASCENDING), ("dia", ASCENDING)],
+     "opciones": {"name": "propiedad_dia", "unique": True}},
+    # Tendencias del panel del proveedor: una agregación por propietario y rango de días
+    {"coleccion": "visitas_diarias", "claves": [("id_propietario", ASCENDING), ("dia", ASCENDING)],
+     "opciones": {"name": "propietario_dia"}},
+    # Los días más antiguos que DIAS_HISTORIAL se borran solos
+    {"coleccion": "visitas_diarias", "claves": [("dia", ASCENDING)],
+     "opciones": {"name": "dia", "expireAfterSeconds": DIAS_HISTORIAL * 86400}},
+    # admin_dashboard ordena la bitácora por fecha
+    {"coleccion": "log_audotoria", "claves": [("fecha_evento", DESCENDING)],
+     "opciones": {"name": "fecha_evento"}},
+    # TTL de la bitácora: solo los eventos ya archivados tienen archivado_en (ver retencion_logs.py)
+    {"coleccion": "log_audotoria", "claves": [("archivado_en", ASCENDING)],
+     "opciones": {"name": "archivado_en", "expireAfterSeconds": DIAS_TRAS_ARCHIVO * 86400,
+                  "partialFilterExpression": {"archivado_en": {"$exists": True}}}},
+]
+
+# Consultas representativas de cada ruta: (ruta, colección, filtro, orden)
+_ID = ObjectId()
+CONSULTAS_CANONICAS = [
+    ("index (login)", "usuarios", {"correo_electronico": "correo@ejemplo.com"}, None),
+    ("registro", "usuarios", {"correo_electronico": "correo@ejemplo.com"}, None),
+    ("home", "propiedades", {"estado_publicacion": "aprobada"}, [("_id", DESCENDING)]),
+    ("home (destacadas)", "propiedades", {"es_destacada": True, "fecha_destacado_expira": {"$ne": None, "$lte": _ID.generation_time}}, None),
+    ("buscar", "propiedades", {"estado_publicacion": "aprobada", "ciudad": "Acapulco", "tipo_operacion": "venta"}, None),
+    ("moderacion (novedades)", "busquedas_guardadas", {"claves": {"$in": ["acapulco|centro|casa|venta", "acapulco|*|*|*"]}}, None),
+    ("novedades", "novedades", {"id_usuario": _ID}, [("fecha", DESCENDING)]),
+    ("admin_moderacion", "propiedades", {"estado_publicacion": "pendiente", "_id": {"$gt": _ID}}, [("_id", ASCENDING)]),
+    ("perfil (api)", "propiedades", {"id_propietario": _ID, "_id": {"$lt": _ID}}, [("_id", DESCENDING)]),
+    ("dashboard_proveedor", "propiedades", {"id_propietario": _ID}, None),
+    ("dashboard_proveedor", "resenas", {"id_propiedad": {"$in": [_ID]}, "esta_eliminado": {"$ne": True}}, [("fecha_resena", DESCENDING)]),
+    ("dashboard_proveedor", "usuarios", {"favoritos": {"$in": [_ID]}}, None),
+    ("dashboard_proveedor (visitas)", "visitas_diarias", {"id_propietario": _ID, "dia": {"$gte": _ID.generation_time}}, None),
+    ("editar_propiedad", "propiedades", {"_id": _ID, "id_propietario": _ID}, None),
+    ("detalle_propiedad", "resenas", {"id_propiedad": _ID, "esta_eliminado": {"$ne": True}}, [("fecha_resena", DESCENDING)]),
+    ("admin_dashboard", "log_audotoria", {}, [("fecha_evento", DESCENDING)]),
+    ("eliminar_propiedad (limpieza)", "resenas", {"id_propiedad": _ID}, None),
+    ("eliminar_propiedad (limpieza)", "usuarios", {"favoritos": _ID}, None),
+    ("eliminar_propiedad (limpieza)", "novedades", {"id_propiedad": _ID}, None),
+    ("limpieza", "trabajos_limpieza", {"estado": "pendiente", "disponible_desde": {"$lte": _ID.generation_time}}, [("disponible_desde", ASCENDING)]),
+    ("estadisticas_mercado", "propiedades", {"colonia": "Centro", "tipo_propiedad": "casa", "tipo_operacion": "venta"}, None),
+]
+
+
+def crear_indices(db):
+    """
+    Crea los índices del registro que no existan. Devuelve la lista de errores.
+    """
+    errores = []
+    for indice in INDICES:
+        try:
+            db[indice["coleccion"]].create_index(indice["claves"], **indice["opciones"])
+        except OperationFailure as e:
+            actual = db[indice["coleccion"]].index_information().get(indice["opciones"]["name"], {}) if e.code == 85 else {}
+            if "expireAfterSeconds" in actual and "expireAfterSeconds" not in indice["opciones"]:
+                # El índice existe con un TTL que el registro ya no tiene (collMod no lo quita):
+                # se recrea sin él, para que deje de borrar documentos
+                try:
+                    db[indice["coleccion"]].drop_index(indice["opciones"]["name"])
+                    db[indice["coleccion"]].create_index(indice["claves"], **indice["opciones"])
+                    continue
+                except OperationFailure as e_recrear:
+                    e = e_recrear
+            elif e.code == 85 and "expireAfterSeconds" in indice["opciones"]:
+                # IndexOptionsConflict: el índice ya existe con otro TTL, se cambia sin recrearlo.
+                # Otros conflictos (unique, partialFilterExpression) van a errores
+                try:
+                    db.command("collMod", indice["coleccion"], index={
+                        "name": indice["opciones"]["name"],
+                        "expireAfterSeconds": indice["opciones"]["expireAfterSeconds"]
+                    })
+                    continue
+                except OperationFailure as e_mod:
+                    e = e_mod
+            # Por ejemplo: correos duplicados que impiden crear el índice único
+            errores.append(f"{indice['coleccion']}.{indice['opciones']['name']}: {e}")
+    return errores
+
+
+def diferencias(db):
+    """
+    Compara el registro contra la base de datos.
+    Devuelve (faltantes, distintos, sobrantes) como listas de textos.
+    """
+    faltantes, distintos, sobrantes = [], [], []
+    colecciones = sorted({i["coleccion"] for i in INDICES})
+    for coleccion in colecciones:
+        existentes = {ix["name"]: ix for ix in db[coleccion].list_indexes()}
+        declarados = [i for i in INDICES if i["coleccion"] == coleccion]
+        for indice in declarados:
+            nombre = indice["opciones"]["name"]
+            actual = existentes.get(nombre)
+            if actual is None:
+                faltantes.append(f"{coleccion}.{nombre}")
+                continue
+            claves_actuales = [(k, int(v)) for k, v in actual["key"].items()]
+            if (claves_actuales != list(indice["claves"])
+                    or bool(actual.get("unique")) != bool(indice["opciones"].get("unique"))
+                    or actual.get("expireAfterSeconds") != indice["opciones"].get("expireAfterSeconds")):
+                distintos.append(f"{coleccion}.{nombre}")
+        nombres_declarados = {i["opciones"]["name"] for i in declarados}
+        for nombre in existentes:
+            if nombre != "_id_" and nombre not in nombres_declarados:
+                sobrantes.append(f"{coleccion}.{nombre}")
+    return faltantes, distintos, sobrantes
+
+
+def verificar_indices(db):
+    """
+    Revisión al arrancar la app: solo avisa, nunca detiene el arranque.
+    """
+    try:
+        faltantes, distintos, _ = diferencias(db)
+        if faltantes or distintos:
+            print(f"AVISO: índices faltantes {faltantes} o distintos {distintos}. Corre 'python indices.py crear'.")
+        return not (faltantes or distintos)
+    except Exception as e:
+        print(f"No se pudieron verificar los índices: {e}")
+        return False
+
+
+def _etapas(plan):
+    """Recorre todas las etapas de un plan de explain()."""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for valor in plan.values():
+            yield from _etapas(valor)
+    elif isinstance(plan, list):
+        for valor in plan:
+            yield from _etapas(valor)
+
+
+def reporte_consultas(db):
+    """
+    Corre explain() sobre las consultas canónicas de cada ruta.
+    Devuelve una lista de (ruta, colección, etapas, usa_collscan).
+    """
+    resultados = []
+    for ruta, coleccion, filtro, orden in CONSULTAS_CANONICAS:
+        cursor = db[coleccion].find(filtro)
+        if orden:
+            cursor = cursor.sort(orden)
+        plan = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+        etapas = list(_etapas(plan))
+        resultados.append((ruta, coleccion, etapas, "COLLSCAN" in etapas))
+    return resultados
+
+
+def main(argv):
+    from pymongo import MongoClient
+    from config import Config
+
+    comando = argv[1] if len(argv) > 1 else "diff"
+    db = MongoClient(Config.MONGODB_URI)["HomiDB"]
+
+    if comando == "crear":
+        errores = crear_indices(db)
+        for e in errores:
+            print(f"ERROR: {e}")
+        # Verificamos que lo creado coincida con el registro
+        faltantes, distintos, _ = diferencias(db)
+        for nombre in faltantes + distintos:
+            print(f"ERROR: {nombre} no coincide con el registro")
+        return 1 if (errores or faltantes or distintos) else 0
+
+    if comando == "diff":
+        faltantes, distintos, sobrantes = diferencias(db)
+        for nombre in faltantes:
+            print(f"- falta      {nombre}")
+        for nombre in distintos:
+            print(f"~ distinto   {nombre}")
+        for nombre in sobrantes:
+            print(f"+ no está en el registro {nombre}")
+        return 1 if (faltantes or distintos) else 0
+
+    if comando == "reporte":
+        falla = False
+        for ruta, coleccion, etapas, collscan in reporte_consultas(db):
+            marca = "COLLSCAN" if collscan else "ok"
+            print(f"{marca:9} {ruta:22} {coleccion:14} {' > '.join(etapas)}")
+            falla = falla or collscan
+        return 1 if falla else 0
+
+    print(__doc__)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,238 @@
+"""
+Almacenamiento de límites de peticiones (Flask-Limiter / limits) en SQLite.
+
+La memoria de cada proceso no sirve con varios workers de gunicorn: cada uno
+lleva sus propios contadores y el "5 per minute" del login se vuelve 5×N.
+Este almacenamiento guarda los contadores en un archivo SQLite en modo WAL
+que comparten todos los workers del host: cada revisión es una sola sentencia
+(o una transacción corta) sobre un archivo local, sin viajes por la red.
+
+Se registra en limits con el esquema sqlite:// al importar el módulo, con la
+misma convención de rutas de SQLAlchemy:
+    sqlite:///limites.db          (relativa)
+    sqlite:////tmp/limites.db     (absoluta)
+
+Soporta las tres estrategias: fixed-window, moving-window y
+sliding-window-counter (RATELIMIT_STRATEGY en config.py).
+
+Medir la latencia por revisión: python bench_limites.py
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from math import floor
+from limits.storage import MovingWindowSupport, SlidingWindowCounterSupport, Storage
+from limits.storage.base import TimestampedSlidingWindow
+
+PURGAR_CADA = 1000      # escrituras entre limpiezas de claves vencidas
+ESPERA_BLOQUEO_MS = 5000
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS contadores (
+    clave TEXT PRIMARY KEY,
+    valor INTEGER NOT NULL,
+    expira REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS eventos (
+    clave TEXT NOT NULL,
+    momento REAL NOT NULL,
+    expira REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS eventos_clave_momento ON eventos (clave, momento);
+CREATE INDEX IF NOT EXISTS eventos_expira ON eventos (expira);
+"""
+
+
+def ruta_de_uri(uri):
+    ruta = uri.split("://", 1)[1] if "://" in uri else ""
+    if ruta.startswith("/"):
+        ruta = ruta[1:]
+    if not ruta:
+        raise ValueError(f"Falta la ruta del archivo en {uri!r} (ej. sqlite:///limites.db)")
+    return ruta
+
+
+class AlmacenSQLite(Storage, MovingWindowSupport, SlidingWindowCounterSupport, TimestampedSlidingWindow):
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(self, uri=None, wrap_exceptions=False, **opciones):
+        self.ruta = ruta_de_uri(uri or "")
+        self._local = threading.local()
+        self._escrituras = 0
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **opciones)
+        # Conexión de un solo uso: con --preload esto corre en el maestro de gunicorn
+        # y una conexión SQLite abierta no debe pasar a los workers por el fork
+        with closing(sqlite3.connect(self.ruta, timeout=ESPERA_BLOQUEO_MS / 1000)) as con:
+            con.executescript(_ESQUEMA)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    # --- CONEXIÓN ---
+
+    def _conexion(self):
+        """
+        Una conexión por hilo y por proceso (tras un fork se abre otra).
+        """
+        con = getattr(self._local, "con", None)
+        if con is None or self._local.pid != os.getpid():
+            con = sqlite3.connect(self.ruta, isolation_level=None, timeout=ESPERA_BLOQUEO_MS / 1000)
+            con.execute("PRAGMA journal_mode=WAL")
+            # Perder los últimos contadores si se apaga el equipo no importa; fsync en cada hit sí
+            con.execute("PRAGMA synchronous=NORMAL")
+            con.execute(f"PRAGMA busy_timeout={ESPERA_BLOQUEO_MS}")
+            self._local.con = con
+            self._local.pid = os.getpid()
+        return con
+
+    def _transaccion(self):
+        return _Transaccion(self._conexion())
+
+    def _tal_vez_purgar(self, con, ahora):
+        self._escrituras += 1
+        if self._escrituras % PURGAR_CADA == 0:
+            con.execute("DELETE FROM contadores WHERE expira <= ?", (ahora,))
+            con.execute("DELETE FROM eventos WHERE expira <= ?", (ahora,))
+
+    # --- VENTANA FIJA ---
+
+    def incr(self, key, expiry, amount=1):
+        ahora = time.time()
+        con = self._conexion()
+        # Una sola sentencia: atómica entre procesos sin abrir transacción
+        valor, = con.execute(
+            "INSERT INTO contadores (clave, valor, expira) VALUES (?, ?, ?) "
+            "ON CONFLICT (clave) DO UPDATE SET "
+            "valor = CASE WHEN expira <= ? THEN excluded.valor ELSE valor + excluded.valor END, "
+            "expira = CASE WHEN expira <= ? THEN excluded.expira ELSE expira END "
+            "RETURNING valor",
+            (key, amount, ahora + expiry, ahora, ahora)
+        ).fetchone()
+        self._tal_vez_purgar(con, ahora)
+        return valor
+
+    def decr(self, key, amount=1):
+        con = self._conexion()
+        fila = con.execute(
+            "UPDATE contadores SET valor = MAX(valor - ?, 0) WHERE clave = ? AND expira > ? RETURNING valor",
+            (amount, key, time.time())
+        ).fetchone()
+        return fila[0] if fila else 0
+
+    def get(self, key):
+        fila = self._conexion().execute(
+            "SELECT valor FROM contadores WHERE clave = ? AND expira > ?", (key, time.time())
+        ).fetchone()
+        return fila[0] if fila else 0
+
+    def get_expiry(self, key):
+        ahora = time.time()
+        fila = self._conexion().execute(
+            "SELECT expira FROM contadores WHERE clave = ? AND expira > ?", (key, ahora)
+        ).fetchone()
+        return fila[0] if fila else ahora
+
+    def check(self):
+        try:
+            self._conexion().execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        with self._transaccion() as con:
+            total = con.execute("SELECT (SELECT COUNT(*) FROM contadores) + (SELECT COUNT(DISTINCT clave) FROM eventos)").fetchone()[0]
+            con.execute("DELETE FROM contadores")
+            con.execute("DELETE FROM eventos")
+        return total
+
+    def clear(self, key):
+        with self._transaccion() as con:
+            con.execute("DELETE FROM contadores WHERE clave = ?", (key,))
+            con.execute("DELETE FROM eventos WHERE clave = ?", (key,))
+
+    # --- VENTANA MÓVIL ---
+
+    def acquire_entry(self, key, limit, expiry, amount=1):
+        if amount > limit:
+            return False
+        ahora = time.time()
+        with self._transaccion() as con:
+            usados, = con.execute(
+                "SELECT COUNT(*) FROM eventos WHERE clave = ? AND momento > ?", (key, ahora - expiry)
+            ).fetchone()
+            if usados + amount > limit:
+                return False
+            con.executemany(
+                "INSERT INTO eventos (clave, momento, expira) VALUES (?, ?, ?)",
+                [(key, ahora, ahora + expiry)] * amount
+            )
+            self._tal_vez_purgar(con, ahora)
+        return True
+
+    def get_moving_window(self, key, limit, expiry):
+        ahora = time.time()
+        inicio, usados = self._conexion().execute(
+            "SELECT MIN(momento), COUNT(*) FROM eventos WHERE clave = ? AND momento > ?", (key, ahora - expiry)
+        ).fetchone()
+        return (inicio if usados else ahora), usados
+
+    # --- VENTANA DESLIZANTE (contador ponderado) ---
+
+    def _ventana_deslizante(self, con, key, expiry, ahora):
+        anterior, actual = self.sliding_window_keys(key, expiry, ahora)
+        cuentas = dict(con.execute(
+            "SELECT clave, valor FROM contadores WHERE clave IN (?, ?) AND expira > ?", (anterior, actual, ahora)
+        ).fetchall())
+        cuenta_anterior = cuentas.get(anterior, 0)
+        cuenta_actual = cuentas.get(actual, 0)
+        ttl_anterior = (1 - (((ahora - expiry) / expiry) % 1)) * expiry if cuenta_anterior else 0.0
+        ttl_actual = (1 - ((ahora / expiry) % 1)) * expiry + expiry
+        return cuenta_anterior, ttl_anterior, cuenta_actual, ttl_actual
+
+    def acquire_sliding_window_entry(self, key, limit, expiry, amount=1):
+        if amount > limit:
+            return False
+        ahora = time.time()
+        with self._transaccion() as con:
+            cuenta_anterior, ttl_anterior, cuenta_actual, _ = self._ventana_deslizante(con, key, expiry, ahora)
+            if floor(cuenta_anterior * ttl_anterior / expiry + cuenta_actual) + amount > limit:
+                return False
+            # La transacción es exclusiva: no hace falta revertir como en el almacenamiento en memoria
+            _, actual = self.sliding_window_keys(key, expiry, ahora)
+            con.execute(
+                "INSERT INTO contadores (clave, valor, expira) VALUES (?, ?, ?) "
+                "ON CONFLICT (clave) DO UPDATE SET "
+                "valor = CASE WHEN expira <= ? THEN excluded.valor ELSE valor + excluded.valor END, "
+                "expira = CASE WHEN expira <= ? THEN excluded.expira ELSE expira END",
+                (actual, amount, ahora + 2 * expiry, ahora, ahora)
+            )
+            self._tal_vez_purgar(con, ahora)
+        return True
+
+    def get_sliding_window(self, key, expiry):
+        return self._ventana_deslizante(self._conexion(), key, expiry, time.time())
+
+    def clear_sliding_window(self, key, expiry):
+        anterior, actual = self.sliding_window_keys(key, expiry, time.time())
+        self._conexion().execute("DELETE FROM contadores WHERE clave IN (?, ?)", (anterior, actual))
+
+
+class _Transaccion:
+    """
+    BEGIN IMMEDIATE toma el candado de escritura al empezar: dos workers no
+    pueden leer el mismo conteo y pasarse ambos del límite.
+    """
+    def __init__(self, con):
+        self.con = con
+
+    def __enter__(self):
+        self.con.execute("BEGIN IMMEDIATE")
+        return self.con
+
+    def __exit__(self, tipo, valor, traza):
+        self.con.execute("COMMIT" if tipo is None else "ROLLBACK")
+        return False
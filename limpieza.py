@@ -0,0 +1,269 @@
+"""
+Limpieza en cascada de propiedades eliminadas y de imágenes que ya no se usan.
+
+Borrar una propiedad solo borra su documento y encola un trabajo en la
+colección trabajos_limpieza; un hilo de fondo en cada worker lo procesa:
+  - borra sus reseñas (colección resenas) con un delete_many,
+  - quita su id de los favoritos de todos los usuarios con un update_many ($pull),
+  - borra sus entradas del feed de novedades,
+  - borra sus imágenes de Cloudinary por public_id, de LOTE_CLOUDINARY en LOTE_CLOUDINARY.
+Al reemplazar las imágenes de una propiedad se encola un trabajo solo con las
+imágenes anteriores.
+
+La cola vive en MongoDB, así que un trabajo sobrevive a reinicios: cada worker
+toma uno con find_one_and_update y lo "alquila" por DURACION_ALQUILER; si el
+worker muere, otro lo retoma cuando vence. Si falla, se reintenta más tarde
+(espera exponencial) hasta MAXIMO_INTENTOS.
+
+Los huérfanos que ya existían (reseñas, favoritos y novedades de propiedades
+borradas, imágenes de Cloudinary que ninguna propiedad usa) se recogen con:
+    python limpieza.py huerfanos [--imagenes] [--simular]
+    python limpieza.py procesar      # vacía la cola desde la terminal
+    python limpieza.py pendientes
+"""
+import argparse
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+
+LOTE_CLOUDINARY = 100          # máximo de public_ids por llamada a delete_resources
+LOTE_IDS = 1000                # ids por consulta $in al buscar huérfanos
+MAXIMO_INTENTOS = 8
+DURACION_ALQUILER = timedelta(minutes=10)
+INTERVALO_COLA = 30            # segundos entre revisiones si no hay avisos
+ANTIGUEDAD_IMAGEN_HUERFANA = timedelta(days=1)
+CARPETA_IMAGENES = "homi_propiedades"
+
+PROPIEDAD_ELIMINADA = "propiedad_eliminada"
+IMAGENES = "imagenes"
+
+_aviso = threading.Event()
+
+
+def public_ids(imagenes):
+    return [img["public_id"] for img in imagenes or [] if img.get("public_id")]
+
+
+def _encolar(db, trabajo):
+    ahora = datetime.utcnow()
+    db.trabajos_limpieza.insert_one({
+        **trabajo,
+        "estado": "pendiente",
+        "intentos": 0,
+        "fecha_creacion": ahora,
+        "disponible_desde": ahora
+    })
+    _aviso.set()
+
+
+def encolar_propiedad_eliminada(db, prop):
+    """
+    Encola la limpieza de todo lo que colgaba de una propiedad ya borrada.
+    """
+    _encolar(db, {"tipo": PROPIEDAD_ELIMINADA, "id_propiedad": prop["_id"],
+                  "public_ids": public_ids(prop.get("imagenes"))})
+
+
+def encolar_imagenes(db, ids_imagenes):
+    """
+    Encola el borrado de imágenes de Cloudinary que dejaron de usarse.
+    """
+    ids_imagenes = list(dict.fromkeys(ids_imagenes))
+    if ids_imagenes:
+        _encolar(db, {"tipo": IMAGENES, "public_ids": ids_imagenes})
+
+
+def _borrar_imagenes(db, trabajo):
+    import cloudinary.api
+
+    pendientes = list(trabajo.get("public_ids", []))
+    for i in range(0, len(pendientes), LOTE_CLOUDINARY):
+        lote = pendientes[i:i + LOTE_CLOUDINARY]
+        cloudinary.api.delete_resources(lote)
+        # Lo ya borrado sale del trabajo: un reintento sigue donde se quedó
+        db.trabajos_limpieza.update_one({"_id": trabajo["_id"]}, {"$pull": {"public_ids": {"$in": lote}}})
+
+
+def _limpiar_propiedad(db, id_propiedad):
+    db.resenas.delete_many({"id_propiedad": id_propiedad})
+    # Primero quienes ya tienen el contador (ver contadores.py), luego el resto
+    db.usuarios.update_many({"favoritos": id_propiedad, "total_favoritos": {"$exists": True}},
+                            {"$pull": {"favoritos": id_propiedad}, "$inc": {"total_favoritos": -1}})
+    db.usuarios.update_many({"favoritos": id_propiedad}, {"$pull": {"favoritos": id_propiedad}})
+    db.novedades.delete_many({"id_propiedad": id_propiedad})
+
+
+def ejecutar(db, trabajo):
+    if trabajo["tipo"] == PROPIEDAD_ELIMINADA:
+        _limpiar_propiedad(db, trabajo["id_propiedad"])
+    _borrar_imagenes(db, trabajo)
+
+
+def tomar_trabajo(db):
+    """
+    Toma el siguiente trabajo disponible (o uno cuyo alquiler venció).
+    """
+    ahora = datetime.utcnow()
+    return db.trabajos_limpieza.find_one_and_update(
+        {"$or": [
+            {"estado": "pendiente", "disponible_desde": {"$lte": ahora}},
+            {"estado": "en_proceso", "alquilado_hasta": {"$lt": ahora}},
+        ]},
+        {"$set": {"estado": "en_proceso", "alquilado_hasta": ahora + DURACION_ALQUILER,
+                  "worker": f"{socket.gethostname()}:{os.getpid()}"},
+         "$inc": {"intentos": 1}},
+        sort=[("disponible_desde", 1)]
+    )
+
+
+def procesar_cola(db, maximo=None):
+    """
+    Procesa trabajos hasta vaciar la cola (o hasta `maximo`). Devuelve cuántos terminó.
+    """
+    terminados = 0
+    while maximo is None or terminados < maximo:
+        trabajo = tomar_trabajo(db)
+        if trabajo is None:
+            break
+        try:
+            ejecutar(db, trabajo)
+        except Exception as e:
+            print(f"Error en el trabajo de limpieza {trabajo['_id']}: {e}")
+            fallido = trabajo["intentos"] >= MAXIMO_INTENTOS
+            espera = timedelta(minutes=2 ** trabajo["intentos"])
+            db.trabajos_limpieza.update_one({"_id": trabajo["_id"]}, {"$set": {
+                "estado": "fallido" if fallido else "pendiente",
+                "disponible_desde": datetime.utcnow() + espera,
+                "error": str(e)
+            }})
+            continue
+        db.trabajos_limpieza.delete_one({"_id": trabajo["_id"]})
+        terminados += 1
+    return terminados
+
+
+def contar_pendientes(db):
+    return db.trabajos_limpieza.count_documents({"estado": {"$in": ["pendiente", "en_proceso"]}})
+
+
+def iniciar_limpieza(db, intervalo=INTERVALO_COLA):
+    """
+    Arranca el hilo que procesa la cola. Los trabajos encolados por este
+    worker se atienden de inmediato; los de otros workers, a más tardar en `intervalo`.
+    """
+    def ciclo():
+        while True:
+            _aviso.wait(intervalo)
+            _aviso.clear()
+            try:
+                procesar_cola(db)
+            except Exception as e:
+                print(f"Error procesando la cola de limpieza: {e}")
+
+    hilo = threading.Thread(target=ciclo, name="limpieza", daemon=True)
+    hilo.start()
+    return hilo
+
+
+# --- HUÉRFANOS QUE YA EXISTÍAN ---
+
+def _inexistentes(db, ids):
+    """
+    De una lista de ids de propiedad, los que ya no existen.
+    """
+    faltantes = []
+    for i in range(0, len(ids), LOTE_IDS):
+        lote = ids[i:i + LOTE_IDS]
+        existentes = {p["_id"] for p in db.propiedades.find({"_id": {"$in": lote}}, {"_id": 1})}
+        faltantes.extend(x for x in lote if x not in existentes)
+    return faltantes
+
+
+def recolectar_huerfanos(db, simular=False):
+    """
+    Borra reseñas, favoritos y novedades que apuntan a propiedades que ya no
+    existen. Devuelve un resumen {colección: documentos afectados}.
+    """
+    resumen = {}
+    for coleccion, campo in (("resenas", "id_propiedad"), ("usuarios", "favoritos"), ("novedades", "id_propiedad")):
+        faltantes = _inexistentes(db, db[coleccion].distinct(campo))
+        afectados = 0
+        for i in range(0, len(faltantes), LOTE_IDS):
+            lote = faltantes[i:i + LOTE_IDS]
+            filtro = {campo: {"$in": lote}}
+            if simular:
+                afectados += db[coleccion].count_documents(filtro)
+            elif coleccion == "usuarios":
+                # Se pueden quitar varios por usuario: el contador se recalcula al leerlo
+                afectados += db.usuarios.update_many(
+                    filtro, {"$pull": {"favoritos": {"$in": lote}}, "$unset": {"total_favoritos": ""}}
+                ).modified_count
+            else:
+                afectados += db[coleccion].delete_many(filtro).deleted_count
+        resumen[coleccion] = afectados
+    return resumen
+
+
+def imagenes_huerfanas(db, ahora=None):
+    """
+    public_ids de la carpeta de propiedades en Cloudinary que ninguna propiedad usa.
+    Las subidas recientes se ignoran: pueden ser de una publicación a medio guardar.
+    """
+    import cloudinary.api
+
+    limite = (ahora or datetime.utcnow()) - ANTIGUEDAD_IMAGEN_HUERFANA
+    en_uso = set(db.propiedades.distinct("imagenes.public_id"))
+    huerfanas = []
+    siguiente = None
+    while True:
+        opciones = {"type": "upload", "prefix": f"{CARPETA_IMAGENES}/", "max_results": 500}
+        if siguiente:
+            opciones["next_cursor"] = siguiente
+        respuesta = cloudinary.api.resources(**opciones)
+        for recurso in respuesta.get("resources", []):
+            creado = datetime.strptime(recurso["created_at"], "%Y-%m-%dT%H:%M:%SZ")
+            if recurso["public_id"] not in en_uso and creado < limite:
+                huerfanas.append(recurso["public_id"])
+        siguiente = respuesta.get("next_cursor")
+        if not siguiente:
+            return huerfanas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cola de limpieza y recolección de huérfanos.")
+    parser.add_argument("comando", choices=["huerfanos", "procesar", "pendientes"])
+    parser.add_argument("--imagenes", action="store_true", help="Buscar también imágenes huérfanas en Cloudinary")
+    parser.add_argument("--simular", action="store_true", help="Solo contar, no borrar")
+    args = parser.parse_args()
+
+    import cloudinary
+    from pymongo import MongoClient
+    from config import Config
+
+    db = MongoClient(Config.MONGODB_URI)["HomiDB"]
+    cloudinary.config(
+        cloud_name=Config.CLOUDINARY_CLOUD_NAME,
+        api_key=Config.CLOUDINARY_API_KEY,
+        api_secret=Config.CLOUDINARY_API_SECRET,
+        secure=True
+    )
+
+    if args.comando == "pendientes":
+        print(f"{contar_pendientes(db)} trabajos de limpieza pendientes")
+        return
+    if args.comando == "huerfanos":
+        for coleccion, total in recolectar_huerfanos(db, args.simular).items():
+            print(f"{coleccion}: {total} {'por limpiar' if args.simular else 'limpiados'}")
+        if args.imagenes:
+            huerfanas = imagenes_huerfanas(db)
+            print(f"Cloudinary: {len(huerfanas)} imágenes huérfanas")
+            if not args.simular:
+                encolar_imagenes(db, huerfanas)
+        if args.simular:
+            return
+    print(f"{procesar_cola(db)} trabajos de limpieza terminados")
+
+
+if __name__ == "__main__":
+    main()
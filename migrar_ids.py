@@ -0,0 +1,130 @@
+"""
+Migración en línea de ids a su forma canónica (ObjectId).
+
+Normaliza en lotes:
+  - propiedades.id_propietario
+  - resenas.id_propiedad
+  - usuarios.favoritos (cada elemento de la lista)
+
+Es reanudable: el último _id procesado de cada colección se guarda en la
+colección "migraciones", así que si se interrumpe basta con volver a correrla.
+Al terminar completa el punto de control se borra: la siguiente corrida
+revisa todo de nuevo (por ejemplo, ids en texto que se hayan escrito después).
+También es segura con la app encendida: cada actualización verifica que el
+valor no haya cambiado desde que se leyó.
+
+Uso:
+    python migrar_ids.py [--lote 500] [--reiniciar]
+"""
+import argparse
+from bson.objectid import ObjectId
+from pymongo import MongoClient, UpdateOne
+from config import Config
+
+NOMBRE_MIGRACION = "ids_canonicos"
+
+
+def _a_object_id(valor):
+    if isinstance(valor, ObjectId):
+        return valor
+    if isinstance(valor, str) and ObjectId.is_valid(valor):
+        return ObjectId(valor)
+    return None
+
+
+def _punto_de_control(db, coleccion):
+    estado = db.migraciones.find_one({"_id": NOMBRE_MIGRACION}) or {}
+    return estado.get("ultimo_id", {}).get(coleccion)
+
+
+def _guardar_punto_de_control(db, coleccion, ultimo_id):
+    db.migraciones.update_one(
+        {"_id": NOMBRE_MIGRACION},
+        {"$set": {f"ultimo_id.{coleccion}": ultimo_id}},
+        upsert=True
+    )
+
+
+def _recorrer_en_lotes(db, coleccion, filtro, proyeccion, tam_lote):
+    """
+    Recorre los documentos que cumplen el filtro en orden de _id, a partir
+    del último punto de control, entregando listas de tamaño tam_lote.
+    """
+    ultimo_id = _punto_de_control(db, coleccion)
+    while True:
+        filtro_lote = dict(filtro)
+        if ultimo_id is not None:
+            filtro_lote["_id"] = {"$gt": ultimo_id}
+        lote = list(db[coleccion].find(filtro_lote, proyeccion).sort("_id", 1).limit(tam_lote))
+        if not lote:
+            return
+        yield lote
+        ultimo_id = lote[-1]["_id"]
+        _guardar_punto_de_control(db, coleccion, ultimo_id)
+
+
+def migrar_campo(db, coleccion, campo, tam_lote):
+    """
+    Convierte un campo escalar guardado como texto a ObjectId.
+    """
+    total = 0
+    invalidos = 0
+    for lote in _recorrer_en_lotes(db, coleccion, {campo: {"$type": "string"}}, {campo: 1}, tam_lote):
+        operaciones = []
+        for doc in lote:
+            nuevo = _a_object_id(doc[campo])
+            if nuevo is None:
+                invalidos += 1
+                continue
+            # El filtro incluye el valor viejo: si alguien lo cambió mientras tanto, no se toca
+            operaciones.append(UpdateOne({"_id": doc["_id"], campo: doc[campo]}, {"$set": {campo: nuevo}}))
+        if operaciones:
+            total += db[coleccion].bulk_write(operaciones, ordered=False).modified_count
+    print(f"{coleccion}.{campo}: {total} convertidos, {invalidos} ids inválidos sin tocar")
+
+
+def migrar_favoritos(db, tam_lote):
+    """
+    Convierte cada elemento de usuarios.favoritos a ObjectId, quitando duplicados
+    y valores que no son ids.
+    """
+    total = 0
+    filtro = {"favoritos": {"$elemMatch": {"$type": "string"}}}
+    for lote in _recorrer_en_lotes(db, "usuarios", filtro, {"favoritos": 1}, tam_lote):
+        operaciones = []
+        for doc in lote:
+            nuevos = []
+            vistos = set()
+            for fid in doc["favoritos"]:
+                oid = _a_object_id(fid)
+                if oid is not None and oid not in vistos:
+                    vistos.add(oid)
+                    nuevos.append(oid)
+            operaciones.append(UpdateOne(
+                {"_id": doc["_id"], "favoritos": doc["favoritos"]},
+                {"$set": {"favoritos": nuevos}}
+            ))
+        if operaciones:
+            total += db.usuarios.bulk_write(operaciones, ordered=False).modified_count
+    print(f"usuarios.favoritos: {total} usuarios normalizados")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Normaliza ids de referencia a ObjectId.")
+    parser.add_argument("--lote", type=int, default=500, help="Documentos por lote")
+    parser.add_argument("--reiniciar", action="store_true", help="Ignora el punto de control guardado")
+    args = parser.parse_args()
+
+    db = MongoClient(Config.MONGODB_URI)["HomiDB"]
+    if args.reiniciar:
+        db.migraciones.delete_one({"_id": NOMBRE_MIGRACION})
+
+    migrar_campo(db, "propiedades", "id_propietario", args.lote)
+    migrar_campo(db, "resenas", "id_propiedad", args.lote)
+    migrar_favoritos(db, args.lote)
+    # Terminó completa: no se reanuda desde aquí la próxima vez
+    db.migraciones.delete_one({"_id": NOMBRE_MIGRACION})
+
+
+if __name__ == "__main__":
+    main()
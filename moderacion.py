@@ -0,0 +1,145 @@
+"""
+Cola de moderación de publicaciones.
+
+Toda propiedad nueva entra con estado_publicacion "pendiente" y las páginas
+públicas solo muestran las "aprobada" (consultas.FILTRO_PUBLICO). La cola se
+lee con un índice parcial que solo contiene las pendientes, así su tamaño no
+depende del total de propiedades, y se pagina por _id (la más antigua
+primero) sin skip().
+
+Aprobar o rechazar un lote es un solo bulk_write, los eventos de auditoría se
+guardan con un insert_many y después se actualizan los índices en memoria de
+este worker y se invalidan sus caches.
+
+Las propiedades publicadas antes de que existiera la moderación se aprueban
+una sola vez con:
+    python moderacion.py aprobar-existentes
+"""
+import sys
+from datetime import datetime
+from pymongo import UpdateOne
+import busquedas_guardadas
+import cache_local
+import consultas
+import destacadas
+import estadisticas_mercado
+from autocompletado import indice_autocompletado
+from recomendador import recomendador
+
+TAMANO_PAGINA = 50
+MAXIMO_LOTE = 500
+DECISIONES = {"aprobada": "APROBAR_PROPIEDAD", "rechazada": "RECHAZAR_PROPIEDAD"}
+
+FILTRO_PENDIENTES = {"estado_publicacion": "pendiente"}
+PROYECCION_COLA = {**consultas.PROYECCION_TARJETA, "descripcion": 1, "ciudad": 1, "tipo_propiedad": 1,
+                   "id_propietario": 1, "fecha_publicacion": 1}
+
+
+def contar_pendientes(db):
+    return db.propiedades.count_documents(FILTRO_PENDIENTES)
+
+
+def cola(db, despues=None, limite=TAMANO_PAGINA):
+    """
+    Una página de la cola. Devuelve (propiedades, cursor de la siguiente página o None).
+    """
+    filtro = dict(FILTRO_PENDIENTES)
+    if despues is not None:
+        filtro["_id"] = {"$gt": despues}
+    cursor = db.propiedades.find(filtro, PROYECCION_COLA).sort("_id", 1).limit(limite + 1)
+    pagina = list(consultas.con_imagen_principal(cursor))
+    siguiente = pagina[limite - 1]["_id"] if len(pagina) > limite else None
+    return pagina[:limite], siguiente
+
+
+def resolver(db, ids, decision, id_moderador, motivo=None):
+    """
+    Aprueba o rechaza un lote de propiedades pendientes. Las que ya no estén
+    pendientes (otro moderador se adelantó) se ignoran. Devuelve cuántas cambiaron.
+    """
+    if decision not in DECISIONES:
+        raise ValueError(f"Decisión inválida: {decision}")
+    ids = list(dict.fromkeys(ids))[:MAXIMO_LOTE]
+    if not ids:
+        return 0
+
+    # Documentos completos: hacen falta para el recomendador, el autocompletado y las estadísticas
+    afectadas = list(db.propiedades.find({"_id": {"$in": ids}, **FILTRO_PENDIENTES}))
+    if not afectadas:
+        return 0
+
+    ahora = datetime.utcnow()
+    cambios = {"estado_publicacion": decision, "fecha_moderacion": ahora,
+               "id_moderador": id_moderador, "fecha_actualizacion": ahora}
+    if decision == "rechazada" and motivo:
+        cambios["motivo_rechazo"] = motivo
+    resultado = db.propiedades.bulk_write(
+        [UpdateOne({"_id": p["_id"], **FILTRO_PENDIENTES}, {"$set": cambios}) for p in afectadas],
+        ordered=False
+    )
+
+    detalle_motivo = f" Motivo: {motivo}" if decision == "rechazada" and motivo else ""
+    db.log_audotoria.insert_many([{
+        "id_usuario": id_moderador,
+        "accion": DECISIONES[decision],
+        "detalles": f"Propiedad {p['_id']}: {p.get('titulo', '')}.{detalle_motivo}",
+        "fecha_evento": ahora
+    } for p in afectadas], ordered=False)
+
+    grupos = {}
+    for prop in afectadas:
+        prop.update(cambios)
+        cache_local.propiedades.invalidar(prop["_id"])
+        # Con estado "rechazada" el recomendador y el autocompletado la descartan
+        recomendador.actualizar(prop)
+        indice_autocompletado.actualizar(prop)
+        grupos[estadisticas_mercado.clave_de_propiedad(prop)] = prop
+    for prop in grupos.values():
+        estadisticas_mercado.marcar_pendiente(db, prop)
+    destacadas.rotacion_destacadas.invalidar()
+
+    # Las aprobadas entran al feed de novedades de quien tenga una búsqueda que las incluya
+    if decision == "aprobada":
+        try:
+            busquedas_guardadas.notificar(db, afectadas)
+        except Exception as e:
+            print(f"Error generando novedades: {e}")
+    return resultado.modified_count
+
+
+def aprobar_existentes(db, antes=None):
+    """
+    Aprueba de una vez las propiedades pendientes publicadas antes de `antes`
+    (por defecto, todas). Es el paso de migración al activar la moderación.
+    """
+    filtro = dict(FILTRO_PENDIENTES)
+    if antes is not None:
+        filtro["fecha_publicacion"] = {"$lt": antes}
+    ahora = datetime.utcnow()
+    resultado = db.propiedades.update_many(
+        filtro, {"$set": {"estado_publicacion": "aprobada", "fecha_moderacion": ahora, "fecha_actualizacion": ahora}}
+    )
+    return resultado.modified_count
+
+
+def main(argv):
+    from pymongo import MongoClient
+    from config import Config
+
+    db = MongoClient(Config.MONGODB_URI)["HomiDB"]
+    comando = argv[1] if len(argv) > 1 else ""
+    if comando == "aprobar-existentes":
+        antes = datetime.strptime(argv[2], "%Y-%m-%d") if len(argv) > 2 else None
+        print(f"{aprobar_existentes(db, antes)} propiedades aprobadas")
+        # Las estadísticas de mercado solo cuentan aprobadas: se recalculan todas
+        print(f"{estadisticas_mercado.recalcular_todo(db)} grupos de mercado recalculados")
+        return 0
+    if comando == "pendientes":
+        print(f"{contar_pendientes(db)} propiedades pendientes")
+        return 0
+    print("Uso: python moderacion.py aprobar-existentes [YYYY-MM-DD] | pendientes")
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,346 @@
+"""
+Perfilador por muestreo, bajo demanda.
+
+Cuando una ruta se pone lenta en producción, un admin lo enciende en
+/admin/perfilador para un porcentaje de las peticiones o para un solo
+endpoint. Mientras una petición elegida corre, su propio hilo anota la pila
+cada intervalo_ms (ver Muestreo) y las pilas se cuentan por endpoint. Las
+peticiones no elegidas solo pagan un random(); las elegidas, una lectura del
+reloj en cada llamada de Python o de C. En un ciclo de llamadas pequeñas eso
+es unas 10 veces más lento que sin perfilar (cProfile, que es de C, unas 5);
+en las rutas que pasan el tiempo esperando a MongoDB casi no se nota. Por eso
+se perfila solo un porcentaje o un endpoint, no todo.
+
+No se muestrea desde otro hilo con sys._current_frames(): soltar desde ahí
+la última referencia a un frame ya terminado finaliza sus variables (por
+ejemplo el generador de stream_with_context) en el hilo equivocado.
+
+Los conteos se guardan en CARPETA_PERFILES, un archivo por endpoint y por
+worker en formato "collapsed stacks" de flamegraph.pl ("a;b;c 12"), y se
+juntan al descargarlos como .folded o como SVG (el flamegraph se dibuja
+aquí, sin servicios externos). Los ajustes están en
+CARPETA_PERFILES/ajustes.json, así los ven todos los workers del host.
+"""
+import atexit
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+from datetime import datetime
+from html import escape
+
+CARPETA_PERFILES = os.getenv("CARPETA_PERFILES", "perfiles")
+INTERVALO_GUARDADO = 10     # segundos entre escrituras de los conteos a disco
+RELEER_AJUSTES = 2          # segundos que se confía en los ajustes leídos
+PROFUNDIDAD_MAXIMA = 200
+EXCLUIDOS = ("static", "admin_perfilador", "salud_listo")   # endpoints que nunca se muestrean
+
+AJUSTES_INICIALES = {"activo": False, "porcentaje": 1.0, "endpoint": "", "intervalo_ms": 5}
+
+
+def _nombre_seguro(endpoint):
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", endpoint)
+
+
+def _pila(frame):
+    """
+    La pila de un frame como "modulo.funcion;modulo.funcion;...", de la raíz a la hoja.
+    """
+    nombres = []
+    while frame is not None and len(nombres) < PROFUNDIDAD_MAXIMA:
+        codigo = frame.f_code
+        nombre = f"{frame.f_globals.get('__name__', '?')}.{getattr(codigo, 'co_qualname', codigo.co_name)}"
+        nombres.append(nombre.replace(";", ":").replace(" ", "_"))
+        frame = frame.f_back
+    return ";".join(reversed(nombres))
+
+
+def leer_folded(ruta):
+    conteo = Counter()
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            for linea in f:
+                pila, _, n = linea.rstrip("\n").rpartition(" ")
+                if pila and n.isdigit():
+                    conteo[pila] += int(n)
+    except FileNotFoundError:
+        pass
+    return conteo
+
+
+def a_folded(conteo):
+    return "".join(f"{pila} {n}\n" for pila, n in sorted(conteo.items()))
+
+
+def _escribir(ruta, texto):
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        f.write(texto)
+    os.replace(temporal, ruta)
+
+
+class Muestreo:
+    """
+    Perfil de una sola petición. Es el hook de sys.setprofile del hilo que la
+    atiende: en cada llamada o retorno, si ya pasó el intervalo desde la última
+    muestra, cuenta la pila actual con peso igual a los intervalos que pasaron
+    (así una espera larga dentro de una función de C, como leer del socket de
+    MongoDB, pesa lo que duró y no una sola muestra).
+    """
+    def __init__(self, endpoint, intervalo):
+        self.endpoint = endpoint
+        self.intervalo = intervalo
+        self.pilas = Counter()
+        self._ultima = time.perf_counter()
+        self._siguiente = self._ultima + intervalo
+
+    def __call__(self, frame, evento, arg, reloj=time.perf_counter):
+        # Se llama en cada llamada y retorno: el caso común (aún no toca) debe ser lo más barato posible
+        ahora = reloj()
+        if ahora < self._siguiente:
+            return
+        peso = int((ahora - self._ultima) / self.intervalo)
+        self._ultima = ahora
+        self._siguiente = ahora + self.intervalo
+        pila = _pila(frame)
+        if evento in ("c_return", "c_exception"):
+            # El tiempo se fue dentro de la función de C que acaba de regresar
+            pila += f";{getattr(arg, '__module__', None) or 'builtins'}.{getattr(arg, '__qualname__', '?')}"
+        self.pilas[pila] += peso
+
+
+class Perfilador:
+    def __init__(self, carpeta=CARPETA_PERFILES):
+        self.carpeta = carpeta
+        self._lock = threading.Lock()
+        self._pilas = {}        # endpoint -> Counter de pilas aún no guardadas
+        self._guardado = time.monotonic()
+        self._ajustes = dict(AJUSTES_INICIALES)
+        self._ajustes_leidos = 0
+        atexit.register(self.guardar)
+
+    # --- AJUSTES ---
+
+    def _ruta_ajustes(self):
+        return os.path.join(self.carpeta, "ajustes.json")
+
+    def ajustes(self):
+        if time.monotonic() - self._ajustes_leidos > RELEER_AJUSTES:
+            try:
+                with open(self._ruta_ajustes(), encoding="utf-8") as f:
+                    self._ajustes = {**AJUSTES_INICIALES, **json.load(f)}
+            except FileNotFoundError:
+                self._ajustes = dict(AJUSTES_INICIALES)
+            except ValueError as e:
+                print(f"Ajustes del perfilador inválidos: {e}")
+            self._ajustes_leidos = time.monotonic()
+        return self._ajustes
+
+    def guardar_ajustes(self, activo, porcentaje, endpoint, intervalo_ms):
+        """
+        Guarda los ajustes para todos los workers. Lanza ValueError si no son válidos.
+        """
+        porcentaje = float(porcentaje)
+        intervalo_ms = int(intervalo_ms)
+        if not 0 <= porcentaje <= 100:
+            raise ValueError("El porcentaje debe estar entre 0 y 100")
+        if not 1 <= intervalo_ms <= 1000:
+            raise ValueError("El intervalo debe estar entre 1 y 1000 ms")
+        ajustes = {"activo": bool(activo), "porcentaje": porcentaje,
+                   "endpoint": endpoint or "", "intervalo_ms": intervalo_ms}
+        os.makedirs(self.carpeta, exist_ok=True)
+        _escribir(self._ruta_ajustes(), json.dumps(ajustes))
+        self._ajustes = ajustes
+        self._ajustes_leidos = time.monotonic()
+        return ajustes
+
+    # --- MUESTREO ---
+
+    def elegir(self, endpoint):
+        """
+        Si la petición a este endpoint se perfila, según los ajustes vigentes.
+        """
+        ajustes = self.ajustes()
+        if not ajustes["activo"] or not endpoint or endpoint.startswith(EXCLUIDOS):
+            return False
+        if ajustes["endpoint"]:
+            return endpoint == ajustes["endpoint"]
+        return random.random() * 100 < ajustes["porcentaje"]
+
+    def empezar(self, endpoint):
+        """
+        Empieza a muestrear la petición en curso (en el hilo que la atiende).
+        """
+        muestreo = Muestreo(endpoint, self.ajustes()["intervalo_ms"] / 1000)
+        sys.setprofile(muestreo)
+        return muestreo
+
+    def terminar(self, muestreo):
+        sys.setprofile(None)
+        with self._lock:
+            self._pilas.setdefault(muestreo.endpoint, Counter()).update(muestreo.pilas)
+            toca_guardar = time.monotonic() - self._guardado > INTERVALO_GUARDADO
+            if toca_guardar:
+                self._guardado = time.monotonic()
+        if toca_guardar:
+            try:
+                self.guardar()
+            except Exception as e:
+                print(f"Error guardando perfiles: {e}")
+
+    # --- ARCHIVOS ---
+
+    def guardar(self):
+        """
+        Suma lo muestreado en memoria a los archivos de este worker.
+        """
+        with self._lock:
+            pilas, self._pilas = self._pilas, {}
+        if not pilas:
+            return
+        os.makedirs(self.carpeta, exist_ok=True)
+        for endpoint, conteo in pilas.items():
+            ruta = os.path.join(self.carpeta, f"{_nombre_seguro(endpoint)}.{os.getpid()}.folded")
+            conteo.update(leer_folded(ruta))
+            _escribir(ruta, a_folded(conteo))
+
+    def _archivos(self):
+        """
+        (endpoint, ruta) de cada archivo de conteos, de todos los workers.
+        """
+        try:
+            nombres = os.listdir(self.carpeta)
+        except FileNotFoundError:
+            return []
+        return [(nombre.rsplit(".", 2)[0], os.path.join(self.carpeta, nombre))
+                for nombre in nombres if nombre.endswith(".folded")]
+
+    def resumen(self):
+        """
+        Por endpoint: muestras, pilas distintas y última escritura, los más muestreados primero.
+        """
+        self.guardar()
+        por_endpoint = {}
+        for endpoint, ruta in self._archivos():
+            conteo = leer_folded(ruta)
+            datos = por_endpoint.setdefault(endpoint, {"endpoint": endpoint, "muestras": 0, "pilas": set(), "actualizado": 0})
+            datos["muestras"] += sum(conteo.values())
+            datos["pilas"].update(conteo)
+            datos["actualizado"] = max(datos["actualizado"], os.path.getmtime(ruta))
+        for datos in por_endpoint.values():
+            datos["pilas"] = len(datos["pilas"])
+            datos["actualizado"] = datetime.fromtimestamp(datos["actualizado"])
+        return sorted(por_endpoint.values(), key=lambda d: d["muestras"], reverse=True)
+
+    def pilas_de(self, endpoint):
+        """
+        Los conteos de un endpoint, sumando los archivos de todos los workers.
+        """
+        self.guardar()
+        conteo = Counter()
+        for nombre, ruta in self._archivos():
+            if nombre == _nombre_seguro(endpoint):
+                conteo.update(leer_folded(ruta))
+        return conteo
+
+    def limpiar(self, endpoint=None):
+        with self._lock:
+            if endpoint:
+                self._pilas.pop(endpoint, None)
+            else:
+                self._pilas = {}
+        borrados = 0
+        for nombre, ruta in self._archivos():
+            if endpoint is None or nombre == _nombre_seguro(endpoint):
+                os.remove(ruta)
+                borrados += 1
+        return borrados
+
+
+perfilador = Perfilador()
+
+
+def init_perfilador(app):
+    """
+    Registra el muestreo de peticiones en la app.
+    """
+    from flask import g, request
+
+    @app.before_request
+    def perfilar_peticion():
+        if perfilador.elegir(request.endpoint):
+            g.muestreo = perfilador.empezar(request.endpoint)
+
+    @app.teardown_request
+    def terminar_perfil(error=None):
+        muestreo = g.pop("muestreo", None)
+        if muestreo is not None:
+            perfilador.terminar(muestreo)
+
+
+# --- FLAMEGRAPH SVG ---
+
+ANCHO_SVG = 1200
+ALTO_CUADRO = 17
+MARGEN = 10
+ANCHO_MINIMO = 0.5      # px; los cuadros más angostos no se dibujan
+ANCHO_LETRA = 7
+
+
+def _color(nombre):
+    h = zlib.crc32(nombre.encode("utf-8"))
+    return f"rgb({205 + h % 50},{(h >> 8) % 230},{(h >> 16) % 55})"
+
+
+def flamegraph_svg(conteo, titulo=""):
+    """
+    Dibuja un flamegraph (raíz abajo) a partir de pilas colapsadas.
+    """
+    arbol = {"n": 0, "hijos": {}}
+    for pila, n in conteo.items():
+        nodo = arbol
+        nodo["n"] += n
+        for nombre in pila.split(";"):
+            nodo = nodo["hijos"].setdefault(nombre, {"n": 0, "hijos": {}})
+            nodo["n"] += n
+
+    total = arbol["n"] or 1
+    escala = (ANCHO_SVG - 2 * MARGEN) / total
+    cuadros = []
+
+    def recorrer(nodo, x, nivel):
+        for nombre, hijo in sorted(nodo["hijos"].items()):
+            ancho = hijo["n"] * escala
+            if ancho >= ANCHO_MINIMO:
+                cuadros.append((nombre, hijo["n"], x, nivel, ancho))
+                recorrer(hijo, x, nivel + 1)
+            x += ancho
+
+    recorrer(arbol, MARGEN, 0)
+    niveles = max((c[3] for c in cuadros), default=0) + 1
+    alto = niveles * ALTO_CUADRO + 3 * MARGEN + 20
+
+    partes = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{ANCHO_SVG}" height="{alto}" '
+        f'viewBox="0 0 {ANCHO_SVG} {alto}" font-family="Verdana, sans-serif" font-size="12">',
+        f'<rect width="100%" height="100%" fill="#f8f8f8"/>',
+        f'<text x="{ANCHO_SVG / 2}" y="22" text-anchor="middle" font-size="16">'
+        f'{escape(titulo)} ({arbol["n"]} muestras)</text>',
+    ]
+    for nombre, n, x, nivel, ancho in cuadros:
+        y = alto - MARGEN - (nivel + 1) * ALTO_CUADRO
+        letras = int((ancho - 6) / ANCHO_LETRA)
+        etiqueta = nombre if len(nombre) <= letras else (nombre[:letras - 2] + ".." if letras > 2 else "")
+        partes.append(
+            f'<g><title>{escape(nombre)} ({n} muestras, {100 * n / total:.2f}%)</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{ancho:.1f}" height="{ALTO_CUADRO - 1}" fill="{_color(nombre)}" rx="2"/>'
+            + (f'<text x="{x + 3:.1f}" y="{y + 12}">{escape(etiqueta)}</text>' if etiqueta else "")
+            + '</g>'
+        )
+    partes.append("</svg>")
+    return "\n".join(partes)
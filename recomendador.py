@@ -0,0 +1,279 @@
+"""
+Motor de "propiedades similares" para la página de detalle.
+
+Mantiene en memoria (por worker) una matriz NumPy con un renglón por propiedad
+activa: precio, superficie, habitaciones, baños y coordenadas normalizados, el
+tipo de propiedad y de operación en one-hot, y las amenidades como 0/1. Los
+vecinos más cercanos se calculan en una sola pasada vectorizada sobre la
+matriz, sin consultar MongoDB.
+
+La matriz se construye la primera vez que se usa, se actualiza renglón por
+renglón cuando se crea, edita o elimina una propiedad en este worker, y se
+reconstruye completa cada REFRESCO_SEGUNDOS, en segundo plano, para recoger
+los cambios hechos desde otros workers (ver cache_local.Reconstruible). Los
+cambios que llegan mientras se reconstruye se anotan y se vuelven a aplicar
+sobre la matriz nueva. La matriz reserva lugar de sobra (se duplica al
+llenarse) para que agregar un renglón no la copie completa.
+"""
+import threading
+import time
+import numpy as np
+import cache_local
+import consultas
+
+TIPOS_PROPIEDAD = ["casa", "departamento", "terreno", "condominio", "local"]
+TIPOS_OPERACION = ["venta", "renta"]
+AMENIDADES = ["alberca", "estacionamiento", "jardin", "gimnasio", "roof_garden",
+              "cuarto_servicio", "bodega", "elevador", "amueblado", "permite_mascotas"]
+
+# Peso de cada grupo de columnas en la distancia
+PESO_NUMERICOS = 1.0
+PESO_TIPO_PROPIEDAD = 2.0
+PESO_TIPO_OPERACION = 4.0  # una renta casi nunca es "similar" a una venta
+PESO_AMENIDADES = 0.3
+
+NUM_NUMERICOS = 6
+NUM_COLUMNAS = NUM_NUMERICOS + len(TIPOS_PROPIEDAD) + len(TIPOS_OPERACION) + len(AMENIDADES)
+
+REFRESCO_SEGUNDOS = 600
+CAPACIDAD_MINIMA = 64
+
+PROYECCION = {
+    "titulo": 1, "colonia": 1, "precio": 1, "superficie_m2": 1,
+    "numero_habitaciones": 1, "numero_banos": 1, "latitud": 1, "longitud": 1,
+    "tipo_propiedad": 1, "tipo_operacion": 1, "amenidades": 1, "disponible": 1, "estado_publicacion": 1,
+    "imagenes": {"$slice": 1}
+}
+
+
+def _numero(valor):
+    try:
+        return float(valor or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _tiene(amenidades, nombre):
+    valor = amenidades.get(nombre)
+    if isinstance(valor, dict):
+        return bool(valor.get("tiene"))
+    return bool(valor)
+
+
+def _vector_crudo(prop):
+    """
+    Renglón sin normalizar. Precio y superficie van en escala logarítmica para
+    que una diferencia de $100,000 pese distinto en una casa de 1 y de 10 millones.
+    """
+    fila = np.zeros(NUM_COLUMNAS, dtype=np.float64)
+    fila[0] = np.log1p(max(_numero(prop.get("precio")), 0.0))
+    fila[1] = np.log1p(max(_numero(prop.get("superficie_m2")), 0.0))
+    fila[2] = _numero(prop.get("numero_habitaciones"))
+    fila[3] = _numero(prop.get("numero_banos"))
+    fila[4] = _numero(prop.get("latitud"))
+    fila[5] = _numero(prop.get("longitud"))
+
+    col = NUM_NUMERICOS
+    tipo = str(prop.get("tipo_propiedad") or "").lower()
+    if tipo in TIPOS_PROPIEDAD:
+        fila[col + TIPOS_PROPIEDAD.index(tipo)] = 1.0
+    col += len(TIPOS_PROPIEDAD)
+
+    operacion = str(prop.get("tipo_operacion") or "").lower()
+    if operacion in TIPOS_OPERACION:
+        fila[col + TIPOS_OPERACION.index(operacion)] = 1.0
+    col += len(TIPOS_OPERACION)
+
+    amenidades = prop.get("amenidades") or {}
+    for i, nombre in enumerate(AMENIDADES):
+        fila[col + i] = 1.0 if _tiene(amenidades, nombre) else 0.0
+    return fila
+
+
+def _tarjeta(prop):
+    """Datos mínimos para pintar la tarjeta sin volver a MongoDB."""
+    imagen = ""
+    if prop.get("imagenes"):
+        primera_img = prop["imagenes"][0]
+        imagen = primera_img.get("url_imagen", "") if isinstance(primera_img, dict) else primera_img
+    return {
+        "_id": prop["_id"],
+        "titulo": prop.get("titulo", ""),
+        "colonia": prop.get("colonia", ""),
+        "precio": prop.get("precio", 0),
+        "tipo_operacion": prop.get("tipo_operacion", ""),
+        "imagen_principal_url": imagen
+    }
+
+
+def _es_activa(prop):
+    return prop.get("disponible", True) is not False and consultas.es_publica(prop)
+
+
+class RecomendadorSimilares(cache_local.Reconstruible):
+    REFRESCO_SEGUNDOS = REFRESCO_SEGUNDOS
+
+    def __init__(self):
+        super().__init__("recomendador")
+        self._lock = threading.Lock()
+        # Los primeros len(self._ids) renglones están en uso; el resto es capacidad libre
+        self._matriz = np.zeros((0, NUM_COLUMNAS), dtype=np.float32)
+        self._activos = np.zeros(0, dtype=bool)
+        self._durante = None       # _id -> prop (o None si se quitó) mientras corre construir()
+        self._ids = []
+        self._tarjetas = []
+        self._posicion = {}
+        self._media = np.zeros(NUM_COLUMNAS)
+        self._escala = np.ones(NUM_COLUMNAS)
+        self._pesos = self._calcular_pesos()
+
+    @staticmethod
+    def _calcular_pesos():
+        pesos = np.empty(NUM_COLUMNAS, dtype=np.float32)
+        pesos[:NUM_NUMERICOS] = PESO_NUMERICOS
+        col = NUM_NUMERICOS
+        pesos[col:col + len(TIPOS_PROPIEDAD)] = PESO_TIPO_PROPIEDAD
+        col += len(TIPOS_PROPIEDAD)
+        pesos[col:col + len(TIPOS_OPERACION)] = PESO_TIPO_OPERACION
+        col += len(TIPOS_OPERACION)
+        pesos[col:] = PESO_AMENIDADES
+        return pesos
+
+    def _normalizar(self, crudo):
+        return ((crudo - self._media) / self._escala).astype(np.float32)
+
+    def construir(self, db):
+        """
+        Reconstruye la matriz completa desde MongoDB.
+        """
+        with self._lock:
+            # Lo que se cree, edite o elimine desde aquí puede no salir en la lectura
+            self._durante = {}
+        try:
+            docs = [p for p in db.propiedades.find(consultas.FILTRO_PUBLICO, PROYECCION) if _es_activa(p)]
+        except Exception:
+            with self._lock:
+                self._durante = None
+            raise
+        crudos = np.array([_vector_crudo(p) for p in docs]).reshape(len(docs), NUM_COLUMNAS)
+
+        # Solo las columnas numéricas se estandarizan; one-hot y amenidades ya son 0/1
+        media = np.zeros(NUM_COLUMNAS)
+        escala = np.ones(NUM_COLUMNAS)
+        if len(docs):
+            media[:NUM_NUMERICOS] = crudos[:, :NUM_NUMERICOS].mean(axis=0)
+            desviacion = crudos[:, :NUM_NUMERICOS].std(axis=0)
+            escala[:NUM_NUMERICOS] = np.where(desviacion > 0, desviacion, 1.0)
+
+        capacidad = max(CAPACIDAD_MINIMA, 2 * len(docs))
+        matriz = np.zeros((capacidad, NUM_COLUMNAS), dtype=np.float32)
+        matriz[:len(docs)] = (crudos - media) / escala
+        activos = np.zeros(capacidad, dtype=bool)
+        activos[:len(docs)] = True
+
+        with self._lock:
+            self._media = media
+            self._escala = escala
+            self._matriz = matriz
+            self._activos = activos
+            self._ids = [p["_id"] for p in docs]
+            self._tarjetas = [_tarjeta(p) for p in docs]
+            self._posicion = {pid: i for i, pid in enumerate(self._ids)}
+            for id_propiedad, prop in self._durante.items():
+                if prop is None:
+                    self._quitar_sin_lock(id_propiedad)
+                else:
+                    self._poner_sin_lock(prop)
+            self._durante = None
+            self._construido_en = time.monotonic()
+
+    def _crecer_sin_lock(self):
+        capacidad = max(CAPACIDAD_MINIMA, 2 * len(self._matriz))
+        matriz = np.zeros((capacidad, NUM_COLUMNAS), dtype=np.float32)
+        matriz[:len(self._ids)] = self._matriz[:len(self._ids)]
+        activos = np.zeros(capacidad, dtype=bool)
+        activos[:len(self._ids)] = self._activos[:len(self._ids)]
+        self._matriz = matriz
+        self._activos = activos
+
+    def _poner_sin_lock(self, prop):
+        if not _es_activa(prop):
+            self._quitar_sin_lock(prop["_id"])
+            return
+        pos = self._posicion.get(prop["_id"])
+        if pos is None:
+            if len(self._ids) == len(self._matriz):
+                self._crecer_sin_lock()
+            pos = len(self._ids)
+            self._ids.append(prop["_id"])
+            self._tarjetas.append(_tarjeta(prop))
+            self._posicion[prop["_id"]] = pos
+        else:
+            self._tarjetas[pos] = _tarjeta(prop)
+        # Con la media y escala vigentes, dentro del candado
+        self._matriz[pos] = self._normalizar(_vector_crudo(prop))
+        self._activos[pos] = True
+
+    def _quitar_sin_lock(self, id_propiedad):
+        pos = self._posicion.get(id_propiedad)
+        if pos is not None:
+            self._activos[pos] = False
+
+    def actualizar(self, prop):
+        """
+        Agrega o reemplaza el renglón de una propiedad (después de crearla o editarla).
+        """
+        with self._lock:
+            if self._durante is not None:
+                self._durante[prop["_id"]] = prop
+            if self._construido_en is None:
+                return  # Aún no se usa: se construirá completa la primera vez
+            self._poner_sin_lock(prop)
+
+    def quitar(self, id_propiedad):
+        """
+        Marca la propiedad como inactiva (el renglón se descarta en la siguiente reconstrucción).
+        """
+        with self._lock:
+            if self._durante is not None:
+                self._durante[id_propiedad] = None
+            self._quitar_sin_lock(id_propiedad)
+
+    def similares(self, db, prop, k=4):
+        """
+        Devuelve las tarjetas de las k propiedades más parecidas a prop.
+        """
+        self._asegurar_construido(db)
+        with self._lock:
+            n = len(self._ids)
+            if not n:
+                return []
+            matriz = self._matriz[:n]
+            pos = self._posicion.get(prop["_id"])
+            consulta = matriz[pos] if pos is not None else self._normalizar(_vector_crudo(prop))
+
+            diferencia = matriz - consulta
+            distancias = (diferencia * diferencia) @ self._pesos
+            distancias[~self._activos[:n]] = np.inf
+            if pos is not None:
+                distancias[pos] = np.inf
+
+            k = min(k, int(np.isfinite(distancias).sum()))
+            if k <= 0:
+                return []
+            candidatos = np.argpartition(distancias, k - 1)[:k]
+            ordenados = candidatos[np.argsort(distancias[candidatos])]
+            return [self._tarjetas[i] for i in ordenados]
+
+    def similares_de(self, db, id_propiedad, k=4):
+        """
+        Como similares(), a partir del id. None si la propiedad no existe.
+        """
+        prop = db.propiedades.find_one({"_id": id_propiedad}, PROYECCION)
+        if prop is None:
+            return None
+        return self.similares(db, prop, k)
+
+
+# Una instancia por worker
+recomendador = RecomendadorSimilares()
@@ -0,0 +1,167 @@
+"""
+Respuestas HTML en streaming y compresión al vuelo.
+
+- transmitir_plantilla(): manda el inicio de la página de inmediato y luego las
+  tarjetas conforme salen del cursor de MongoDB, en bloques de ~8 KB.
+- respuesta_no_modificada() / cache_compartida(): GET condicional con ETag y
+  Last-Modified para páginas que pueden servir los caches compartidos.
+- init_compresion(): comprime con brotli (si está instalado) o gzip las
+  respuestas HTML/JSON, incluidas las que van en streaming.
+"""
+import gzip
+import zlib
+from flask import Response, get_flashed_messages, request, session, stream_template
+from flask_wtf.csrf import generate_csrf
+
+try:
+    import brotli  # Opcional: pip install brotli
+except ImportError:
+    brotli = None
+
+TAMANO_BLOQUE = 8 * 1024
+TIPOS_COMPRIMIBLES = ("text/html", "application/json", "application/x-ndjson", "text/csv", "text/plain")
+MINIMO_BYTES = 500
+
+
+def agrupar(partes, tamano=TAMANO_BLOQUE):
+    """
+    Jinja (o cualquier generador de líneas) entrega pedacitos de texto muy
+    pequeños; los juntamos en bloques para no hacer una escritura al socket por
+    cada uno.
+    """
+    bloque = []
+    acumulado = 0
+    for parte in partes:
+        bloque.append(parte)
+        acumulado += len(parte)
+        if acumulado >= tamano:
+            yield "".join(bloque)
+            bloque = []
+            acumulado = 0
+    if bloque:
+        yield "".join(bloque)
+
+
+def transmitir_plantilla(nombre_plantilla, **contexto):
+    """
+    Igual que render_template(), pero la página se envía mientras se genera.
+    Pasa cursores o generadores en el contexto para que la memoria no crezca con
+    el número de resultados.
+
+    Todo lo que cambia la sesión se hace aquí, antes de empezar a enviar: la
+    cookie de sesión sale con los encabezados, y lo que la plantilla cambie
+    después ya no se guarda. Por eso los mensajes flash llegan a la plantilla
+    como `mensajes` y el token CSRF como `token_csrf` (vacío sin sesión), en
+    vez de llamar a get_flashed_messages() o csrf_token() desde ella.
+    """
+    contexto.setdefault("mensajes", get_flashed_messages(with_categories=True))
+    contexto.setdefault("token_csrf", generate_csrf() if "usuario_id" in session else "")
+    return Response(agrupar(stream_template(nombre_plantilla, **contexto)), mimetype="text/html")
+
+
+# Los caches compartidos (CDN, proxy) pueden servir la página hasta este tiempo
+# antes de revalidarla con el ETag
+SEGUNDOS_CACHE_COMPARTIDA = 60
+
+
+def es_pagina_compartible():
+    """
+    Una página es igual para todos solo si el visitante no tiene sesión iniciada
+    ni mensajes flash pendientes (la versión con sesión lleva token CSRF).
+    """
+    return "usuario_id" not in session and "_flashes" not in session
+
+
+def _cliente_tiene_version(etag, ultima_modificacion):
+    # Si viene If-None-Match manda sobre If-Modified-Since
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    return request.if_modified_since is not None and ultima_modificacion <= request.if_modified_since
+
+
+def cache_compartida(response, etag, ultima_modificacion):
+    """
+    Marca la respuesta como cacheable por caches compartidos y con su versión.
+    """
+    # ETag débil: la misma versión puede viajar comprimida o no
+    response.set_etag(etag, weak=True)
+    response.last_modified = ultima_modificacion
+    response.cache_control.public = True
+    response.cache_control.max_age = 0
+    response.cache_control.s_maxage = SEGUNDOS_CACHE_COMPARTIDA
+    response.vary.add("Cookie")
+    return response
+
+
+def respuesta_no_modificada(etag, ultima_modificacion):
+    """
+    Devuelve un 304 si el cliente ya tiene esta versión, o None si hay que
+    generar la página completa.
+    """
+    if not _cliente_tiene_version(etag, ultima_modificacion):
+        return None
+    return cache_compartida(Response(status=304), etag, ultima_modificacion)
+
+
+def _elegir_codificacion():
+    aceptadas = request.headers.get("Accept-Encoding", "").lower()
+    if brotli is not None and "br" in aceptadas:
+        return "br"
+    if "gzip" in aceptadas:
+        return "gzip"
+    return None
+
+
+def _comprimir_en_streaming(partes, codificacion):
+    if codificacion == "br":
+        compresor = brotli.Compressor(quality=5)
+        for parte in partes:
+            datos = compresor.process(parte.encode("utf-8") if isinstance(parte, str) else parte)
+            datos += compresor.flush()
+            if datos:
+                yield datos
+        yield compresor.finish()
+    else:
+        # wbits=31 produce formato gzip; Z_SYNC_FLUSH manda cada bloque sin esperar al final
+        compresor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        for parte in partes:
+            datos = compresor.compress(parte.encode("utf-8") if isinstance(parte, str) else parte)
+            datos += compresor.flush(zlib.Z_SYNC_FLUSH)
+            if datos:
+                yield datos
+        yield compresor.flush()
+
+
+def init_compresion(app):
+    """
+    Registra la compresión de respuestas en la app.
+    """
+    @app.after_request
+    def comprimir_respuesta(response):
+        if (response.status_code < 200 or response.status_code >= 300
+                or response.direct_passthrough
+                or "Content-Encoding" in response.headers
+                or response.mimetype not in TIPOS_COMPRIMIBLES):
+            return response
+
+        codificacion = _elegir_codificacion()
+        response.vary.add("Accept-Encoding")
+        if codificacion is None:
+            return response
+
+        if response.is_streamed:
+            response.response = _comprimir_en_streaming(response.response, codificacion)
+            response.headers.pop("Content-Length", None)
+        else:
+            datos = response.get_data()
+            if len(datos) < MINIMO_BYTES:
+                return response
+            if codificacion == "br":
+                response.set_data(brotli.compress(datos, quality=5))
+            else:
+                response.set_data(gzip.compress(datos, compresslevel=6))
+
+        response.headers["Content-Encoding"] = codificacion
+        return response
+
+    return comprimir_respuesta
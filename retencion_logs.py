@@ -0,0 +1,237 @@
+"""
+Retención de la bitácora (log_audotoria).
+
+- Los eventos recientes viven en MongoDB.
+- Los días completos con más de DIAS_ARCHIVO de antigüedad se archivan como
+  JSONL comprimido, un archivo por día, en GridFS (bucket archivo_bitacora):
+  así cualquier host puede leerlos, no solo el que los escribió. Cada día
+  archivado queda registrado en la colección archivo_logs.
+- Solo después de escribir y registrar el archivo se marca cada evento del día
+  con archivado_en. El índice TTL está sobre ese campo (ver indices.py) y borra
+  los eventos DIAS_TRAS_ARCHIVO días después: un evento sin archivar nunca se
+  borra, aunque el archivado se atrase o falle.
+- consultar() lee un rango de fechas de donde esté: días archivados desde
+  GridFS y el resto desde MongoDB.
+
+Uso:
+    python retencion_logs.py archivar
+    python retencion_logs.py consultar --desde 2025-01-01 --hasta 2025-01-31 [--accion CAMBIO_ROL]
+"""
+import argparse
+import gzip
+import io
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from bson import json_util
+from gridfs import GridFSBucket
+from pymongo.errors import DuplicateKeyError
+
+DIAS_CALIENTES = 90     # días que un evento sigue en MongoDB
+DIAS_ARCHIVO = 60       # edad a la que se archiva
+DIAS_TRAS_ARCHIVO = DIAS_CALIENTES - DIAS_ARCHIVO   # expireAfterSeconds del TTL sobre archivado_en
+BUCKET_ARCHIVO = "archivo_bitacora"
+INTERVALO_ARCHIVADO = 3600
+DURACION_CANDADO = timedelta(minutes=30)
+LOTE_MARCADO = 1000
+
+
+def _dia(fecha):
+    return datetime(fecha.year, fecha.month, fecha.day)
+
+
+def nombre_archivo(dia):
+    return f"log_audotoria-{dia:%Y-%m-%d}.jsonl.gz"
+
+
+def _bucket(db):
+    return GridFSBucket(db, bucket_name=BUCKET_ARCHIVO)
+
+
+def _marcar_archivados(db, ids, ahora):
+    for i in range(0, len(ids), LOTE_MARCADO):
+        db.log_audotoria.update_many({"_id": {"$in": ids[i:i + LOTE_MARCADO]}},
+                                     {"$set": {"archivado_en": ahora}})
+
+
+def archivar_dia(db, dia):
+    """
+    Escribe todos los eventos de un día en su archivo, lo sube a GridFS, lo
+    registra en archivo_logs y solo entonces marca los eventos con archivado_en
+    (desde ahí corre su TTL). Si algo falla antes, ningún evento queda marcado.
+    """
+    siguiente = dia + timedelta(days=1)
+    contenido = io.BytesIO()
+    ids = []
+    with gzip.GzipFile(fileobj=contenido, mode="wb") as comprimido:
+        cursor = db.log_audotoria.find({"fecha_evento": {"$gte": dia, "$lt": siguiente}}).sort("fecha_evento", 1)
+        for evento in cursor:
+            # json_util conserva ObjectId y fechas para poder leerlos de vuelta
+            comprimido.write((json_util.dumps(evento) + "\n").encode("utf-8"))
+            ids.append(evento["_id"])
+    contenido.seek(0)
+
+    clave = f"{dia:%Y-%m-%d}"
+    anterior = db.archivo_logs.find_one({"_id": clave}, {"id_archivo": 1})
+    bucket = _bucket(db)
+    id_archivo = bucket.upload_from_stream(nombre_archivo(dia), contenido, metadata={"dia": dia})
+    db.archivo_logs.replace_one(
+        {"_id": clave},
+        {"dia": dia, "eventos": len(ids), "id_archivo": id_archivo, "host": socket.gethostname(),
+         "fecha_archivo": datetime.utcnow()},
+        upsert=True
+    )
+    if anterior and anterior.get("id_archivo"):
+        bucket.delete(anterior["id_archivo"])
+    _marcar_archivados(db, ids, datetime.utcnow())
+    return len(ids)
+
+
+def dias_archivados(db, desde=None, hasta=None):
+    filtro = {"dia": {"$exists": True}}
+    if desde or hasta:
+        filtro["dia"] = {}
+        if desde:
+            filtro["dia"]["$gte"] = desde
+        if hasta:
+            filtro["dia"]["$lt"] = hasta
+    return {doc["dia"] for doc in db.archivo_logs.find(filtro, {"dia": 1})}
+
+
+def archivar_pendientes(db, ahora=None):
+    """
+    Archiva cada día completo con más de DIAS_ARCHIVO días que aún no esté archivado.
+    Devuelve la lista de (día, eventos) archivados.
+    """
+    ahora = ahora or datetime.utcnow()
+    limite = _dia(ahora) - timedelta(days=DIAS_ARCHIVO)
+    primero = db.log_audotoria.find_one({"fecha_evento": {"$lt": limite}}, {"fecha_evento": 1}, sort=[("fecha_evento", 1)])
+    if primero is None:
+        return []
+
+    hechos = dias_archivados(db, _dia(primero["fecha_evento"]), limite)
+    archivados = []
+    dia = _dia(primero["fecha_evento"])
+    while dia < limite:
+        if dia not in hechos:
+            archivados.append((dia, archivar_dia(db, dia)))
+        dia += timedelta(days=1)
+    return archivados
+
+
+def _tomar_candado(db):
+    """
+    Solo un worker archiva a la vez; el candado vence solo si el worker muere.
+    """
+    ahora = datetime.utcnow()
+    datos = {"hasta": ahora + DURACION_CANDADO, "host": socket.gethostname(), "pid": os.getpid()}
+    if db.archivo_logs.find_one_and_update({"_id": "_candado", "hasta": {"$lt": ahora}}, {"$set": datos}):
+        return True
+    try:
+        db.archivo_logs.insert_one({"_id": "_candado", **datos})
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+def _soltar_candado(db):
+    db.archivo_logs.delete_one({"_id": "_candado", "host": socket.gethostname(), "pid": os.getpid()})
+
+
+def iniciar_archivado(db, intervalo=INTERVALO_ARCHIVADO):
+    """
+    Arranca el hilo que archiva la bitácora cada `intervalo` segundos.
+    """
+    def ciclo():
+        while True:
+            try:
+                if _tomar_candado(db):
+                    try:
+                        archivar_pendientes(db)
+                    finally:
+                        _soltar_candado(db)
+            except Exception as e:
+                print(f"Error archivando la bitácora: {e}")
+            time.sleep(intervalo)
+
+    hilo = threading.Thread(target=ciclo, name="archivado-bitacora", daemon=True)
+    hilo.start()
+    return hilo
+
+
+def _coincide(evento, filtro):
+    return all(evento.get(campo) == valor for campo, valor in filtro.items())
+
+
+def _leer_archivo(db, registro, filtro):
+    with gzip.GzipFile(fileobj=_bucket(db).open_download_stream(registro["id_archivo"])) as archivo:
+        for linea in io.TextIOWrapper(archivo, encoding="utf-8"):
+            evento = json_util.loads(linea)
+            if _coincide(evento, filtro):
+                yield evento
+
+
+def consultar(db, desde, hasta, accion=None, id_usuario=None, limite=None):
+    """
+    Eventos entre `desde` y `hasta` (días completos, inclusivo) en orden cronológico.
+    Los días archivados se leen de GridFS y los demás de MongoDB.
+    """
+    filtro = {}
+    if accion:
+        filtro["accion"] = accion
+    if id_usuario:
+        filtro["id_usuario"] = id_usuario
+
+    inicio, fin = _dia(desde), _dia(hasta) + timedelta(days=1)
+    registros = {doc["dia"]: doc for doc in db.archivo_logs.find({"dia": {"$gte": inicio, "$lt": fin}})}
+    entregados = 0
+    dia = inicio
+    while dia < fin:
+        if dia in registros:
+            eventos = _leer_archivo(db, registros[dia], filtro)
+            dia += timedelta(days=1)
+        else:
+            # Juntamos los días seguidos sin archivar en una sola consulta
+            tramo = dia
+            while dia < fin and dia not in registros:
+                dia += timedelta(days=1)
+            eventos = db.log_audotoria.find(
+                {**filtro, "fecha_evento": {"$gte": tramo, "$lt": dia}}
+            ).sort("fecha_evento", 1)
+        for evento in eventos:
+            yield evento
+            entregados += 1
+            if limite and entregados >= limite:
+                return
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retención y archivo de la bitácora.")
+    parser.add_argument("comando", choices=["archivar", "consultar"])
+    parser.add_argument("--desde", help="Fecha inicial YYYY-MM-DD")
+    parser.add_argument("--hasta", help="Fecha final YYYY-MM-DD (inclusiva)")
+    parser.add_argument("--accion")
+    args = parser.parse_args()
+
+    from pymongo import MongoClient
+    from config import Config
+
+    db = MongoClient(Config.MONGODB_URI)["HomiDB"]
+    if args.comando == "archivar":
+        for dia, eventos in archivar_pendientes(db):
+            print(f"{dia:%Y-%m-%d}: {eventos} eventos")
+        return 0
+
+    if not args.desde:
+        parser.error("consultar necesita --desde")
+    desde = datetime.strptime(args.desde, "%Y-%m-%d")
+    hasta = datetime.strptime(args.hasta, "%Y-%m-%d") if args.hasta else datetime.utcnow()
+    for evento in consultar(db, desde, hasta, accion=args.accion):
+        print(json_util.dumps(evento, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,43 @@
+/* src/static/js/autocompletar.js */
+
+// Sugerencias del buscador: colonias, ciudades y títulos (índice en memoria del servidor)
+document.addEventListener('DOMContentLoaded', function () {
+    document.querySelectorAll('input[data-autocompletar]').forEach(function (input) {
+        var lista = document.getElementById(input.getAttribute('list'));
+        var form = input.form;
+        var temporizador = null;
+        var ultimas = [];
+
+        input.addEventListener('input', function () {
+            clearTimeout(temporizador);
+            var texto = input.value.trim();
+            if (texto.length < 2) return;
+
+            temporizador = setTimeout(function () {
+                fetch(input.dataset.autocompletar + '?q=' + encodeURIComponent(texto))
+                    .then(function (res) { return res.json(); })
+                    .then(function (sugerencias) {
+                        ultimas = sugerencias;
+                        lista.innerHTML = '';
+                        sugerencias.forEach(function (s) {
+                            var opcion = document.createElement('option');
+                            opcion.value = s.texto;
+                            opcion.label = s.tipo === 'titulo' ? 'Propiedad' : (s.tipo === 'colonia' ? 'Colonia' : 'Ciudad');
+                            lista.appendChild(opcion);
+                        });
+                    });
+            }, 120);
+        });
+
+        // Si eligen una colonia, la pasamos al selector de colonia en vez de buscarla como palabra
+        input.addEventListener('change', function () {
+            var elegida = ultimas.find(function (s) { return s.texto === input.value; });
+            if (!elegida || elegida.tipo !== 'colonia' || !form) return;
+            var selector = form.querySelector('select[name="localizacion"]');
+            if (selector && selector.querySelector('option[value="' + CSS.escape(elegida.texto) + '"]')) {
+                selector.value = elegida.texto;
+                input.value = '';
+            }
+        });
+    });
+});
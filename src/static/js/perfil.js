@@ -0,0 +1,81 @@
+/* src/static/js/perfil.js */
+
+// Favoritos y publicaciones del perfil: se piden por páginas a /api/perfil/* y se
+// dibujan como tarjetas compactas. Todo el texto va con textContent (nada de innerHTML).
+document.addEventListener('DOMContentLoaded', function () {
+    var IMAGEN_DEFECTO = '/static/images/product/l-product-1.jpg';
+    var ESTADOS = {
+        aprobada: { texto: 'Activa', clase: 'bg-success' },
+        pendiente: { texto: 'En revisión', clase: 'bg-warning' },
+        rechazada: { texto: 'Rechazada', clase: 'bg-danger' }
+    };
+
+    function elemento(etiqueta, clase, texto) {
+        var el = document.createElement(etiqueta);
+        if (clase) el.className = clase;
+        if (texto !== undefined) el.textContent = texto;
+        return el;
+    }
+
+    function tarjeta(p) {
+        var enlace = '/propiedad/' + encodeURIComponent(p._id);
+        var card = elemento('div', 'compact-card');
+
+        var enlaceImagen = elemento('a');
+        enlaceImagen.href = enlace;
+        var img = elemento('img');
+        img.src = p.imagen_principal_url || IMAGEN_DEFECTO;
+        img.alt = 'Propiedad';
+        img.loading = 'lazy';
+        enlaceImagen.appendChild(img);
+        card.appendChild(enlaceImagen);
+
+        var cuerpo = elemento('div', 'compact-card-body');
+        var estado = ESTADOS[p.estado_publicacion];
+        if (estado) {
+            var badge = elemento('span', 'badge ' + estado.clase + ' float-right', estado.texto);
+            badge.style.cssText = 'position: absolute; right: 15px; top: 15px;';
+            cuerpo.appendChild(badge);
+        }
+        var precio = parseFloat(p.precio) || 0;
+        cuerpo.appendChild(elemento('h5', 'theme-color', '$' + precio.toLocaleString('en-US', { maximumFractionDigits: 0 })));
+        var enlaceTitulo = elemento('a');
+        enlaceTitulo.href = enlace;
+        var titulo = elemento('h5', null, p.titulo || '');
+        titulo.style.color = '#333F57';
+        enlaceTitulo.appendChild(titulo);
+        cuerpo.appendChild(enlaceTitulo);
+        var colonia = elemento('p');
+        colonia.appendChild(elemento('i', 'lni lni-map-marker'));
+        colonia.appendChild(document.createTextNode(' ' + (p.colonia || '')));
+        cuerpo.appendChild(colonia);
+
+        card.appendChild(cuerpo);
+        return card;
+    }
+
+    document.querySelectorAll('[data-cursor]').forEach(function (lista) {
+        var boton = document.querySelector('[data-cargar-mas="' + lista.id + '"]');
+        var siguiente = null;
+        var cargando = false;
+
+        function cargar() {
+            if (cargando) return;
+            cargando = true;
+            var url = lista.dataset.url;
+            if (siguiente !== null) url += '?' + lista.dataset.cursor + '=' + encodeURIComponent(siguiente);
+            fetch(url, { headers: { 'Accept': 'application/json' } })
+                .then(function (res) { return res.json(); })
+                .then(function (datos) {
+                    (datos.propiedades || []).forEach(function (p) { lista.appendChild(tarjeta(p)); });
+                    siguiente = datos.siguiente;
+                    if (boton) boton.classList.toggle('d-none', siguiente === null || siguiente === undefined);
+                })
+                .catch(function (e) { console.error('Error cargando ' + lista.id, e); })
+                .then(function () { cargando = false; });
+        }
+
+        if (boton) boton.addEventListener('click', cargar);
+        cargar();
+    });
+});
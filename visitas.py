@@ -0,0 +1,123 @@
+"""
+Visitas por propiedad y por día.
+
+Cada vista de la página de detalle suma 1 en un contador en memoria del
+worker; un hilo lo vacía cada INTERVALO_VACIADO segundos con un solo
+bulk_write de upserts a la colección visitas_diarias (un documento por
+propiedad y día) y otro que suma lo mismo al total de por vida "visitas" de
+cada propiedad. Mil vistas de la misma propiedad en ese intervalo son una
+sola escritura, no mil.
+
+Las gráficas del panel del proveedor salen de una sola agregación sobre el
+índice (id_propietario, dia): nunca se recorren eventos sueltos. Los días
+con más de DIAS_HISTORIAL se borran solos por TTL (ver indices.py).
+"""
+import atexit
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+
+INTERVALO_VACIADO = 10
+DIAS_HISTORIAL = 400
+PERIODOS = (7, 30, 90)
+LIMITE_TOP = 5
+
+
+def _dia(fecha):
+    return datetime(fecha.year, fecha.month, fecha.day)
+
+
+class ContadorVisitas:
+    def __init__(self):
+        self._conteos = Counter()
+        self._lock = threading.Lock()
+
+    def registrar(self, id_propiedad, id_propietario, ahora=None):
+        dia = _dia(ahora or datetime.utcnow())
+        with self._lock:
+            self._conteos[(id_propiedad, id_propietario, dia)] += 1
+
+    def vaciar(self, db):
+        """
+        Escribe lo acumulado. Si falla, los conteos vuelven al contador para
+        el siguiente intento. Devuelve cuántos documentos diarios tocó.
+        """
+        with self._lock:
+            conteos, self._conteos = self._conteos, Counter()
+        if not conteos:
+            return 0
+        try:
+            db.visitas_diarias.bulk_write([
+                UpdateOne({"id_propiedad": id_propiedad, "dia": dia},
+                          {"$inc": {"visitas": n}, "$setOnInsert": {"id_propietario": id_propietario}},
+                          upsert=True)
+                for (id_propiedad, id_propietario, dia), n in conteos.items()
+            ], ordered=False)
+        except Exception:
+            with self._lock:
+                self._conteos.update(conteos)
+            raise
+        # El total de por vida es secundario: si falla no se reintenta para no duplicar los días
+        por_propiedad = Counter()
+        for (id_propiedad, _, _), n in conteos.items():
+            por_propiedad[id_propiedad] += n
+        db.propiedades.bulk_write([
+            UpdateOne({"_id": id_propiedad}, {"$inc": {"visitas": n}})
+            for id_propiedad, n in por_propiedad.items()
+        ], ordered=False)
+        return len(conteos)
+
+
+contador_visitas = ContadorVisitas()
+
+
+def iniciar_vaciado(db, intervalo=INTERVALO_VACIADO):
+    """
+    Arranca el hilo que vacía el contador; al salir el proceso se vacía una última vez.
+    """
+    def ciclo():
+        while True:
+            time.sleep(intervalo)
+            try:
+                contador_visitas.vaciar(db)
+            except Exception as e:
+                print(f"Error guardando visitas: {e}")
+
+    def al_salir():
+        try:
+            contador_visitas.vaciar(db)
+        except Exception as e:
+            print(f"Error guardando visitas al salir: {e}")
+
+    atexit.register(al_salir)
+    hilo = threading.Thread(target=ciclo, name="visitas", daemon=True)
+    hilo.start()
+    return hilo
+
+
+def resumen_proveedor(db, id_propietario, dias=30, hoy=None, limite=LIMITE_TOP):
+    """
+    Visitas por día de los últimos `dias` (con ceros en los días sin visitas)
+    y las propiedades más vistas del periodo, en una sola agregación.
+    Devuelve (serie [(dia, visitas)], top [(id_propiedad, visitas)]).
+    """
+    hoy = _dia(hoy or datetime.utcnow())
+    desde = hoy - timedelta(days=dias - 1)
+    resultado = list(db.visitas_diarias.aggregate([
+        {"$match": {"id_propietario": id_propietario, "dia": {"$gte": desde}}},
+        {"$facet": {
+            "por_dia": [{"$group": {"_id": "$dia", "visitas": {"$sum": "$visitas"}}}],
+            "top": [
+                {"$group": {"_id": "$id_propiedad", "visitas": {"$sum": "$visitas"}}},
+                {"$sort": {"visitas": -1}},
+                {"$limit": limite}
+            ]
+        }}
+    ]))
+    facetas = resultado[0] if resultado else {"por_dia": [], "top": []}
+    por_dia = {d["_id"]: d["visitas"] for d in facetas["por_dia"]}
+    serie = [(desde + timedelta(days=i), por_dia.get(desde + timedelta(days=i), 0)) for i in range(dias)]
+    top = [(d["_id"], d["visitas"]) for d in facetas["top"]]
+    return serie, top
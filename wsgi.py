@@ -0,0 +1,19 @@
+"""
+Punto de entrada de producción:
+    gunicorn -c gunicorn.conf.py
+
+gunicorn.conf.py apunta a crear_app() (wsgi_app = "wsgi:crear_app()"). Con
+preload_app el maestro la llama una sola vez y los workers heredan la app ya
+importada; la conexión a MongoDB, los hilos y las cachés se arman después del
+fork, en cada worker (ver arranque.py).
+"""
+import arranque
+
+
+def crear_app():
+    """
+    Importa la app midiendo cuánto tarda (queda en /salud/listo como importar_app).
+    """
+    with arranque.medir("importar_app"):
+        from app import app
+    return app